@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# TODO TEST
+
+import argparse
+import getpass
+from arango import ArangoClient
+from urllib.parse import urlparse
+
+from relation_engine.batchload.changeset import apply_changeset
+from relation_engine.batchload.changeset import open_changeset
+from relation_engine.batchload.changeset import read_changeset
+from relation_engine.batchload.load_observers import JSONLinesObserver
+from relation_engine.batchload.load_observers import PrometheusTextfileObserver
+from relation_engine.batchload.load_observers import ThroughputSummaryObserver
+from relation_engine.batchload.load_throttle import LoadThrottle
+from relation_engine.batchload.retry import DEFAULT_MAX_RETRIES
+from relation_engine.batchload.retry import RetryPolicy
+from relation_engine.batchload.retry import print_retry
+from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDB
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=
+"""
+Apply a changeset, calculated by one of the changeset scripts, to an ArangoDB time travelling
+database as a new load. The database must contain the older of the two graphs from which the
+changeset was calculated. The load can be rolled back as any other delta load.
+""".strip())
+    parser.add_argument(
+        '--changeset',
+        required=True,
+        help='the path of the changeset file. If the path ends with .gz the file is expected ' +
+            'to be compressed.')
+    parser.add_argument(
+        '--arango-url',
+        required=True,
+        help='The url of the ArangoDB server (e.g. http://localhost:8528')
+    parser.add_argument(
+        '--database',
+        required=True,
+        help='the name of the ArangoDB database that will be altered')
+    parser.add_argument(
+        '--user',
+        help='the ArangoDB user name; if --pwd-file is not included a password prompt will be ' +
+            'presented. Omit to connect with default credentials.')
+    parser.add_argument(
+        '--pwd-file',
+        help='the path to a file containing the ArangoDB password and nothing else; ' +
+            'if --user is included and --pwd-file is omitted a password prompt will be presented.')
+    parser.add_argument(
+        '--load-namespace',
+        required=True,
+        help='the name of the data that is being loaded, e.g. ncbi_taxa, gene_ontology, etc. ' +
+            'Must be unique across all load sources and consistent across loads.')
+    parser.add_argument(
+        '--load-registry-collection',
+        required=True,
+        help='the name of the ArangoDB collection where the load will be registered. ' +
+            'This is typically the same collection for all delta loaded data.')
+    parser.add_argument(
+        '--node-collection',
+        required=True,
+        help='the name of the ArangoDB collection into which nodes will be loaded')
+    parser.add_argument(
+        '--edge-collection',
+        required=True,
+        help='the name of the ArangoDB collection into which edges will be loaded')
+    parser.add_argument(
+        '--merge-edge-collection',
+        help='the name of the ArangoDB collection into which merge edges will be loaded. ' +
+            'Required if the changeset contains merges.')
+    parser.add_argument(
+        '--load-version',
+        required=True,
+        help='the version of this load. This version will be added to a field in the nodes and ' +
+             'edges and will be used as part of the _key field.')
+    parser.add_argument(
+        '--load-timestamp',
+        type=int,
+        required=True,
+        help='the timestamp to be applied to the load, in unix epoch milliseconds. Any nodes ' +
+             'or edges created in this load will start to exist with this time stamp. ' +
+             'NOTE: the user is responsible for ensuring this timestamp is greater than any ' +
+             'other timestamps previously used to load data into the collections.')
+    parser.add_argument(
+        '--release-timestamp',
+        type=int,
+        required=True,
+        help='the timestamp, in unix epoch milliseconds, when the data was released ' +
+            'at the source.')
+    parser.add_argument(
+        '--pipeline-depth',
+        type=int,
+        default=0,
+        help='the number of batches to look up in the database while the prior batch is ' +
+            'written. 0, the default, disables pipelining.')
+    parser.add_argument(
+        '--fingerprint',
+        action='store_true',
+        help='store a hash of the contents of each node and edge created in the load, which ' +
+            'is used to detect changes in subsequent delta loads.')
+    parser.add_argument(
+        '--no-track-last-version',
+        dest='track_last_version',
+        action='store_false',
+        help='do not update the last version of the nodes and edges that are unchanged in the ' +
+            'load, which saves a write per unchanged node and edge. Whether a node or edge ' +
+            'appeared in a load is then determined by whether it existed at the load timestamp.')
+    parser.add_argument(
+        '--max-documents-per-second',
+        type=float,
+        help='the maximum number of nodes and edges to write to the database per second.')
+    parser.add_argument(
+        '--max-mb-per-second',
+        type=float,
+        help='the maximum amount of data, in MiB, to send to the database per second.')
+    parser.add_argument(
+        '--max-lookup-latency',
+        type=float,
+        help='the time, in seconds, above which a lookup of the nodes or edges in a batch ' +
+            'indicates that the database is busy, in which case writes are paused with ' +
+            'increasing backoff until lookups are fast again.')
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help='the maximum number of times to retry a database request that fails transiently, ' +
+            'e.g. because the connection was dropped, with increasing backoff. Only requests ' +
+            f'that can safely be repeated are retried. Default {DEFAULT_MAX_RETRIES}.')
+    parser.add_argument(
+        '--events-file',
+        help='the path to a file to which load progress events will be appended as JSON lines.')
+    parser.add_argument(
+        '--summary',
+        action='store_true',
+        help='print a summary of the throughput of each phase of the load.')
+    parser.add_argument(
+        '--prometheus-file',
+        help='the path to a file to which load metrics will be written in the Prometheus text ' +
+            'format, e.g. in the node exporter textfile collector directory. The file name ' +
+            'must end with .prom for the collector to read it.')
+
+    return parser.parse_args()
+
+def main():
+    a = parse_args()
+
+    url = urlparse(a.arango_url)
+    client = ArangoClient(protocol=url.scheme, host=url.hostname, port=url.port)
+    if a.user:
+        if a.pwd_file:
+            with open(a.pwd_file) as pwd_file:
+                pwd = pwd_file.read().strip()
+        else:
+            pwd = getpass.getpass()
+        db = client.db(a.database, a.user, pwd, verify=True)
+    else:
+        db = client.db(a.database, verify=True)
+    retry = RetryPolicy(max_retries=a.max_retries, on_retry=print_retry)
+    attdb = ArangoBatchTimeTravellingDB(
+        db,
+        a.load_registry_collection,
+        a.node_collection,
+        default_edge_collection=a.edge_collection,
+        merge_collection=a.merge_edge_collection,
+        retry=retry)
+
+    throttle = None
+    if a.max_documents_per_second or a.max_mb_per_second or a.max_lookup_latency:
+        throttle = LoadThrottle(
+            documents_per_second=a.max_documents_per_second,
+            bytes_per_second=a.max_mb_per_second * 1024 * 1024 if a.max_mb_per_second else None,
+            max_lookup_latency=a.max_lookup_latency)
+
+    observers = [ThroughputSummaryObserver()] if a.summary else []
+    if a.prometheus_file:
+        observers.append(PrometheusTextfileObserver(a.prometheus_file))
+    events = open(a.events_file, 'a') if a.events_file else None
+    if events:
+        observers.append(JSONLinesObserver(events))
+
+    try:
+        with open_changeset(a.changeset) as cs:
+            apply_changeset(a.load_namespace, read_changeset(cs), attdb,
+                a.load_timestamp, a.release_timestamp, a.load_version,
+                pipeline_depth=a.pipeline_depth, fingerprint=a.fingerprint,
+                track_last_version=a.track_last_version,
+                throttle=throttle, observers=observers)
+    finally:
+        if events:
+            events.close()
+
+if __name__  == '__main__':
+    main()
@@ -0,0 +1,573 @@
+"""
+Computes the delta between two snapshots of a graph without a database, writes the delta to
+a changeset file, and applies changesets to a graph database.
+
+The old snapshot must be the snapshot that was most recently loaded into the database with
+delta_load.load_graph_delta or apply_changeset. Applying the changeset to the database then has
+the same result as loading the new snapshot with load_graph_delta, but the comparisons are made
+locally rather than by looking up every vertex and edge in the database.
+
+The snapshots are split into hash partitions on disk, so only one partition of the old snapshot
+needs to be held in memory at a time, along with the IDs of the vertices that changed between
+the snapshots. The merges are also written to disk, so only the IDs of their vertices are held
+in memory.
+
+A changeset file is a JSON lines file. The first line is a header. The operations follow in
+sections, in the order in which they must be applied. Each section starts with a line containing
+a dict with the name of the section in the 'section' field. The sections are, in order:
+
+vertices - the create, seen, and expire operations for the vertices in the new snapshot.
+  A changed vertex is expired and then created.
+merges - the merges of vertices that exist in the graph.
+vertex_expiry - the expire operations for the vertices that are not in the new snapshot and
+  were not merged.
+edges - the create, seen, and expire operations for the edges.
+
+The section names are the names of the corresponding load phases in
+batchload.load_observers. Each operation is a dict with the fields:
+
+op - one of the OP_* constants.
+kind - KIND_VERTEX or KIND_EDGE, or absent for merges.
+collection - for edges, the value of the edge's _collection field, which may be None.
+id - for seen and expire operations, the ID of the document.
+doc - for create and merge operations, the document to create.
+"""
+
+from collections import defaultdict as _defaultdict
+import gzip as _gzip
+import itertools as _itertools
+import json as _json
+import os as _os
+import shutil as _shutil
+import tempfile as _tempfile
+import time as _time
+import zlib as _zlib
+
+from relation_engine.batchload import delta_load as _delta_load
+from relation_engine.batchload import load_observers as _obs
+
+CHANGESET_FORMAT = 'delta_load_changeset'
+CHANGESET_FORMAT_VERSION = 1
+
+# Create a new document. For changed documents, the operation is preceded by the expiration
+# of the extant document.
+OP_CREATE = 'create'
+# Expire the extant document.
+OP_EXPIRE = 'expire'
+# Mark the extant document as seen in this load by updating its last version.
+OP_SEEN = 'seen'
+# Create a merge edge from a merged vertex to the vertex it was merged into and expire the
+# merged vertex.
+OP_MERGE = 'merge'
+
+KIND_VERTEX = 'vertex'
+KIND_EDGE = 'edge'
+
+# The changeset sections, in order.
+_SECTIONS = [
+    _obs.PHASE_VERTICES, _obs.PHASE_MERGES, _obs.PHASE_VERTEX_EXPIRY, _obs.PHASE_EDGES]
+
+_ID = 'id'
+_KEY = '_key'
+_COLLECTION = '_collection'
+# expiring an edge or updating its last version only requires its key
+_EDGE_FIELDS = [_KEY, _ID]
+
+_FLD_FORMAT = 'format'
+_FLD_VERSION = 'version'
+_FLD_SECTION = 'section'
+_FLD_OP = 'op'
+_FLD_KIND = 'kind'
+_FLD_COLLECTION = 'collection'
+_FLD_ID = 'id'
+_FLD_DOC = 'doc'
+
+def compute_changeset(
+        old_vertex_source,
+        new_vertex_source,
+        old_edge_source,
+        new_edge_source,
+        output,
+        merge_source=None,
+        partitions=64,
+        temp_dir=None):
+    """
+    Computes the changes between two snapshots of a graph and writes them to a changeset.
+
+    old_vertex_source - an iterator that produces the vertices of the old snapshot as dicts, as
+      for delta_load.load_graph_delta.
+    new_vertex_source - an iterator that produces the vertices of the new snapshot.
+    old_edge_source - an iterator that produces the edges of the old snapshot as dicts, as for
+      delta_load.load_graph_delta. The _collection field of the edges is respected.
+    new_edge_source - an iterator that produces the edges of the new snapshot.
+    output - the text file-like object to which the changeset will be written.
+    merge_source - an iterator that produces the merge edges of the new snapshot, if any.
+      As in load_graph_delta, a merge is only applied if both vertices exist once the vertices
+      in the new snapshot have been processed, a vertex is merged at most once, and a merged
+      vertex is never the target of a subsequent merge.
+    partitions - the number of hash partitions into which to split the snapshots. More
+      partitions use less memory when comparing the snapshots, but open more files at once.
+    temp_dir - the directory in which to store the partitions. Defaults to the system temporary
+      directory.
+
+    Returns the number of operations in the changeset as a dict of kind -> op -> count, where
+    the merge count is stored under the merge op.
+    """
+    if partitions < 1:
+        raise ValueError('partitions must be >= 1')
+    writer = _ChangesetWriter(output)
+    tmpdir = _tempfile.mkdtemp(prefix='changeset_', dir=temp_dir)
+    try:
+        merges = _os.path.join(tmpdir, 'merges')
+        merge_ids = _spill_merges(merge_source or [], merges)
+        present = set()
+        def find_merge_ids(id_):
+            if id_ in merge_ids:
+                present.add(id_)
+
+        old = _spill_vertices(old_vertex_source, tmpdir, 'old_v', partitions, find_merge_ids,
+            full=False)
+        new = _spill_vertices(new_vertex_source, tmpdir, 'new_v', partitions, find_merge_ids,
+            full=True)
+        applied = _os.path.join(tmpdir, 'applied_merges')
+        merged = _get_merges(merges, present, applied)
+        expired = _os.path.join(tmpdir, 'expired_v')
+        writer.start_section(_obs.PHASE_VERTICES)
+        with open(expired, 'w') as expfile:
+            changed = _diff_vertices(old, new, merged, writer, expfile)
+        writer.start_section(_obs.PHASE_MERGES)
+        with open(applied) as mfile:
+            for line in mfile:
+                writer.write_merge(_json.loads(line))
+        writer.start_section(_obs.PHASE_VERTEX_EXPIRY)
+        with open(expired) as expfile:
+            for line in expfile:
+                writer.write_op(OP_EXPIRE, KIND_VERTEX, id_=_json.loads(line))
+
+        old = _spill_edges(old_edge_source, tmpdir, 'old_e', partitions, full=False)
+        new = _spill_edges(new_edge_source, tmpdir, 'new_e', partitions, full=True)
+        writer.start_section(_obs.PHASE_EDGES)
+        _diff_edges(old, new, changed, writer)
+    finally:
+        _shutil.rmtree(tmpdir, ignore_errors=True)
+    return writer.counts
+
+def _spill_merges(source, path):
+    """
+    Writes the merges to a file.
+
+    Returns the IDs of the vertices in the merges.
+    """
+    ids = set()
+    with open(path, 'w') as f:
+        for m in source:
+            ids.update([m['from'], m['to']])
+            f.write(_json.dumps(m, separators=(',', ':')) + '\n')
+    return ids
+
+def _get_merges(path, present, applied_path):
+    """
+    Writes the merges to be applied to a file, given the file of merges written by
+    _spill_merges and the IDs of the merge vertices that exist.
+
+    Returns the IDs of the merged vertices.
+    """
+    merged = set()
+    with open(path) as merges, open(applied_path, 'w') as applied:
+        for line in merges:
+            m = _json.loads(line)
+            if (m['from'] in present and m['to'] in present and m['from'] not in merged and
+                    m['to'] not in merged):
+                applied.write(line)
+                merged.add(m['from'])
+    return merged
+
+def _partition(key, partitions):
+    return _zlib.crc32(key.encode('utf-8')) % partitions
+
+class _Spill:
+    """
+    A set of hash partition files on disk, each containing JSON encoded rows.
+    """
+
+    def __init__(self, tmpdir, name, partitions):
+        self._paths = [_os.path.join(tmpdir, f'{name}_{i}') for i in range(partitions)]
+        self._files = [open(p, 'w') for p in self._paths]
+
+    def write(self, partition_key, row):
+        p = _partition(partition_key, len(self._files))
+        self._files[p].write(_json.dumps(row, separators=(',', ':')) + '\n')
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def read(self, partition):
+        """
+        Reads the rows in a partition and deletes the partition file.
+        """
+        with open(self._paths[partition]) as f:
+            for line in f:
+                yield _json.loads(line)
+        _os.remove(self._paths[partition])
+
+def _spill_vertices(source, tmpdir, name, partitions, on_id, full):
+    spill = _Spill(tmpdir, name, partitions)
+    try:
+        for v in source:
+            on_id(v[_ID])
+            row = [v[_ID], _delta_load._fingerprint(v)]
+            if full:
+                row.append(v)
+            spill.write(v[_ID], row)
+    finally:
+        spill.close()
+    return spill
+
+def _spill_edges(source, tmpdir, name, partitions, full):
+    spill = _Spill(tmpdir, name, partitions)
+    try:
+        for e in source:
+            col = e.pop(_COLLECTION, None)
+            row = [col, e[_ID], _delta_load._fingerprint(e)]
+            if full:
+                row.append(e)
+            spill.write(f'{col}\0{e[_ID]}', row)
+    finally:
+        spill.close()
+    return spill
+
+def _diff_vertices(old, new, merged, writer, expfile):
+    """
+    Writes the vertex operations for each partition and the IDs of the vertices to be expired
+    after the merges to expfile.
+
+    Returns the IDs of the vertices that changed between the snapshots.
+    """
+    changed = set()
+    for p in range(len(old)):
+        oldfps = {id_: fp for id_, fp in old.read(p)}
+        for id_, fp, v in new.read(p):
+            oldfp = oldfps.pop(id_, None)
+            if oldfp is None:
+                writer.write_op(OP_CREATE, KIND_VERTEX, doc=v)
+            elif oldfp != fp:
+                writer.write_op(OP_EXPIRE, KIND_VERTEX, id_=id_)
+                writer.write_op(OP_CREATE, KIND_VERTEX, doc=v)
+                changed.add(id_)
+            else:
+                writer.write_op(OP_SEEN, KIND_VERTEX, id_=id_)
+        for id_ in oldfps:
+            if id_ not in merged:
+                expfile.write(_json.dumps(id_) + '\n')
+    return changed
+
+def _diff_edges(old, new, changed_vertices, writer):
+    """
+    Writes the edge operations for each partition. Edges attached to a changed vertex are
+    recreated, as the new version of the vertex is a new document.
+    """
+    for p in range(len(old)):
+        oldfps = {(col, id_): fp for col, id_, fp in old.read(p)}
+        for col, id_, fp, e in new.read(p):
+            oldfp = oldfps.pop((col, id_), None)
+            if oldfp is None:
+                writer.write_op(OP_CREATE, KIND_EDGE, col, doc=e)
+            elif (oldfp != fp or e['from'] in changed_vertices or
+                    e['to'] in changed_vertices):
+                writer.write_op(OP_EXPIRE, KIND_EDGE, col, id_=id_)
+                writer.write_op(OP_CREATE, KIND_EDGE, col, doc=e)
+            else:
+                writer.write_op(OP_SEEN, KIND_EDGE, col, id_=id_)
+        for col, id_ in oldfps:
+            writer.write_op(OP_EXPIRE, KIND_EDGE, col, id_=id_)
+
+class _ChangesetWriter:
+
+    def __init__(self, output):
+        self._output = output
+        self.counts = {KIND_VERTEX: {OP_CREATE: 0, OP_EXPIRE: 0, OP_SEEN: 0},
+                       KIND_EDGE: {OP_CREATE: 0, OP_EXPIRE: 0, OP_SEEN: 0},
+                       OP_MERGE: 0}
+        self._write({_FLD_FORMAT: CHANGESET_FORMAT, _FLD_VERSION: CHANGESET_FORMAT_VERSION})
+
+    def _write(self, d):
+        self._output.write(_json.dumps(d, separators=(',', ':')) + '\n')
+
+    def start_section(self, section):
+        self._write({_FLD_SECTION: section})
+
+    def write_op(self, op, kind, collection=None, id_=None, doc=None):
+        d = {_FLD_OP: op, _FLD_KIND: kind}
+        if kind == KIND_EDGE:
+            d[_FLD_COLLECTION] = collection
+        if doc is None:
+            d[_FLD_ID] = id_
+        else:
+            d[_FLD_DOC] = doc
+        self._write(d)
+        self.counts[kind][op] += 1
+
+    def write_merge(self, merge):
+        self._write({_FLD_OP: OP_MERGE, _FLD_DOC: merge})
+        self.counts[OP_MERGE] += 1
+
+def open_changeset(path, mode='r'):
+    """
+    Opens a changeset file for reading or writing in text mode. If the path ends with .gz, the
+    file is gzip compressed.
+
+    path - the path to the file.
+    mode - 'r' to read the file or 'w' to write it.
+    """
+    if path.endswith('.gz'):
+        return _gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def read_changeset(input_):
+    """
+    Reads a changeset written by compute_changeset.
+
+    input_ - the text file-like object from which to read the changeset.
+
+    Returns a generator over the operations in the changeset as tuples of the name of the
+    section containing the operation and the operation as a dict, as described in the module
+    documentation.
+    """
+    _check_header(input_.readline())
+    return _read_operations(input_)
+
+def _read_operations(input_):
+    section = None
+    for line in input_:
+        op = _json.loads(line)
+        if _FLD_SECTION in op:
+            if op[_FLD_SECTION] not in _SECTIONS:
+                raise ValueError(f'Unknown changeset section: {op[_FLD_SECTION]}')
+            section = op[_FLD_SECTION]
+        elif not section:
+            raise ValueError('Changeset operation is not in a section')
+        else:
+            yield section, op
+
+def _check_header(header):
+    try:
+        header = _json.loads(header)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get(_FLD_FORMAT) != CHANGESET_FORMAT:
+        raise ValueError('Input is not a changeset')
+    if header[_FLD_VERSION] != CHANGESET_FORMAT_VERSION:
+        raise ValueError(f'Unsupported changeset version: {header[_FLD_VERSION]}')
+
+def apply_changeset(
+        load_namespace,
+        changeset,
+        database,
+        timestamp,
+        release_timestamp,
+        load_version,
+        batch_size=10000,
+        pipeline_depth=0,
+        fingerprint=False,
+        cache_vertices=True,
+        track_last_version=True,
+        throttle=None,
+        observers=None):
+    """
+    Applies a changeset to a graph database as a new load. The result is the same as loading the
+    new snapshot from which the changeset was computed with delta_load.load_graph_delta, and the
+    load can be rolled back with delta_load.roll_back_last_load.
+
+    Extant documents are only fetched from the database to get the keys needed to update them
+    and the vertices that new edges are attached to, and only the _key, _id, id, _from, and _to
+    fields are fetched. If the last version is not tracked, the documents the changeset marks as
+    seen are not fetched. No documents are compared. The database is assumed to contain the old
+    snapshot from which the changeset was computed; if a document that the changeset updates
+    does not exist, the load fails.
+
+    load_namespace - the name of the data that is being loaded, e.g. ncbi_taxa, gene_ontology,
+      etc. Must be unique across all load sources.
+    changeset - an iterable of the operations in the changeset, as returned by read_changeset.
+    database - a wrapper for the database storing the graph. It must have the same interface as
+      batchload.time_travelling_database.ArangoBatchTimeTravellingDB. If the changeset contains
+      merges, the database must have a merge collection.
+    timestamp - the timestamp, in Unix epoch milliseconds, when the load should be considered as
+      active.
+    release_timestamp - the timestamp, in Unix epoch milliseconds, when the load was released
+      at the data source.
+    load_version - a unique ID for this load - often the date of the data release.
+    batch_size - the number of operations to apply per batch.
+    pipeline_depth - the number of batches to look up in the database ahead of the batch that is
+      currently being written, as for load_graph_delta. The merges are never pipelined.
+    fingerprint - True to store a hash of the contents of each vertex and edge created in the
+      load in the document's fingerprint field, as for load_graph_delta.
+    cache_vertices - True to record the database ID of each vertex in the load so that the
+      vertices don't need to be fetched from the database again when applying merges and edges.
+      If the last version is not tracked, only the created vertices are recorded.
+    track_last_version - False to leave the vertices and edges that the changeset marks as seen
+      as they are rather than updating their last version field, as for load_graph_delta.
+    throttle - a batchload.load_throttle.LoadThrottle to limit the rate at which the changeset is
+      written, as for load_graph_delta.
+    observers - a list of observers of the load's progress, as for load_graph_delta.
+    """
+    db = database
+    if pipeline_depth < 0:
+        raise ValueError('pipeline_depth must be >= 0')
+    load = _delta_load._DeltaLoad(db, timestamp, release_timestamp, load_version, batch_size,
+        pipeline_depth, 1, fingerprint,
+        _delta_load._VertexCache(db.get_vertex_collection(), cache_vertices), observers,
+        track_last_version=track_last_version, throttle=throttle)
+    db.register_load_start(load_namespace, load_version, timestamp, release_timestamp,
+        _delta_load._get_current_timestamp(), track_last_version=track_last_version)
+    load.notify(_obs.LoadStart(load_namespace, load_version))
+    start = _time.perf_counter()
+
+    for section, ops in _itertools.groupby(changeset, key=lambda o: o[0]):
+        _delta_load._run_phase(
+            load, section, _SECTION_PROCESSORS[section], section, (op for _, op in ops))
+
+    db.register_load_complete(
+        load_namespace, load_version, _delta_load._get_current_timestamp())
+    load.notify(_obs.LoadEnd(load_namespace, load_version, _time.perf_counter() - start))
+
+def _get_extant(docs, id_, collection, timestamp):
+    doc = docs.get(id_)
+    if not doc:
+        raise ValueError(f'Changeset document {id_} does not exist in collection ' +
+            f'{collection} at timestamp {timestamp}')
+    return doc
+
+def _check_op(op, allowed):
+    if op not in allowed:
+        raise ValueError(f'Unexpected changeset operation: {op}')
+    return op
+
+def _apply_vertices(load, phase, ops):
+    """
+    Apply the vertex operations from the vertices or vertex expiry section.
+    """
+    db = load.db
+    allowed = [OP_EXPIRE] if phase == _obs.PHASE_VERTEX_EXPIRY else [
+        OP_CREATE, OP_EXPIRE, OP_SEEN]
+    # seen vertices are only counted if the load doesn't track the last version
+    skipped = [OP_CREATE] if load.track_last_version else [OP_CREATE, OP_SEEN]
+    def lookup(ops):
+        ids = [o[_FLD_ID] for o in ops if _check_op(o[_FLD_OP], allowed) not in skipped]
+        return db.get_vertices(ids, load.timestamp, fields=_delta_load._VERTEX_FIELDS)
+
+    def apply(ops, dbverts):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        bulk = load.get_batch_updater()
+        for o in ops:
+            if o[_FLD_OP] == OP_CREATE:
+                v = o[_FLD_DOC]
+                key = bulk.create_vertex(v[_ID], ver, ts, rts, v, load.get_fingerprint(v))
+                load.vertex_cache.add(v[_ID], key)
+                continue
+            if o[_FLD_OP] == OP_SEEN and not load.track_last_version:
+                bulk.set_last_version_on_vertex(None, ver)
+                continue
+            key = _get_extant(dbverts, o[_FLD_ID], db.get_vertex_collection(), ts)[_KEY]
+            if o[_FLD_OP] == OP_EXPIRE:
+                bulk.expire_vertex(key, ts - 1, rts - 1)
+                load.vertex_cache.expire(o[_FLD_ID])
+            else:
+                bulk.set_last_version_on_vertex(key, ver)
+                load.vertex_cache.add(o[_FLD_ID], key)
+        return [bulk]
+
+    _delta_load._run_batches(load, ops, lookup, apply, phase, load.pipeline_depth)
+
+def _apply_merges(load, phase, ops):
+    """
+    Apply the merge operations. compute_changeset merges each vertex at most once and never
+    merges into a merged vertex, so both vertices of each merge are extant.
+    """
+    db = load.db
+    if not db.get_merge_collection():
+        raise ValueError('The changeset contains merges but the database has no merge collection')
+    def lookup(ops):
+        ids = set()
+        for o in ops:
+            _check_op(o[_FLD_OP], [OP_MERGE])
+            ids.update([o[_FLD_DOC]['from'], o[_FLD_DOC]['to']])
+        return _delta_load._get_vertices(load, list(ids))
+
+    def apply(ops, dbverts):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        vcol = db.get_vertex_collection()
+        bulk = load.get_batch_updater(db.get_merge_collection())
+        vertbulk = load.get_batch_updater()
+        for o in ops:
+            m = o[_FLD_DOC]
+            dbmerged = _get_extant(dbverts, m['from'], vcol, ts)
+            dbtarget = _get_extant(dbverts, m['to'], vcol, ts)
+            vertbulk.expire_vertex(dbmerged[_KEY], ts - 1, rts - 1)
+            load.vertex_cache.expire(m['from'])
+            bulk.create_edge(m[_ID], dbmerged, dbtarget, ver, ts, rts, m, load.get_fingerprint(m))
+        return [bulk, vertbulk]
+
+    # merged vertices are expired as each batch is written, which affects the lookups for the
+    # next batch, so merges can't be pipelined
+    _delta_load._run_batches(load, ops, lookup, apply, phase, 0)
+
+def _apply_edges(load, phase, ops):
+    """
+    Apply the edge operations.
+    """
+    db = load.db
+    def get_collection(op):
+        return op[_FLD_COLLECTION] or db.get_default_edge_collection()
+
+    def lookup(ops):
+        ids = _defaultdict(list)
+        vertids = set()
+        for o in ops:
+            op = _check_op(o[_FLD_OP], [OP_CREATE, OP_EXPIRE, OP_SEEN])
+            if op == OP_CREATE:
+                vertids.update([o[_FLD_DOC]['from'], o[_FLD_DOC]['to']])
+            elif op == OP_EXPIRE or load.track_last_version:
+                ids[get_collection(o)].append(o[_FLD_ID])
+        dbedges = {col: db.get_edges(colids, load.timestamp, edge_collection=col,
+                                     fields=_EDGE_FIELDS)
+                   for col, colids in ids.items()}
+        return dbedges, _delta_load._get_vertices(load, list(vertids))
+
+    def apply(ops, dbdocs):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        dbedges, dbverts = dbdocs
+        vcol = db.get_vertex_collection()
+        bulkset = {}
+        for o in ops:
+            col = get_collection(o)
+            if col not in bulkset:
+                bulkset[col] = load.get_batch_updater(col)
+            bulk = bulkset[col]
+            if o[_FLD_OP] == OP_CREATE:
+                e = o[_FLD_DOC]
+                from_ = _get_extant(dbverts, e['from'], vcol, ts)
+                to = _get_extant(dbverts, e['to'], vcol, ts)
+                bulk.create_edge(e[_ID], from_, to, ver, ts, rts, e, load.get_fingerprint(e))
+                continue
+            if o[_FLD_OP] == OP_SEEN and not load.track_last_version:
+                bulk.set_last_version_on_edge(None, ver)
+                continue
+            dbe = _get_extant(dbedges[col], o[_FLD_ID], col, ts)
+            if o[_FLD_OP] == OP_EXPIRE:
+                bulk.expire_edge(dbe, ts - 1, rts - 1)
+            else:
+                bulk.set_last_version_on_edge(dbe, ver)
+        return list(bulkset.values())
+
+    _delta_load._run_batches(load, ops, lookup, apply, phase, load.pipeline_depth)
+
+_SECTION_PROCESSORS = {
+    _obs.PHASE_VERTICES: _apply_vertices,
+    _obs.PHASE_MERGES: _apply_merges,
+    _obs.PHASE_VERTEX_EXPIRY: _apply_vertices,
+    _obs.PHASE_EDGES: _apply_edges,
+}
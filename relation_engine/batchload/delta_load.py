@@ -9,19 +9,40 @@ take this into account and take measures to prevent it.
 """
 
 from collections import defaultdict as _defaultdict
+from collections import deque as _deque
+from collections import namedtuple as _namedtuple
+import concurrent.futures as _futures
 import datetime as _dt
+import hashlib as _hashlib
 import itertools as _itertools
+import json as _json
+import math as _math
+import mmap as _mmap
+import queue as _queue
+import sys as _sys
+import threading as _threading
 import time as _time
+import zlib as _zlib
+
+from relation_engine.batchload import load_observers as _obs
+from relation_engine.batchload.id_order import ID_ORDER_NUMERIC
+from relation_engine.batchload.id_order import ID_ORDER_STRING
 
 # TODO TEST
 # TODO DOCS document reserved fields that will be overwritten if supplied
-# TODO CODE add notification callback so that the caller can implement % complete or logs or whatever based on what's happening in the delta load algorithm. Remove _VERBOSE prints at that point
-
-# TODO CODE consider threading / multiprocessing here. Virtually all the time is db access
 
-_VERBOSE = False
 _ID = 'id'
 _KEY = '_key'
+_FINGERPRINT = 'fingerprint'
+
+# The fields required from the database for vertices and edges that are only used for their
+# identity, and for vertices and edges that are compared against fingerprints.
+_VERTEX_FIELDS = [_KEY, '_id', _ID]
+_VERTEX_FINGERPRINT_FIELDS = _VERTEX_FIELDS + [_FINGERPRINT]
+_EDGE_FINGERPRINT_FIELDS = _VERTEX_FIELDS + ['_from', '_to', _FINGERPRINT]
+
+# the values for the id_order attribute of a source are defined in id_order
+_ID_ORDER_KEYS = {ID_ORDER_STRING: str, ID_ORDER_NUMERIC: int}
 
 def load_graph_delta(
         load_namespace,
@@ -32,7 +53,23 @@ def load_graph_delta(
         release_timestamp,
         load_version,
         merge_source=None,
-        batch_size=10000):
+        batch_size=10000,
+        pipeline_depth=0,
+        partitions=1,
+        fingerprint=False,
+        cache_vertices=True,
+        server_side=False,
+        dry_run=False,
+        resume=False,
+        prefilter=False,
+        incremental_expiry=False,
+        track_last_version=True,
+        target_batch_latency=None,
+        max_rss=None,
+        throttle=None,
+        flush_size=None,
+        flush_bytes=None,
+        observers=None):
     """
     Loads a new version of a graph into a graph database, calculating the delta between the graphs
     and expiring / creating new vertices and edges as neccessary.
@@ -41,10 +78,18 @@ def load_graph_delta(
         Must be unique across all load sources.
     vertex_source - an iterator that produces vertices as dicts. An 'id' field is required that
       uniquely identifies the vertex in this load (and any previous loads in which it exists).
+      If the source has an id_order attribute set to ID_ORDER_STRING or ID_ORDER_NUMERIC, the
+      source declares it produces vertices in ascending ID order. In that case the extant
+      vertices are streamed from the database in the same order and joined to the source,
+      rather than looked up batch by batch, and the source is never partitioned. Vertices in
+      string order are streamed in a single pass over the ID index. Vertices in numeric order
+      take one pass over the index to find the longest ID and then one pass per ID length.
     edge_source - an iterator that produces edges as dicts. An 'id' field is required that
       uniquely identifies the edge in this load (and any previous loads in which it exists).
       'from' and 'to' fields are required that identify the vertices where the edge originates and
-      terminates.
+      terminates. The source may declare an id_order in the same way as the vertex source.
+      If the edges are loaded into more than one collection, the edges in each collection in a
+      batch are looked up and written concurrently.
     database - a wrapper for the database storing the graph. It must have the same interface as
       batchload.time_travelling_database.ArangoBatchTimeTravellingDB, which is currently the
       only implementation of the interface. The default collections will be used for the vertices
@@ -60,111 +105,1211 @@ def load_graph_delta(
          loads in which it exists). 'from' and 'to' fields are required that identify the vertices
          where the edge originates (the merged vertex) and terminates (the vertex the old vertex
          was merged into). If merge_source is specified, the database must have a merge collection
-         specified.
+         specified. A merge is only applied if both vertices exist once the vertices in the
+         vertex source have been processed. A vertex is merged at most once, and a merged vertex
+         is never the target of a subsequent merge, so only the first applicable merge of a
+         vertex in the source is applied.
     batch_size - the number of vertices or edges to process per batch. Higher batch sizes typically
-      decrease processing time and increase memory usage.
+      decrease processing time and increase memory usage. If target_batch_latency or max_rss
+      is specified, the initial number of vertices or edges per batch.
+    pipeline_depth - the number of batches to read and look up in the database ahead of the batch
+      that is currently being written. If greater than 0, the lookups run on worker threads
+      while the prior batch is written to the database, which can substantially decrease load
+      time when most of the time is spent waiting on the database. Up to pipeline_depth + 2
+      batches may be held in memory at once. The merge phase is never pipelined, as each merge
+      batch depends on the writes of the prior batch. The result of the load is identical
+      to a load with no pipelining.
+    partitions - the number of hash partitions of the vertex and edge ids to process
+      concurrently. Each partition is processed by its own thread with its own batches, which
+      can increase throughput when the database can accept more concurrent requests. The vertex
+      partitions are all complete before the merge phase starts, and the edge partitions before
+      edges are expired. The result of the load is identical to an unpartitioned load.
+    fingerprint - True to store a hash of the contents of each vertex and edge created in the
+      load in the document's fingerprint field. When the existing version of a document in the
+      database has a fingerprint, it is compared to the fingerprint of the new version of the
+      document to determine whether the document has changed rather than comparing the
+      documents field by field.
+    cache_vertices - True to record the database ID of each vertex in the load as the vertices
+      are processed so that the vertices don't need to be fetched from the database again when
+      processing merges and edges. The cache uses roughly 100 bytes of memory per vertex.
+    server_side - True to calculate the delta between the graphs in the database rather than
+      in memory. The vertices and edges are imported into temporary staging collections, batch_size
+      documents at a time, and then compared to and merged with the extant vertices and edges
+      by the database. The staging collections are dropped once the vertices and edges are
+      merged. Merges are still processed in memory. Server side loads cannot be pipelined or
+      partitioned, and source id_order declarations are ignored.
+    dry_run - True to calculate the delta without altering the database. The vertices and edges
+      are looked up and compared as in a normal load, but no updates are written and the load is
+      not registered. The vertex cache is always enabled for dry runs, as the vertices that
+      would be created are not in the database. Server side loads cannot be dry run.
+      Fingerprinting decreases the cost of a dry run as in a normal load, since only the
+      fingerprints of the extant documents are fetched.
+    resume - True to resume a load that failed before completion. As a load progresses, it
+      records checkpoints in the load registry as each phase and, for phases that are not
+      partitioned or processed server side, each batch is completed. A resumed load skips the
+      completed phases and batches and repeats the remainder of the load, which is safe as
+      reprocessing a document that was already written is a no-op. The load must be the most
+      recent load in the namespace, must be in progress, and must have the same timestamps
+      and, if a batch checkpoint was recorded by a load without adaptive batch sizing, the
+      same batch size, or also use adaptive batch sizing. The sources must produce
+      the same documents in the same order as the failed load. If a source has
+      get_position() and seek(position) methods, the position after each batch is recorded
+      in the checkpoint and the source is seeked to the position on resume rather than
+      reading and discarding the completed batches. get_position() may return None if the
+      source doesn't know its position. Dry runs cannot be resumed.
+    prefilter - True to build a Bloom filter of the IDs of the vertices or edges in each
+      collection, in a single streaming pass over the collection, before looking up vertices
+      or edges in the collection. IDs that are definitely not in the collection are not looked
+      up in the database, which saves many queries when a large fraction of the vertices and
+      edges are new, e.g. on the first load in a namespace. The filters use roughly 10 bits of
+      memory per extant vertex or edge. Sources that declare an id_order are joined to the
+      database rather than looked up and so are not prefiltered, and prefilter is ignored for
+      server side loads.
+    incremental_expiry - True to expire the vertices and edges that are not in the load by
+      streaming the keys of only those documents from the database and expiring them in batches
+      of batch_size, rather than with an update query over each collection. The update query
+      also rewrites the documents that were already expired earlier in the load because they
+      changed or were merged, and applies all its writes in a single query. Incremental expiry
+      writes only the documents that are not in the load, and reports its progress per batch.
+      On resume, an incomplete incremental expiry phase is repeated in full.
+    track_last_version - False to leave the vertices and edges that are unchanged in the load
+      as they are, rather than updating their last version field, which saves a write per
+      unchanged vertex and edge. The keys of the unchanged vertices and edges are held in memory,
+      using roughly 100 bytes per document, until the vertices and edges that are not in the
+      load are expired, and expiry is always incremental. The last version field of a document is
+      then not the last load in which the document appeared; a document appeared in a load if
+      it existed at the load timestamp recorded in the load registry. Loads that don't track the
+      last version cannot be resumed or processed server side, and they don't record
+      checkpoints. The load registry records that the last version is not tracked, so the last
+      version is not reset when the load is rolled back.
+    target_batch_latency - the time, in seconds, that looking up and writing a batch should
+      take. If specified, the size of each batch is adapted to the smoothed per document lookup
+      and write latency of the prior batches in the phase, starting at batch_size and changing
+      by at most a factor of 2 per batch. Batches in phases that update a single collection are
+      sized per collection. Server side phases always use batch_size.
+    max_rss - the maximum resident set size, in bytes, of the loading process. If specified,
+      and the process exceeds the limit, the batch size is halved each time a batch is read
+      while the resident set size is still increasing, and is not grown until the process is
+      back under the limit. The limit is only enforced on platforms with a /proc filesystem.
+      The batch size changes are reported to the observers as BatchSize events.
+    throttle - a batchload.load_throttle.LoadThrottle to limit the rate at which the load writes
+      to the database and to pause writes while lookups are slow, so that other queries against
+      the database are not starved. Each batch's lookup time is reported to the throttle, and
+      each bulk update waits for the throttle before it's written. Throttled loads always
+      expire incrementally so that expiry is also throttled. Server side loads cannot be
+      throttled, as most of their writes are made in a single query per collection.
+    flush_size - if specified, the updates for each batch are written on a background thread in
+      chunks of this many documents as the batch is processed, rather than all at once after
+      the batch is processed. This bounds the memory used by the pending updates and overlaps
+      processing a batch with writing it. A batch is still only checkpointed once all its
+      updates are written. If the load is throttled, the throttle is applied to each chunk.
+    flush_bytes - as flush_size, but limits the approximate size of each chunk in bytes. If both
+      are specified, a chunk is written when either limit is reached.
+    observers - a list of observers of the load's progress. Each observer must have a
+      notify(event) method, which is called with the events defined in
+      batchload.load_observers as the load progresses. Dry runs send the phase and batch
+      events, but not the load or bulk import events.
+
+    Returns None, or for dry runs, a dict of collection name -> the estimated updates to the
+      collection as a dict with the keys:
+      created - the number of documents that would be created, including new versions of
+        changed documents and merge edges.
+      expired - the number of documents that would be expired. The number of documents expired
+        because they are not in the load is estimated from the number of extant documents in
+        the collection.
+      unchanged - the number of documents that would be unchanged and, if track_last_version is
+        True, have their last version updated.
+      bytes - the approximate size, in bytes, of the updates that would be sent to the database.
     """
     db = database
     if merge_source and not db.get_merge_collection():
         raise ValueError('A merge source is specified but the database ' +
            'has no merge collection')
-    db.register_load_start(
-        load_namespace, load_version, timestamp, release_timestamp, _get_current_timestamp())
+    if pipeline_depth < 0:
+        raise ValueError('pipeline_depth must be >= 0')
+    if partitions < 1:
+        raise ValueError('partitions must be >= 1')
+    if server_side and (pipeline_depth > 0 or partitions > 1):
+        raise ValueError('Server side loads cannot be pipelined or partitioned')
+    if server_side and dry_run:
+        raise ValueError('Server side loads cannot be dry run')
+    if resume and dry_run:
+        raise ValueError('Dry runs cannot be resumed')
+    if server_side and not track_last_version:
+        raise ValueError('Server side loads must track the last version')
+    if server_side and throttle:
+        raise ValueError('Server side loads cannot be throttled')
+    if resume and not track_last_version:
+        raise ValueError('Loads that do not track the last version cannot be resumed')
+    if target_batch_latency is not None and target_batch_latency <= 0:
+        raise ValueError('target_batch_latency must be > 0')
+    if max_rss is not None and max_rss <= 0:
+        raise ValueError('max_rss must be > 0')
+    if flush_size is not None and flush_size <= 0:
+        raise ValueError('flush_size must be > 0')
+    if flush_bytes is not None and flush_bytes <= 0:
+        raise ValueError('flush_bytes must be > 0')
+    adaptive = target_batch_latency is not None or max_rss is not None
+    tally = _DryRunTally(_get_collections(db)) if dry_run else None
+    checkpoints = None
+    # the unchanged documents in a load that doesn't track the last version are only known in
+    # memory, so the load can't be resumed
+    if not dry_run and track_last_version:
+        checkpoint = None
+        if resume:
+            checkpoint = _get_checkpoint(
+                db, load_namespace, load_version, timestamp, release_timestamp)
+        # batches are skipped by document count on resume, so the batch size is only fixed
+        # for loads without adaptive batch sizing
+        checkpoints = _Checkpoints(db, load_namespace, load_version,
+            None if adaptive else batch_size, checkpoint)
+    load = _DeltaLoad(db, timestamp, release_timestamp, load_version, batch_size, pipeline_depth,
+        partitions, fingerprint,
+        _VertexCache(db.get_vertex_collection(), cache_vertices or dry_run), observers, tally,
+        checkpoints, prefilter, incremental_expiry, track_last_version, target_batch_latency,
+        max_rss, throttle, flush_size, flush_bytes)
+    if not dry_run:
+        if not resume:
+            db.register_load_start(load_namespace, load_version, timestamp, release_timestamp,
+                _get_current_timestamp(), track_last_version=track_last_version)
+        load.notify(_obs.LoadStart(load_namespace, load_version))
+    start = _time.perf_counter()
 
-    _process_verts(db, vertex_source, timestamp, release_timestamp, load_version, batch_size)
-    if merge_source:
-        _process_merges(db, merge_source, timestamp, release_timestamp, load_version, batch_size)
-    
-    if _VERBOSE: print(f'expiring vertices: {_time.time()}')
-    db.expire_extant_vertices_without_last_version(
-        timestamp - 1, release_timestamp - 1, load_version)
+    try:
+        if server_side:
+            _run_load_phase(load, _obs.PHASE_VERTICES, _process_verts_server_side, vertex_source)
+        else:
+            _run_load_phase(
+                load, _obs.PHASE_VERTICES, _run_partitioned, vertex_source, _process_verts)
+        if merge_source:
+            _run_load_phase(load, _obs.PHASE_MERGES, _process_merges, merge_source)
 
-    _process_edges(db, edge_source, timestamp, release_timestamp, load_version, batch_size)
-    
-    if _VERBOSE: print(f'expiring edges: {_time.time()}')
-    for col in db.get_edge_collections():
-        db.expire_extant_edges_without_last_version(
-            timestamp - 1, release_timestamp -1,  load_version, edge_collection=col)
+        _run_load_phase(load, _obs.PHASE_VERTEX_EXPIRY, _expire_vertices)
+
+        if server_side:
+            _run_load_phase(load, _obs.PHASE_EDGES, _process_edges_server_side, edge_source)
+        else:
+            _run_load_phase(load, _obs.PHASE_EDGES, _run_partitioned, edge_source, _process_edges)
 
+        _run_load_phase(load, _obs.PHASE_EDGE_EXPIRY, _expire_edges)
+    finally:
+        load.close()
+
+    if dry_run:
+        return tally.get_report()
     db.register_load_complete(load_namespace, load_version, _get_current_timestamp())
+    load.notify(_obs.LoadEnd(load_namespace, load_version, _time.perf_counter() - start))
+
+def _get_collections(db):
+    cols = [db.get_vertex_collection()] + db.get_edge_collections()
+    if db.get_merge_collection():
+        cols.append(db.get_merge_collection())
+    return cols
+
+def _get_checkpoint(db, load_namespace, load_version, timestamp, release_timestamp):
+    """
+    Get the checkpoint for a load that is to be resumed, or None if the load hasn't recorded one.
+    """
+    loads = db.get_registered_loads(load_namespace)
+    if not loads or loads[0]['load_version'] != load_version:
+        raise ValueError(f'Load version {load_version} is not the most recent load in ' +
+            f'namespace {load_namespace}, cannot resume')
+    if loads[0]['state'] != 'in_progress':
+        raise ValueError(f'Load version {load_version} in namespace {load_namespace} is not ' +
+            'in progress, cannot resume')
+    if (loads[0]['load_timestamp'], loads[0]['release_timestamp']) != (
+            timestamp, release_timestamp):
+        raise ValueError(f'Load version {load_version} in namespace {load_namespace} was ' +
+            'started with different timestamps, cannot resume')
+    return loads[0].get('checkpoint')
 
 def _get_current_timestamp():
     return int(_dt.datetime.now(tz=_dt.timezone.utc).timestamp() * 1000)
 
-def _process_verts(db, vertex_source, timestamp, release_timestamp, load_version, batch_size):
+def _run_phase(load, phase, process, *args):
+    """
+    Run a phase of a load or rollback, notifying the observers as the phase starts and ends.
+
+    process - a function that takes the load or rollback notifier and args and runs the phase.
+    """
+    load.notify(_obs.PhaseStart(phase))
+    start = _time.perf_counter()
+    process(load, *args)
+    load.notify(_obs.PhaseEnd(phase, _time.perf_counter() - start))
+
+def _run_load_phase(load, phase, process, *args):
+    """
+    Run a phase of a load, unless a prior attempt at the load completed the phase, and record
+    that the phase is complete.
+    """
+    if load.checkpoints and load.checkpoints.is_complete(phase):
+        return
+    _run_phase(load, phase, process, *args)
+    if load.checkpoints:
+        load.checkpoints.phase_complete(phase)
+
+def _expire_incrementally(load):
+    # the unchanged documents in a load that doesn't track the last version can only be
+    # distinguished from the documents that aren't in the load in memory, and expiry queries
+    # can't be throttled
+    return not load.dry_run and (
+        load.incremental_expiry or not load.track_last_version or bool(load.throttle))
+
+def _expire_vertices(load):
+    col = load.db.get_vertex_collection()
+    if _expire_incrementally(load):
+        _expire_unseen(load, _obs.PHASE_VERTEX_EXPIRY, col)
+        return
+    if load.dry_run:
+        count = load.dry_run.add_unmatched(load.db, col, load.timestamp - 1)
+    else:
+        count = load.db.expire_extant_vertices_without_last_version(
+            load.timestamp - 1, load.release_timestamp - 1, load.load_version)
+    load.notify(_obs.CollectionUpdate(_obs.PHASE_VERTEX_EXPIRY, col, _obs.OP_EXPIRE, count))
+
+def _expire_edges(load):
+    for col in load.db.get_edge_collections():
+        if _expire_incrementally(load):
+            _expire_unseen(load, _obs.PHASE_EDGE_EXPIRY, col, edge=True)
+            continue
+        if load.dry_run:
+            count = load.dry_run.add_unmatched(load.db, col, load.timestamp - 1)
+        else:
+            count = load.db.expire_extant_edges_without_last_version(
+                load.timestamp - 1, load.release_timestamp - 1, load.load_version,
+                edge_collection=col)
+        load.notify(_obs.CollectionUpdate(_obs.PHASE_EDGE_EXPIRY, col, _obs.OP_EXPIRE, count))
+
+def _expire_unseen(load, phase, collection, edge=False):
+    """
+    Expire the documents in a collection that were extant prior to the load but are not in the
+    load, in batches. Only the documents to be expired and, if the load doesn't track the last
+    version, the documents that are unchanged in the load are fetched from the database.
+    """
+    db = load.db
+    ts, rts = load.timestamp - 1, load.release_timestamp - 1
+    seen = load.pop_seen(collection)
+    # documents that changed or were merged in this load are already expired at the load
+    # timestamp and so are not fetched. Only the keys are needed to expire the documents.
+    docs = db.get_extant_documents_without_last_version(collection, load.timestamp,
+        load.load_version, fields=[_KEY])
+    unseen = (d for d in docs if d[_KEY] not in seen)
+
+    def apply(docs, _):
+        bulk = load.get_batch_updater(collection if edge else None)
+        for d in docs:
+            if edge:
+                bulk.expire_edge(d, ts, rts)
+            else:
+                bulk.expire_vertex(d[_KEY], ts, rts)
+        return [bulk]
+
+    try:
+        # expired documents drop out of the stream, so batches can't be skipped on resume. The
+        # documents are looked up as they're streamed, so there's no separate lookup.
+        _run_batches(load, unseen, None, apply, phase, 0, resumable=False,
+            collection=collection)
+    finally:
+        docs.close()
+
+class _Notifier:
+    """
+    Sends events to the observers of a load or rollback.
+    """
+
+    def __init__(self, observers=None):
+        self._observers = list(observers or [])
+        # True if there are observers, and so events should be generated
+        self.observed = bool(self._observers)
+        self._lock = _threading.Lock()
+
+    def notify(self, event):
+        """
+        Send an event to the observers. Only one event is sent at a time.
+        """
+        if self.observed:
+            with self._lock:
+                for o in self._observers:
+                    o.notify(event)
+
+class _DeltaLoad(_Notifier):
+    """
+    The parameters of a delta load shared between the load phases.
+    """
+
+    def __init__(
+            self,
+            db,
+            timestamp,
+            release_timestamp,
+            load_version,
+            batch_size,
+            pipeline_depth,
+            partitions,
+            fingerprint,
+            vertex_cache,
+            observers=None,
+            dry_run=None,
+            checkpoints=None,
+            prefilter=False,
+            incremental_expiry=False,
+            track_last_version=True,
+            target_batch_latency=None,
+            max_rss=None,
+            throttle=None,
+            flush_size=None,
+            flush_bytes=None):
+        """
+        dry_run - a _DryRunTally to record the updates in rather than writing them to the
+          database, or None to write the updates.
+        checkpoints - the _Checkpoints in which to record the progress of the load, or None to
+          not record progress.
+        prefilter - True to filter the IDs looked up in each collection with a Bloom filter of
+          the extant IDs.
+        incremental_expiry - True to expire the documents that are not in the load in batches.
+        track_last_version - False to record the keys of the unchanged documents in memory rather
+          than updating their last version.
+        target_batch_latency - the time, in seconds, to which to adapt the batch latency, or
+          None to not adapt batch sizes to latency.
+        max_rss - the resident set size, in bytes, above which to shrink batches, or None to not
+          adapt batch sizes to memory usage.
+        throttle - the LoadThrottle to wait for before each write, or None to not throttle.
+        flush_size - if provided, updates are written on a background thread in chunks of this
+          many documents as they're added to a batch updater.
+        flush_bytes - if provided, updates are written on a background thread in chunks of
+          approximately this many bytes as they're added to a batch updater.
+        """
+        super().__init__(observers)
+        self.db = db
+        self.timestamp = timestamp
+        self.release_timestamp = release_timestamp
+        self.load_version = load_version
+        self.batch_size = batch_size
+        self.pipeline_depth = pipeline_depth
+        self.partitions = partitions
+        self.fingerprint = fingerprint
+        self.vertex_cache = vertex_cache
+        self.dry_run = dry_run
+        self.checkpoints = checkpoints
+        self.incremental_expiry = incremental_expiry
+        self.track_last_version = track_last_version
+        self.throttle = throttle
+        # dry runs never write, so there's nothing to flush
+        self.auto_flush = bool(flush_size or flush_bytes) and not dry_run
+        self._flush_size = flush_size
+        self._flush_bytes = flush_bytes
+        self._flush_pool = None
+        self._seen = _defaultdict(set)
+        self._batch_numbers = _defaultdict(lambda: _itertools.count(1))
+        self._prefilter = prefilter
+        self._prefilters = {}
+        # a separate lock so observers aren't blocked while a filter is built
+        self._prefilter_lock = _threading.Lock()
+        self._target_batch_latency = target_batch_latency
+        self._max_rss = max_rss
+        self._batch_sizers = {}
+
+    def next_batch_number(self, phase):
+        """
+        Get the number of the next batch in a phase. Batch numbers start at 1 and are unique
+        within a phase across all threads.
+        """
+        with self._lock:
+            return next(self._batch_numbers[phase])
+
+    def skip_batches(self, phase, count):
+        """
+        Skip the first count batch numbers in a phase.
+        """
+        with self._lock:
+            self._batch_numbers[phase] = _itertools.count(count + 1)
+
+    def get_batch_sizer(self, phase, collection=None):
+        """
+        Get the _BatchSizer shared by all the batches in a phase that update a collection, or
+        None if batch sizes are not adapted.
+
+        collection - the collection the batches update, or None if they may update more than one
+          collection.
+        """
+        if self._target_batch_latency is None and self._max_rss is None:
+            return None
+        with self._lock:
+            if (phase, collection) not in self._batch_sizers:
+                self._batch_sizers[(phase, collection)] = _BatchSizer(self, phase, collection,
+                    self.batch_size, self._target_batch_latency, self._max_rss)
+            return self._batch_sizers[(phase, collection)]
+
+    def get_batch_updater(self, collection=None, auto_flush=True, ignore_duplicates=False):
+        """
+        Get a batch updater for the vertex collection or an edge collection that updates the
+        last version of unchanged documents if the load tracks the last version.
+
+        If auto_flush is set on the load and the auto_flush argument is True, the updater writes
+        its updates in chunks on a thread pool shared by the load's updaters, waiting for the
+        throttle, if any, before each chunk. The pool is shut down by close(). Otherwise the
+        updates are written when the updater is applied.
+
+        ignore_duplicates - True to skip created documents that already exist rather than
+          failing the write.
+        """
+        if not self.auto_flush or not auto_flush:
+            return self.db.get_batch_updater(collection,
+                track_last_version=self.track_last_version, ignore_duplicates=ignore_duplicates)
+        before_flush = None
+        if self.throttle:
+            before_flush = self.throttle.before_write
+        with self._lock:
+            if not self._flush_pool:
+                self._flush_pool = _futures.ThreadPoolExecutor()
+        return self.db.get_batch_updater(
+            collection,
+            track_last_version=self.track_last_version,
+            flush_size=self._flush_size,
+            flush_bytes=self._flush_bytes,
+            before_flush=before_flush,
+            executor=self._flush_pool,
+            ignore_duplicates=ignore_duplicates)
+
+    def close(self):
+        """
+        Shut down the threads shared by the load's batch updaters.
+        """
+        if self._flush_pool:
+            self._flush_pool.shutdown()
+            self._flush_pool = None
+
+    def mark_seen(self, collection, keys):
+        """
+        Record the keys of documents in a collection that are unchanged in the load if the load
+        doesn't track the last version and is not a dry run.
+        """
+        if not self.track_last_version and not self.dry_run:
+            with self._lock:
+                self._seen[collection].update(keys)
+
+    def pop_seen(self, collection):
+        """
+        Remove and return the set of keys of the documents in a collection recorded by
+        mark_seen().
+        """
+        with self._lock:
+            return self._seen.pop(collection, set())
+
+    def filter_extant(self, collection, ids):
+        """
+        Remove the IDs that definitely do not exist in a collection at the load timestamp from a
+        list of IDs if prefiltering is enabled. The filter for the collection is built on first
+        use.
+
+        Returns the list of IDs that may exist.
+        """
+        if not self._prefilter:
+            return ids
+        with self._prefilter_lock:
+            if collection not in self._prefilters:
+                self._prefilters[collection] = _build_prefilter(
+                    self.db, collection, self.timestamp)
+            prefilter = self._prefilters[collection]
+        return [id_ for id_ in ids if id_ in prefilter]
+
+    def get_fingerprint(self, doc):
+        """
+        Returns the fingerprint of a document if fingerprints are enabled for the load or None.
+        """
+        return _fingerprint(doc) if self.fingerprint else None
+
+    def get_comparable_documents(self, get_documents, ids, fingerprint_fields):
+        """
+        Get the documents required to check whether incoming documents have changed.
+
+        If fingerprints are enabled, only the fingerprint_fields are fetched from the database.
+        Any documents without a fingerprint are then fetched in full.
+
+        get_documents - a function that takes a list of IDs and a list of fields (or None for
+          all fields) and returns the extant documents from the database as a dict of
+          ID -> document.
+        ids - the IDs of the documents to get.
+        fingerprint_fields - the fields to fetch if fingerprints are enabled.
+        """
+        if not self.fingerprint:
+            return get_documents(ids, None)
+        docs = get_documents(ids, fingerprint_fields)
+        unprinted = [id_ for id_, d in docs.items() if not d.get(_FINGERPRINT)]
+        if unprinted:
+            docs.update(get_documents(unprinted, None))
+        return docs
+
+# the keys of the counts for each collection in a dry run report
+_DRY_RUN_COUNTS = ['created', 'expired', 'unchanged']
+_DRY_RUN_BYTES = 'bytes'
+
+class _DryRunTally:
+    """
+    Tallies the updates a dry run load would write to each collection. Safe across threads.
+    """
+
+    def __init__(self, collections):
+        """
+        collections - the names of the collections the load may update.
+        """
+        self._lock = _threading.Lock()
+        self._counts = {c: dict.fromkeys(_DRY_RUN_COUNTS + [_DRY_RUN_BYTES], 0)
+                        for c in collections}
+        # the number of extant documents in each collection that are expired or marked as
+        # seen by the load, and so won't be expired because they're not in the load
+        self._matched = _defaultdict(int)
+
+    def add(self, bulk):
+        """
+        Add the pending updates in a BatchUpdater to the tally. The updates are not applied.
+
+        Returns a tuple of the number of documents created, expired, and unchanged.
+        """
+        counts = bulk.count_by_type()
+        size = bulk.payload_size()
+        col = bulk.get_collection()
+        with self._lock:
+            for k, n in zip(_DRY_RUN_COUNTS, counts):
+                self._counts[col][k] += n
+            self._counts[col][_DRY_RUN_BYTES] += size
+            self._matched[col] += counts[1] + counts[2]
+        return counts
+
+    def add_unmatched(self, db, collection, timestamp):
+        """
+        Estimate the number of documents in a collection that would be expired because they
+        are not in the load, and add them to the tally.
+
+        db - the database containing the collection.
+        collection - the name of the collection.
+        timestamp - the timestamp at which the documents are extant prior to the load.
+
+        Returns the estimated number of documents.
+        """
+        extant = db.count_extant_documents(collection, timestamp)
+        with self._lock:
+            count = max(0, extant - self._matched[collection])
+            self._counts[collection]['expired'] += count
+        return count
+
+    def get_report(self):
+        """
+        Get the tally as a dict of collection name -> dict of count name -> count.
+        """
+        with self._lock:
+            return {c: dict(counts) for c, counts in self._counts.items()}
+
+# the bounds of adaptive batch sizes. The bounds are widened to include the initial batch size.
+_MIN_ADAPTIVE_BATCH_SIZE = 100
+_MAX_ADAPTIVE_BATCH_SIZE = 100000
+# the weight of the latest batch in the moving averages of the per document latencies
+_LATENCY_SMOOTHING = 0.3
+# the max factor by which the batch size changes at once
+_MAX_BATCH_SIZE_CHANGE = 2
+# changes to the batch size smaller than this fraction of the size are not made
+_BATCH_SIZE_DEADBAND = 0.1
+# the kinds of latency recorded by a _BatchSizer
+_LATENCY_LOOKUP = 'lookup'
+_LATENCY_WRITE = 'write'
+
+class _BatchSizer:
+    """
+    Adapts the size of the batches read from the source of a phase to the latency of the prior
+    batches and the memory used by the process. May be shared between threads.
+    """
+
+    def __init__(
+            self,
+            notifier,
+            phase,
+            collection,
+            initial_size,
+            target_latency=None,
+            max_rss=None,
+            get_rss=None):
+        """
+        notifier - the _Notifier to which to send BatchSize events.
+        phase - the phase of the load.
+        collection - the collection the batches update, or None if they may update more than one
+          collection.
+        initial_size - the size of the first batch.
+        target_latency - the time, in seconds, that looking up and writing a batch should take,
+          or None to not adapt the size to latency.
+        max_rss - the resident set size, in bytes, above which to shrink batches, or None to not
+          adapt the size to memory usage.
+        get_rss - a function that returns the resident set size of the process, or None if it's
+          unknown. Defaults to reading the size from /proc.
+        """
+        self._notifier = notifier
+        self._phase = phase
+        self._collection = collection
+        self._size = initial_size
+        self._min = min(initial_size, _MIN_ADAPTIVE_BATCH_SIZE)
+        self._max = max(initial_size, _MAX_ADAPTIVE_BATCH_SIZE)
+        self._target = target_latency
+        self._max_rss = max_rss
+        self._get_rss = get_rss or _get_rss
+        self._latency = {}
+        # whether a batch was written since the size was last adapted to latency
+        self._written = False
+        # the resident set size when the size was last reduced for memory usage
+        self._shrunk_at = None
+        self._lock = _threading.Lock()
+
+    def add_latency(self, kind, documents, duration):
+        """
+        Record the time taken to look up or write a batch.
+
+        kind - _LATENCY_LOOKUP or _LATENCY_WRITE.
+        documents - the number of documents in the batch.
+        duration - the time taken, in seconds.
+        """
+        if not documents:
+            return
+        latency = duration / documents
+        with self._lock:
+            prior = self._latency.get(kind)
+            self._latency[kind] = latency if prior is None else (
+                _LATENCY_SMOOTHING * latency + (1 - _LATENCY_SMOOTHING) * prior)
+            if kind == _LATENCY_WRITE:
+                self._written = True
+
+    def next_size(self):
+        """
+        Get the size of the next batch.
+        """
+        rss = self._get_rss() if self._max_rss else None
+        with self._lock:
+            size, reason = self._size, None
+            if rss is not None and rss > self._max_rss:
+                # only shrink again if the prior reduction didn't stop the growth
+                if self._shrunk_at is None or rss > self._shrunk_at:
+                    size, reason = size // 2, _obs.BATCH_SIZE_MEMORY
+                    self._shrunk_at = rss
+            else:
+                self._shrunk_at = None
+                # lookups are only a part of the latency, so wait for a batch to be written.
+                # Adapt once per write so that batches read ahead of the writes don't compound
+                # the change.
+                if self._target and self._written:
+                    self._written = False
+                    target = self._target / max(sum(self._latency.values()), 1e-9)
+                    target = min(max(target, size / _MAX_BATCH_SIZE_CHANGE),
+                                 size * _MAX_BATCH_SIZE_CHANGE)
+                    if abs(target - size) > size * _BATCH_SIZE_DEADBAND:
+                        size, reason = int(target), _obs.BATCH_SIZE_LATENCY
+            size = min(max(size, self._min), self._max)
+            changed = size != self._size
+            self._size = size
+        if changed:
+            self._notifier.notify(_obs.BatchSize(self._phase, self._collection, size, reason))
+        return size
+
+def _get_rss():
+    """
+    Get the resident set size of the process in bytes, or None if it's unknown.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+# the fields of a load checkpoint
+_CP_COMPLETE_PHASES = 'complete_phases'
+_CP_PHASE = 'phase'
+_CP_BATCH = 'batch'
+_CP_POSITION = 'position'
+_CP_BATCH_SIZE = 'batch_size'
+_CP_DOCUMENTS = 'documents'
+
+class _Checkpoints:
+    """
+    Records the progress of a load in the load registry so that a failed load can be resumed
+    from the last complete phase or batch.
+    """
+
+    def __init__(self, db, load_namespace, load_version, batch_size, checkpoint=None):
+        """
+        db - the database containing the load registry.
+        load_namespace - the namespace of the load.
+        load_version - the version of the load.
+        batch_size - the batch size of the load, or None if the batch size is adaptive.
+        checkpoint - the last checkpoint recorded by a prior attempt at the load, if any.
+        """
+        self._db = db
+        self._load_namespace = load_namespace
+        self._load_version = load_version
+        self._batch_size = batch_size
+        checkpoint = checkpoint or {}
+        self._complete = list(checkpoint.get(_CP_COMPLETE_PHASES, []))
+        self._resume = None
+        if checkpoint.get(_CP_PHASE):
+            if None not in (checkpoint[_CP_BATCH_SIZE], batch_size) and (
+                    checkpoint[_CP_BATCH_SIZE] != batch_size):
+                raise ValueError(f'The batch size must be {checkpoint[_CP_BATCH_SIZE]} to ' +
+                    'resume the load')
+            self._resume = checkpoint
+
+    def is_complete(self, phase):
+        """
+        Returns True if a prior attempt at the load completed a phase.
+        """
+        return phase in self._complete
+
+    def is_resumed(self):
+        """
+        Returns True if the load resumes a prior attempt that recorded a checkpoint.
+        """
+        return bool(self._complete) or self._resume is not None
+
+    def get_resume_point(self, phase):
+        """
+        Get the point at which to resume a phase.
+
+        Returns a tuple of the number of batches and documents completed by a prior attempt at
+          the load and the position in the source following the last completed batch, which is
+          None if the source doesn't report its position.
+        """
+        if self._resume and self._resume[_CP_PHASE] == phase:
+            r = self._resume
+            # checkpoints recorded before document counts were recorded have a fixed batch size
+            documents = r.get(_CP_DOCUMENTS)
+            if documents is None:
+                documents = r[_CP_BATCH] * r[_CP_BATCH_SIZE]
+            return r[_CP_BATCH], documents, r[_CP_POSITION]
+        return 0, 0, None
+
+    def batch_complete(self, phase, batch, documents, position):
+        """
+        Record that a batch and all the prior batches in a phase are complete.
+
+        documents - the number of documents in the batch and all the prior batches.
+        position - the position in the source following the batch, or None if unknown.
+        """
+        self._record(phase, batch, documents, position)
+
+    def phase_complete(self, phase):
+        """
+        Record that a phase is complete.
+        """
+        self._complete.append(phase)
+        self._record(None, None, None, None)
+
+    def _record(self, phase, batch, documents, position):
+        self._db.register_load_checkpoint(self._load_namespace, self._load_version, {
+            _CP_COMPLETE_PHASES: self._complete,
+            _CP_PHASE: phase,
+            _CP_BATCH: batch,
+            _CP_DOCUMENTS: documents,
+            _CP_POSITION: position,
+            _CP_BATCH_SIZE: self._batch_size,
+        })
+
+# the max number of documents handed to a partition at once
+_PARTITION_CHUNK_SIZE = 1000
+_PARTITION_END = object()
+
+def _run_partitioned(load, source, process):
+    """
+    Run a load phase over hash partitions of a source. Documents are partitioned by their 'id'
+    field.
+
+    process - a function that takes the load and a source and processes the source.
+
+    Returns once all the partitions have been processed.
+    """
+    if load.partitions < 2 or _get_id_order(source):
+        process(load, source)
+        return
+    chunk_size = min(load.batch_size, _PARTITION_CHUNK_SIZE)
+    # allow for a full batch to be queued per partition
+    queues = [_queue.Queue(maxsize=load.batch_size // chunk_size + 1)
+              for _ in range(load.partitions)]
+    with _futures.ThreadPoolExecutor(max_workers=load.partitions) as pool:
+        futures = [pool.submit(process, load, _Partition(q)) for q in queues]
+        chunks = [[] for _ in range(load.partitions)]
+        try:
+            for doc in source:
+                p = _partition(doc[_ID], load.partitions)
+                chunks[p].append(doc)
+                if len(chunks[p]) >= chunk_size:
+                    if not _put_partition(queues[p], chunks[p], futures[p]):
+                        futures[p].result()  # throws the exception that stopped the partition
+                    chunks[p] = []
+            for p, chunk in enumerate(chunks):
+                if chunk and not _put_partition(queues[p], chunk, futures[p]):
+                    futures[p].result()
+        finally:
+            for q, f in zip(queues, futures):
+                _put_partition(q, _PARTITION_END, f)
+        for f in futures:
+            f.result()
+
+def _partition(id_, partitions):
+    # python's hash() is salted per process, so use a stable hash
+    return _zlib.crc32(id_.encode('utf-8')) % partitions
+
+def _put_partition(queue, chunk, future):
+    """
+    Put a chunk on a partition queue, giving up if the partition processor has stopped.
+    Returns False if the processor stopped.
+    """
+    while True:
+        try:
+            queue.put(chunk, timeout=1)
+            return True
+        except _queue.Full:
+            if future.done():
+                return False
+
+class _Partition:
+    """
+    A source that produces the documents in one hash partition of another source as they are
+    put on a queue.
+    """
+
+    def __init__(self, queue):
+        self._queue = queue
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _PARTITION_END:
+                return
+            yield from chunk
+
+def _run_batches(
+        load,
+        source,
+        lookup,
+        apply,
+        phase,
+        pipeline_depth,
+        ordered_lookups=False,
+        resumable=True,
+        collection=None,
+        update_pool=None):
+    """
+    Split a source into batches and process each batch, in order, in two steps:
+
+    lookup - a function that takes a batch as a list and returns the database state required
+      to process the batch. Lookups may run concurrently and so must not depend on the writes
+      of prior batches if pipeline_depth > 0. If None, the source is itself read from the
+      database, e.g. from a streaming query, and the time taken to read each batch is reported
+      as its lookup time. apply is then called with None as the lookup result.
+    apply - a function that takes the batch and the result of the lookup and returns a list of
+      BatchUpdaters. The updaters are applied in order once apply returns. apply is always
+      called in the calling thread.
+
+    If pipeline_depth is greater than 0, up to pipeline_depth lookups run on worker threads
+    ahead of the current batch, and the updaters for a batch are applied on a writer thread while
+    the next batch is processed. Updates are always applied in batch order, one batch at a time.
+    If ordered_lookups is True, the lookups run on a single worker thread and therefore run
+    one at a time in batch order.
+
+    If the load records checkpoints, the source is not a partition of a source, and resumable is
+    True, a checkpoint is recorded as each batch is applied, and any batches completed by a
+    prior attempt at the load are skipped.
+
+    If the load adapts its batch sizes, the batches are sized by the load's _BatchSizer for the
+    phase and collection, where collection is the collection the batches update, or None if
+    they may update more than one collection.
+
+    If update_pool is provided, the updaters for each batch are applied concurrently on the
+    pool, and so must each update a different collection.
+    """
+    sizer = load.get_batch_sizer(phase, collection)
+    checkpoints = None
+    if resumable and not isinstance(source, _Partition):
+        checkpoints = load.checkpoints
+    positioned = source if checkpoints and hasattr(source, 'get_position') else None
+    documents = [0]  # the documents completed in the phase
+    if checkpoints:
+        skip, documents[0], position = checkpoints.get_resume_point(phase)
+        if skip:
+            source = _skip_batches(source, documents[0], position)
+            load.skip_batches(phase, skip)
+    def read_batches():
+        chunks = _chunkiter(source, sizer.next_size if sizer else load.batch_size)
+        while True:
+            # the first document of a chunk is read by the chunk iterator, so it's timed too
+            start = _time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield _read_batch(load, phase, chunk, positioned, start)
+
+    batches = read_batches()
+    def update(batch, bulks):
+        start = _time.perf_counter()
+        try:
+            _update_all(load, batch, bulks, update_pool)
+        finally:
+            for b in bulks:
+                b.close()
+        if sizer:
+            sizer.add_latency(_LATENCY_WRITE, len(batch.docs), _time.perf_counter() - start)
+        if checkpoints:
+            # updates are applied one at a time
+            documents[0] += len(batch.docs)
+            checkpoints.batch_complete(phase, batch.number, documents[0], batch.position)
+
+    def timed_lookup(batch):
+        if lookup:
+            start = _time.perf_counter()
+            ret = lookup(batch.docs)
+            duration = _time.perf_counter() - start
+        else:
+            ret, duration = None, batch.read_duration
+        if sizer:
+            sizer.add_latency(_LATENCY_LOOKUP, len(batch.docs), duration)
+        if load.throttle:
+            load.throttle.lookup_complete(duration)
+        load.notify(_obs.BatchLookup(phase, batch.number, len(batch.docs), duration))
+        return ret
+
+    if pipeline_depth < 1:
+        for batch in batches:
+            update(batch, apply(batch.docs, timed_lookup(batch)))
+        return
+    lookup_workers = 1 if ordered_lookups else pipeline_depth
+    with _futures.ThreadPoolExecutor(max_workers=lookup_workers) as lookups, \
+            _futures.ThreadPoolExecutor(max_workers=1) as writer:
+        pending = _deque()
+        write = None
+        for batch in batches:
+            pending.append((batch, lookups.submit(timed_lookup, batch)))
+            if len(pending) > pipeline_depth:
+                write = _apply_next(pending, apply, update, writer, write)
+        while pending:
+            write = _apply_next(pending, apply, update, writer, write)
+        if write:
+            write.result()
+
+def _apply_next(pending, apply, update, writer, prior_write):
+    batch, lookup = pending.popleft()
+    bulks = apply(batch.docs, lookup.result())
+    # only one batch may be written at once to keep memory bounded and writes in order.
+    # Also surfaces any exception from the prior write.
+    if prior_write:
+        prior_write.result()
+    return writer.submit(update, batch, bulks)
+
+def _skip_batches(source, count, position):
+    """
+    Skip the first count documents of a source, seeking to the position following the
+    documents if it is known and the source supports seeking.
+    """
+    if position is not None and hasattr(source, 'seek'):
+        source.seek(position)
+        return source
+    return _itertools.islice(source, count, None)
+
+# a batch of documents from a source. start is the time the batch was read. position is the
+# position in the source following the batch, or None if the source doesn't report its position.
+# read_duration is the time taken to read the batch from the source, or None if not timed.
+_Batch = _namedtuple('_Batch', ['phase', 'number', 'docs', 'start', 'position', 'read_duration'])
+
+def _read_batch(load, phase, docs, source=None, read_start=None):
+    """
+    Read a batch of documents.
+
+    source - the source of the documents, if the source reports its position via a
+      get_position() method.
+    read_start - the time at which reading the batch started, if the read is to be timed.
+    """
+    docs = list(docs)
+    position = source.get_position() if source else None
+    now = _time.perf_counter()
+    batch = _Batch(phase, load.next_batch_number(phase), docs, now, position,
+        None if read_start is None else now - read_start)
+    load.notify(_obs.BatchStart(phase, batch.number, len(docs)))
+    return batch
+
+def _update_all(load, batch, bulks, pool=None):
+    """
+    Apply the updaters for a batch.
+
+    pool - an executor on which to apply the updaters concurrently, or None to apply them one
+      after another. The updaters must update different collections.
+    """
+    if load.dry_run:
+        counts = (0, 0, 0)
+        for b in bulks:
+            counts = tuple(c + n for c, n in zip(counts, load.dry_run.add(b)))
+        load.notify(_obs.BatchEnd(batch.phase, batch.number, len(batch.docs), *counts,
+            _time.perf_counter() - batch.start))
+        return
+    if pool and len(bulks) > 1:
+        futures = [pool.submit(_update, load, batch, b) for b in bulks]
+        counts = [f.result() for f in futures]
+    else:
+        counts = [_update(load, batch, b) for b in bulks]
+    if load.observed:
+        load.notify(_obs.BatchEnd(batch.phase, batch.number, len(batch.docs),
+            *(sum(c) for c in zip((0, 0, 0), *counts)), _time.perf_counter() - batch.start))
+
+def _update(load, batch, bulk):
+    """
+    Apply an updater for a batch.
+
+    Returns the counts of created, expired, and unchanged documents if the load is observed.
+    """
+    # automatically flushing updaters wait for the throttle before each chunk themselves
+    throttle = None if bulk.auto_flush else load.throttle
+    if not load.observed:
+        _throttle_update(throttle, bulk)
+        bulk.update()
+        return (0, 0, 0)
+    counts = bulk.count_by_type()
+    count, (import_size, key_size) = bulk.count(), bulk.payload_sizes()
+    _throttle_update(throttle, bulk, import_size + key_size)
+    start = _time.perf_counter()
+    bulk.update()
+    load.notify(_obs.BulkImport(batch.phase, batch.number, bulk.get_collection(), count,
+        import_size, key_size, _time.perf_counter() - start))
+    return counts
+
+def _throttle_update(throttle, bulk, size=None):
+    """
+    Wait for a throttle, if any, before a batch updater is applied.
+
+    size - the payload size of the updater if already known.
+    """
+    if throttle:
+        if size is None and throttle.bytes_per_second:
+            size = bulk.payload_size()
+        throttle.before_write(bulk.count(), size)
+
+def _process_verts(load, vertex_source):
     """
     For each vertex we're importing, either replace and expire an existing vertex, create a
     new vertex, or leave an existing vertex unchanged, updating its version.
     """
-    count = 1
-    for vertgen in _chunkiter(vertex_source, batch_size):
-        vertices = list(vertgen)
-        if _VERBOSE: print(f'vertex batch {count}: {_time.time()}')
-        count += 1
+    db = load.db
+    join = _get_sorted_join(
+        load, vertex_source, db.get_vertex_collection(), _VERTEX_FINGERPRINT_FIELDS)
+    def get_vertices(ids, fields):
+        return _get_joined_documents(load, join, ids, fields,
+            lambda ids, fields: db.get_vertices(ids, load.timestamp, fields=fields))
+
+    def lookup(vertices):
         keys = [v[_ID] for v in vertices]
-        if _VERBOSE: print(f'  looking up {len(keys)} vertices: {_time.time()}')
-        dbverts = db.get_vertices(keys, timestamp)
-        if _VERBOSE: print(f'  got {len(dbverts)} vertices: {_time.time()}')
-        bulk = db.get_batch_updater()
+        if not join:
+            keys = load.filter_extant(db.get_vertex_collection(), keys)
+        if not keys:
+            return {}
+        dbverts = load.get_comparable_documents(get_vertices, keys, _VERTEX_FINGERPRINT_FIELDS)
+        return dbverts
+
+    def apply(vertices, dbverts):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        bulk = load.get_batch_updater()
+        seen = []
         for v in vertices:
+            fp = load.get_fingerprint(v)
             dbv = dbverts.get(v[_ID])
             if not dbv:
-                bulk.create_vertex(v[_ID], load_version, timestamp, release_timestamp, v)
-            elif not _special_equal(v, dbv):
-                bulk.expire_vertex(dbv[_KEY], timestamp - 1, release_timestamp - 1)
-                bulk.create_vertex(v[_ID], load_version, timestamp, release_timestamp, v)
+                key = bulk.create_vertex(v[_ID], ver, ts, rts, v, fp)
+            elif not _unchanged(v, fp, dbv):
+                bulk.expire_vertex(dbv[_KEY], ts - 1, rts - 1)
+                key = bulk.create_vertex(v[_ID], ver, ts, rts, v, fp)
             else:
                 # mark node as seen in this version
-                bulk.set_last_version_on_vertex(dbv[_KEY], load_version)
-        if _VERBOSE: print(f'  updating {bulk.count()} vertices: {_time.time()}')
-        bulk.update()
+                key = dbv[_KEY]
+                bulk.set_last_version_on_vertex(key, ver)
+                seen.append(key)
+            load.vertex_cache.add(v[_ID], key)
+        load.mark_seen(db.get_vertex_collection(), seen)
+        return [bulk]
+
+    try:
+        _run_batches(load, vertex_source, lookup, apply, _obs.PHASE_VERTICES,
+            load.pipeline_depth, ordered_lookups=bool(join), collection=db.get_vertex_collection())
+    finally:
+        if join:
+            join.close()
 
-def _process_merges(db, merge_source, timestamp, release_timestamp, load_version, batch_size):
+def _process_merges(load, merge_source):
     """
     For each merge edge, if both vertices exist in the current graph (it is expected that vertices
     have been updated by _process_verts), add the merge edge to the database.
 
+    A vertex is merged at most once, and a merged vertex is never the target of a subsequent
+    merge. Merges are applied in source order, so the result doesn't depend on the batch size.
+
+    The merge edges in a batch are written before the merged vertices are expired, so a merge
+    is never lost if the load fails part way through a batch. When the load is resumed, the
+    first batch is repeated, and merge edges written by the failed attempt are skipped.
+
     This could be made smarter in the future.
     """
-    count = 1
-    for mergen in _chunkiter(merge_source, batch_size):
-        merges = list(mergen)
-        if _VERBOSE: print(f'merge batch {count}: {_time.time()}')
-        count += 1
+    db = load.db
+    # the first batch applied by a resumed load may have been partly written by the prior attempt
+    resumed = [bool(load.checkpoints and load.checkpoints.is_resumed())]
+    def lookup(merges):
         keys = list({m['from'] for m in merges} | {m['to'] for m in merges})
-        if _VERBOSE: print(f'  looking up {len(keys)} vertices: {_time.time()}')
-        dbverts = db.get_vertices(keys, timestamp)
-        if _VERBOSE: print(f'  got {len(dbverts)} vertices: {_time.time()}')
-        bulk = db.get_batch_updater(db.get_merge_collection())
-        vertbulk = db.get_batch_updater()
+        dbverts = _get_vertices(load, keys)
+        return dbverts
+
+    def apply(merges, dbverts):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        # automatically flushing updaters write independently, so the vertices could be expired
+        # before their merge edges are written
+        bulk = load.get_batch_updater(
+            db.get_merge_collection(), auto_flush=False, ignore_duplicates=resumed[0])
+        vertbulk = load.get_batch_updater(auto_flush=False)
+        resumed[0] = False
+        merged = set()
         for m in merges:
             dbmerged = dbverts.get(m['from'])
             dbtarget = dbverts.get(m['to'])
             # only add the merge if nodes exist at this point
             # trying to figure out where to set the edge if nodes are deleted gets complicated,
             # so we don't worry about it for now.
-            if dbmerged and dbtarget:
-                vertbulk.expire_vertex(dbmerged[_KEY], timestamp - 1, release_timestamp - 1)
+            # Vertices merged in prior batches are expired and so don't exist, but the lookup
+            # for this batch doesn't see the merges earlier in the batch.
+            if dbmerged and dbtarget and m['from'] not in merged and m['to'] not in merged:
+                merged.add(m['from'])
+                vertbulk.expire_vertex(dbmerged[_KEY], ts - 1, rts - 1)
+                load.vertex_cache.expire(m['from'])
                 bulk.create_edge(
-                    m[_ID], dbmerged, dbtarget, load_version, timestamp, release_timestamp, m)
-        if _VERBOSE: print(f'  updating {bulk.count()} edges: {_time.time()}')
-        bulk.update()
-        if _VERBOSE: print(f'  updating {vertbulk.count()} vertices: {_time.time()}')
-        vertbulk.update()
+                    m[_ID], dbmerged, dbtarget, ver, ts, rts, m, load.get_fingerprint(m))
+        return [bulk, vertbulk]
+
+    # merged vertices are expired as each batch is written, which affects the lookups for the
+    # next batch, so merges can't be pipelined
+    _run_batches(load, merge_source, lookup, apply, _obs.PHASE_MERGES, 0,
+        collection=db.get_merge_collection())
 
 # assumes verts have been processed
-def _process_edges(db, edge_source, timestamp, release_timestamp, load_version, batch_size):
+def _process_edges(load, edge_source):
     """
     For each edge we're importing, either replace and expire an existing edge, create a
     new edge, or leave an existing edge unchanged, updating its version.
+
+    If there is more than one edge collection, the edges in each collection in a batch, and the
+    vertices the edges connect, are looked up concurrently, and the updates to each collection
+    are written concurrently.
     """
-    count = 1
-    for edgegen in _chunkiter(edge_source, batch_size):
-        edges = list(edgegen)
-        if _VERBOSE: print(f'edge batch {count}: {_time.time()}')
-        count += 1
+    db = load.db
+    edge_collections = db.get_edge_collections()
+    # the collections share nothing but the vertices, which are only read
+    pool = None
+    if len(edge_collections) > 1:
+        pool = _futures.ThreadPoolExecutor(max_workers=len(edge_collections) + 1)
+    joins = {}
+    def get_edges(col):
+        if col not in joins and _get_id_order(edge_source):
+            joins[col] = _get_sorted_join(load, edge_source, col, _EDGE_FINGERPRINT_FIELDS)
+        return lambda ids, fields: _get_joined_documents(load, joins.get(col), ids, fields,
+            lambda ids, fields: db.get_edges(
+                ids, load.timestamp, edge_collection=col, fields=fields))
+
+    def lookup(edges):
         keys = _defaultdict(list)
-        bulkset = {}
         vertkeys = set()
         for e in edges:
             # The edges exists in the current load so their nodes must exist by now
@@ -174,49 +1319,352 @@ def _process_edges(db, edge_source, timestamp, release_timestamp, load_version,
             if not col:
                 col = db.get_default_edge_collection()
             keys[col].append(e[_ID])
-            if col not in bulkset:
-                bulkset[col] = db.get_batch_updater(col)
-        dbedges = {}
-        for col, keys in keys.items():
-            if _VERBOSE: print(f'  looking up {len(keys)} edges in {col}: {_time.time()}')
-            dbedges[col] = db.get_edges(keys, timestamp, edge_collection=col)
-            if _VERBOSE: print(f'  got {len(dbedges[col])} edges: {_time.time()}')
-        
-        # Could cache these, may be fetching the same vertex over and over, but no guarantees
-        # the same vertexes are repeated in a reasonable amount of time
-        # Batching the fetch is probably enough
-        if _VERBOSE: print(f'  looking up {len(vertkeys)} vertices: {_time.time()}')
-        dbverts = db.get_vertices(list(vertkeys), timestamp)
-        if _VERBOSE: print(f'  got {len(dbverts)} vertices: {_time.time()}')
-        keys = None
-        vertkeys = None
+        def get_collection_edges(col, keys):
+            if not _get_id_order(edge_source):
+                keys = load.filter_extant(col, keys)
+            return load.get_comparable_documents(
+                get_edges(col), keys, _EDGE_FINGERPRINT_FIELDS) if keys else {}
 
+        if not pool:
+            dbedges = {col: get_collection_edges(col, k) for col, k in keys.items()}
+            return dbedges, _get_vertices(load, vertkeys)
+        futures = {col: pool.submit(get_collection_edges, col, k) for col, k in keys.items()}
+        dbverts = pool.submit(_get_vertices, load, vertkeys)
+        return {col: f.result() for col, f in futures.items()}, dbverts.result()
+
+    def apply(edges, dbdocs):
+        ts, rts, ver = load.timestamp, load.release_timestamp, load.load_version
+        dbedges, dbverts = dbdocs
+        bulkset = {}
+        seen = _defaultdict(list)
         for e in edges:
             col = e.pop('_collection', None)
             if not col:
                 col = db.get_default_edge_collection()
+            fp = load.get_fingerprint(e)
             dbe = dbedges[col].get(e[_ID])
+            if col not in bulkset:
+                bulkset[col] = load.get_batch_updater(col)
             bulk = bulkset[col]
             from_ = dbverts[e['from']]
             to = dbverts[e['to']]
             if dbe:
-                if (not _special_equal(e, dbe) or
+                if (not _unchanged(e, fp, dbe) or
                         # these two conditions check whether the nodes the edge is attached to 
                         # have been updated this load
                         # This is an abstraction leak, bleah
                         dbe['_from'] != from_['_id'] or
                         dbe['_to'] != to['_id']):
-                    bulk.expire_edge(dbe, timestamp - 1, release_timestamp - 1)
-                    bulk.create_edge(
-                        e[_ID], from_, to, load_version, timestamp, release_timestamp, e)
+                    bulk.expire_edge(dbe, ts - 1, rts - 1)
+                    bulk.create_edge(e[_ID], from_, to, ver, ts, rts, e, fp)
                 else:
-                    bulk.set_last_version_on_edge(dbe, load_version)
+                    bulk.set_last_version_on_edge(dbe, ver)
+                    seen[col].append(dbe[_KEY])
             else:
-                bulk.create_edge(e[_ID], from_, to, load_version, timestamp, release_timestamp, e)
-        for b in bulkset.values():
-            if _VERBOSE:
-                print(f'  updating {b.count()} edges in {b.get_collection()}: {_time.time()}')
-            b.update()
+                bulk.create_edge(e[_ID], from_, to, ver, ts, rts, e, fp)
+        for col, keys in seen.items():
+            load.mark_seen(col, keys)
+        return list(bulkset.values())
+
+    try:
+        _run_batches(load, edge_source, lookup, apply, _obs.PHASE_EDGES, load.pipeline_depth,
+            ordered_lookups=bool(_get_id_order(edge_source)), update_pool=pool)
+    finally:
+        if pool:
+            pool.shutdown()
+        for j in joins.values():
+            j.close()
+
+def _process_verts_server_side(load, vertex_source):
+    """
+    Stage the vertices we're importing in the database and have the database replace and
+    expire, create, or update the version of the extant vertices as in _process_verts.
+    """
+    db = load.db
+    def stage(staging_collection, vertices):
+        db.stage_vertices(staging_collection, [(v, load.get_fingerprint(v)) for v in vertices])
+
+    def apply(staging_collection):
+        counts = db.apply_staged_vertices(
+            staging_collection, load.timestamp, load.release_timestamp, load.load_version)
+        _notify_staged_updates(load, _obs.PHASE_VERTICES, db.get_vertex_collection(), counts)
+
+    _run_staged(load, vertex_source, stage, apply, _obs.PHASE_VERTICES)
+
+# assumes verts have been processed
+def _process_edges_server_side(load, edge_source):
+    """
+    Stage the edges we're importing in the database and have the database replace and
+    expire, create, or update the version of the extant edges as in _process_edges.
+    """
+    db = load.db
+    def stage(staging_collection, edges):
+        staged = []
+        for e in edges:
+            col = e.pop('_collection', None)
+            staged.append((e, load.get_fingerprint(e), col))
+        db.stage_edges(staging_collection, staged)
+
+    def apply(staging_collection):
+        for col in db.get_edge_collections():
+            counts = db.apply_staged_edges(staging_collection, load.timestamp,
+                load.release_timestamp, load.load_version, edge_collection=col)
+            _notify_staged_updates(load, _obs.PHASE_EDGES, col, counts)
+
+    _run_staged(load, edge_source, stage, apply, _obs.PHASE_EDGES)
+
+def _run_staged(load, source, stage, apply, phase):
+    """
+    Stage a source in a temporary staging collection, batch by batch, and then apply the staged
+    documents. The staging collection is always dropped afterwards.
+
+    stage - a function that takes the name of the staging collection and a batch as a list and
+      stages the batch.
+    apply - a function that takes the name of the staging collection and applies the staged
+      documents.
+    """
+    staging_collection = load.db.create_staging_collection()
+    try:
+        for docs in _chunkiter(source, load.batch_size):
+            batch = _read_batch(load, phase, docs)
+            start = _time.perf_counter()
+            stage(staging_collection, batch.docs)
+            end = _time.perf_counter()
+            # the delta isn't known until the staged documents are applied
+            load.notify(_obs.BulkImport(
+                phase, batch.number, None, len(batch.docs), None, None, end - start))
+            load.notify(_obs.BatchEnd(
+                phase, batch.number, len(batch.docs), None, None, None, end - batch.start))
+        apply(staging_collection)
+    finally:
+        load.db.drop_staging_collection(staging_collection)
+
+def _notify_staged_updates(load, phase, collection, counts):
+    for op, count in zip([_obs.OP_CREATE, _obs.OP_EXPIRE, _obs.OP_SET_LAST_VERSION], counts):
+        load.notify(_obs.CollectionUpdate(phase, collection, op, count))
+
+def _get_id_order(source):
+    """
+    Get the order of the IDs in a source as declared by the source's id_order attribute or None
+    if the source is not sorted.
+    """
+    order = getattr(source, 'id_order', None)
+    if order and order not in _ID_ORDER_KEYS:
+        raise ValueError(f'Unknown id_order {order} for source')
+    return order
+
+def _get_sorted_join(load, source, collection, fingerprint_fields):
+    """
+    Create a _SortedJoin for a sorted source and a collection or return None if the source is
+    not sorted.
+    """
+    order = _get_id_order(source)
+    if not order:
+        return None
+    docs = load.db.get_extant_documents(
+        collection,
+        load.timestamp,
+        fields=fingerprint_fields if load.fingerprint else None,
+        numeric_ids=order == ID_ORDER_NUMERIC)
+    return _SortedJoin(docs, _ID_ORDER_KEYS[order], collection)
+
+def _get_joined_documents(load, join, ids, fields, get_documents):
+    """
+    Get documents from a join if one exists, falling back to the database for full documents
+    if the join only provides fingerprinted documents.
+    """
+    if join and (fields or not load.fingerprint):
+        return join.get(ids)
+    return get_documents(ids, fields)
+
+class _SortedJoin:
+    """
+    Joins a source sorted by ID to a stream of documents from the database sorted in the same
+    order. Each ID in the source is looked up in the stream with a single forward pass over
+    the stream.
+
+    The IDs passed to get() over the lifetime of the join must be strictly ascending. This
+    class is not thread safe.
+    """
+
+    def __init__(self, docs, key, collection):
+        """
+        docs - an iterator of documents from the database sorted by ID.
+        key - a function that converts an ID into the value by which the IDs are sorted.
+        collection - the name of the collection the documents are from, used in errors.
+        """
+        self._docs = docs
+        self._key = key
+        self._collection = collection
+        self._last = None
+        self._next = None
+        self._next_key = None
+        self._advance()
+
+    def _advance(self):
+        prior = self._next_key
+        self._next = next(self._docs, None)
+        self._next_key = None if self._next is None else self._key(self._next[_ID])
+        if self._next is not None and prior is not None and self._next_key <= prior:
+            if self._next_key == prior:
+                raise ValueError(f'db contains > 1 document for id {self._next[_ID]}, ' +
+                    f'collection {self._collection}')
+            raise ValueError(f'Documents in collection {self._collection} are not sorted ' +
+                f'by ID in the declared order: {self._next[_ID]} follows a greater ID')
+
+    def get(self, ids):
+        """
+        Get the documents for a list of IDs.
+
+        Returns a dict of ID -> document. Missing documents are not included.
+        """
+        ret = {}
+        for id_ in ids:
+            k = self._key(id_)
+            if self._last is not None and k <= self._last:
+                raise ValueError(f'Source for collection {self._collection} is not sorted by ' +
+                    f'ID in the declared order: {id_} does not follow the prior ID')
+            self._last = k
+            while self._next is not None and self._next_key < k:
+                self._advance()
+            if self._next is not None and self._next_key == k:
+                ret[id_] = self._next
+                self._advance()
+        return ret
+
+    def close(self):
+        """
+        Stop streaming documents from the database.
+        """
+        if hasattr(self._docs, 'close'):
+            self._docs.close()
+
+def _get_vertices(load, ids):
+    """
+    Get the vertices extant at the load timestamp from the vertex cache, falling back to the
+    database for any vertices not in the cache. Only the _key, _id, and id fields are returned.
+    """
+    dbverts, missing = load.vertex_cache.get(ids)
+    if missing:
+        dbverts.update(load.db.get_vertices(missing, load.timestamp, fields=_VERTEX_FIELDS))
+    return dbverts
+
+class _VertexCache:
+    """
+    A compact map of vertex ID -> vertex key for vertices that are extant at the load timestamp.
+
+    Vertex keys are usually the vertex ID and the load version joined with an underscore, and so
+    only the load version is stored for such keys. Since there are very few distinct load
+    versions in a graph, the versions are interned so each version string is only stored once.
+
+    Adding and getting vertices is safe across threads as long as the same vertex isn't added
+    concurrently from multiple threads.
+    """
+
+    def __init__(self, collection, enabled=True):
+        """
+        collection - the name of the vertex collection.
+        enabled - False to create a cache that never stores anything.
+        """
+        self._prefix = collection + '/'
+        self._enabled = enabled
+        self._versions = {}
+        # keys that don't fit the ID_version pattern, or None for expired vertices
+        self._keys = {}
+
+    def add(self, id_, key):
+        """
+        Add a vertex that is extant at the load timestamp to the cache.
+        """
+        if not self._enabled:
+            return
+        if key.startswith(id_) and key[len(id_):len(id_) + 1] == '_':
+            self._versions[id_] = _sys.intern(key[len(id_) + 1:])
+            self._keys.pop(id_, None)
+        else:
+            self._keys[id_] = key
+            self._versions.pop(id_, None)
+
+    def expire(self, id_):
+        """
+        Record that a vertex is no longer extant at the load timestamp.
+        """
+        if not self._enabled:
+            return
+        self._versions.pop(id_, None)
+        self._keys[id_] = None
+
+    def get(self, ids):
+        """
+        Get vertices from the cache.
+
+        Returns a tuple of a dict of ID -> vertex for the cached vertices, where each vertex
+        contains the _key, _id, and id fields, and a list of the IDs that are not in the cache.
+        Vertices recorded as expired are in neither the dict nor the list.
+        """
+        ret = {}
+        missing = []
+        for id_ in ids:
+            ver = self._versions.get(id_)
+            if ver is not None:
+                key = id_ + '_' + ver
+            elif id_ in self._keys:
+                key = self._keys[id_]
+                if key is None:
+                    continue
+            else:
+                missing.append(id_)
+                continue
+            ret[id_] = {_KEY: key, '_id': self._prefix + key, _ID: id_}
+        return ret, missing
+
+# the false positive rate of the prefilters
+_PREFILTER_ERROR_RATE = 0.01
+
+def _build_prefilter(db, collection, timestamp):
+    """
+    Build a _BloomFilter of the IDs of the documents in a collection that exist at a timestamp.
+    """
+    prefilter = _BloomFilter(
+        db.count_extant_documents(collection, timestamp), _PREFILTER_ERROR_RATE)
+    for d in db.get_extant_documents(collection, timestamp, fields=[_ID]):
+        prefilter.add(d[_ID])
+    return prefilter
+
+class _BloomFilter:
+    """
+    A compact, probabilistic set of strings. Strings that were added to the filter are always
+    reported as in the filter, but strings that were not added may also be reported as in the
+    filter at roughly the error rate when the filter holds its capacity.
+
+    Adding strings is not thread safe, but checking membership is.
+    """
+
+    def __init__(self, capacity, error_rate):
+        """
+        capacity - the expected number of strings in the filter.
+        error_rate - the expected false positive rate when the filter holds its capacity.
+        """
+        capacity = max(capacity, 1)
+        self._size = _math.ceil(-capacity * _math.log(error_rate) / _math.log(2) ** 2)
+        self._hashes = max(1, round(self._size / capacity * _math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _indexes(self, string):
+        # derive the bit indexes from two halves of one hash (Kirsch & Mitzenmacher)
+        h = _hashlib.blake2b(string.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(h[:8], 'little'), int.from_bytes(h[8:], 'little')
+        return [(h1 + i * h2) % self._size for i in range(self._hashes)]
+
+    def add(self, string):
+        """
+        Add a string to the filter.
+        """
+        for i in self._indexes(string):
+            self._bits[i >> 3] |= 1 << (i & 7)
+
+    def __contains__(self, string):
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(string))
 
 # TODO CODE these fields are shared between here and the database. Should probably put them somewhere in common.
 # same with the id and _key fields in the code above
@@ -224,7 +1672,7 @@ def _process_edges(db, edge_source, timestamp, release_timestamp, load_version,
 # else is pretty tiny
 _SPECIAL_EQUAL_IGNORED_FIELDS = ['_id', _KEY, '_to', '_from', 'created', 'expired',
                                  'release_created', 'release_expired',
-                                 'first_version', 'last_version']
+                                 'first_version', 'last_version', _FINGERPRINT]
 
 def _special_equal(doc1, doc2):
     """
@@ -239,16 +1687,38 @@ def _special_equal(doc1, doc2):
     
     return d1c == d2c 
 
+def _unchanged(doc, fingerprint, dbdoc):
+    """
+    Checks if a document is unchanged from its prior version in the database. Uses the
+    fingerprints of the documents if both are available, or _special_equal otherwise.
+    """
+    dbfingerprint = dbdoc.get(_FINGERPRINT)
+    if fingerprint and dbfingerprint:
+        return fingerprint == dbfingerprint
+    return _special_equal(doc, dbdoc)
+
+def _fingerprint(doc):
+    """
+    Calculates a stable hash of the contents of a dict other than the fields ignored by
+    _special_equal.
+    """
+    d = {k: v for k, v in doc.items() if k not in _SPECIAL_EQUAL_IGNORED_FIELDS}
+    j = _json.dumps(d, sort_keys=True, separators=(',', ':'))
+    return _hashlib.blake2b(j.encode('utf-8'), digest_size=16).hexdigest()
+
 def _chunkiter(iterable, size):
     """
-    Iterate over chunks of size 'size' of an iterable.
+    Iterate over chunks of size 'size' of an iterable. size may also be a function that returns
+    the size of the next chunk.
     """
     iterator = iter(iterable)
     for first in iterator:
-        yield _itertools.chain([first], _itertools.islice(iterator, size - 1))
+        n = size() if callable(size) else size
+        yield _itertools.chain([first], _itertools.islice(iterator, n - 1))
 
 # TODO CODE fields here shared with the DB. Put them somewhere in common.
-def roll_back_last_load(database, load_namespace):
+def roll_back_last_load(
+        database, load_namespace, observers=None, throttle=None, batch_size=10000):
     """
     Removes the most recent data load to a namespace and reverts it to the prior state.
 
@@ -257,7 +1727,16 @@ def roll_back_last_load(database, load_namespace):
       currently the only implementation of the interface.
     load_namespace - the name of the data set that is to be reverted,
         e.g. ncbi_taxa, gene_ontology, etc. Must be unique across all load sources.
+    observers - a list of objects that are notified of the progress of the rollback. Each
+      observer must have a notify(event) method, which is called with the events defined in
+      batchload.load_observers.
+    throttle - a batchload.load_throttle.LoadThrottle to limit the rate at which the rollback
+      writes to the database. If provided, the keys of the documents to roll back are streamed
+      from the database and the documents are rolled back batch_size documents at a time,
+      waiting for the throttle before each batch, rather than in a single query per collection.
+    batch_size - the number of documents to roll back at a time if throttled.
     """
+    notifier = _Notifier(observers)
     loads = database.get_registered_loads(load_namespace)
     # Was checking state == complete here, but that means if a load or rollback fails midway,
     # it can't be rolled back. Rollbacks should generally always work.
@@ -280,10 +1759,37 @@ def roll_back_last_load(database, load_namespace):
     # somewhat complex unit tests that ensure this occurs prior to the data alterations.
     # For now just testing manually
     db.register_load_rollback(load_namespace, current_ver)
+    notifier.notify(_obs.RollbackStart(load_namespace, current_ver))
+    start = _time.perf_counter()
+
+    batches = {}
+    if throttle:
+        batches = {'batch_size': batch_size, 'before_batch':
+            lambda keys: throttle.before_write(len(keys), len(_json.dumps(keys)))}
+    phases = [
+        (_obs.PHASE_ROLLBACK_DELETE, _obs.OP_DELETE,
+            lambda c: db.delete_created_documents(c, timestamp, **batches)),
+        (_obs.PHASE_ROLLBACK_UNEXPIRE, _obs.OP_UNEXPIRE,
+            lambda c: db.undo_expire_documents(c, timestamp - 1, **batches)),
+    ]
+    # if the load didn't track the last version, only the documents it created, which are
+    # deleted, have the load's version as their last version
+    if loads[0].get('track_last_version', True):
+        phases.append((_obs.PHASE_ROLLBACK_LAST_VERSION, _obs.OP_SET_LAST_VERSION,
+            lambda c: db.reset_last_version(c, current_ver, prior_ver, **batches)))
+    for phase, operation, undo in phases:
+        _run_phase(notifier, phase, _roll_back_collections, phase, collections, operation, undo)
 
-    for c in collections:
-        db.delete_created_documents(c, timestamp)
-        db.undo_expire_documents(c, timestamp - 1)
-        db.reset_last_version(c, current_ver, prior_ver)
-    
     db.delete_registered_load(load_namespace, current_ver)
+    notifier.notify(_obs.RollbackEnd(
+        load_namespace, current_ver, _time.perf_counter() - start))
+
+def _roll_back_collections(notifier, phase, collections, operation, undo):
+    """
+    Run a rollback phase.
+
+    undo - a function that takes a collection name, reverts the load in the collection, and
+      returns the number of documents updated.
+    """
+    for c in collections:
+        notifier.notify(_obs.CollectionUpdate(phase, c, operation, undo(c)))
@@ -0,0 +1,12 @@
+"""
+Values for the id_order attribute of a delta load source, which declares the source to be
+sorted by ID. See delta_load.load_graph_delta.
+
+This module has no dependencies so that sources can declare their order without importing the
+delta loader.
+"""
+
+# The source is sorted by the string value of the IDs.
+ID_ORDER_STRING = 'string'
+# The source is sorted by the numeric value of the IDs, which must be integers.
+ID_ORDER_NUMERIC = 'numeric'
@@ -0,0 +1,429 @@
+"""
+Events describing the progress of a delta load and observers that consume them.
+
+An observer is any object with a notify(event) method. Observers are passed to
+delta_load.load_graph_delta or delta_load.roll_back_last_load, which call notify with each event
+in the order the events occur.
+Calls to notify are serialized by the loader, so observers don't need to be thread safe, but
+they may be called from any of the loader's threads and so should return quickly.
+
+All durations are in seconds.
+"""
+
+from collections import defaultdict as _defaultdict
+from collections import namedtuple as _namedtuple
+import json as _json
+import os as _os
+import sys as _sys
+import time as _time
+
+# The phases of a load, in the order they run.
+PHASE_VERTICES = 'vertices'
+PHASE_MERGES = 'merges'
+PHASE_VERTEX_EXPIRY = 'vertex_expiry'
+PHASE_EDGES = 'edges'
+PHASE_EDGE_EXPIRY = 'edge_expiry'
+# The phases of a rollback, in the order they run.
+PHASE_ROLLBACK_DELETE = 'rollback_delete'
+PHASE_ROLLBACK_UNEXPIRE = 'rollback_unexpire'
+PHASE_ROLLBACK_LAST_VERSION = 'rollback_last_version'
+
+# The operations reported in CollectionUpdate events.
+OP_CREATE = 'create'
+OP_EXPIRE = 'expire'
+OP_SET_LAST_VERSION = 'set_last_version'
+OP_DELETE = 'delete'
+OP_UNEXPIRE = 'unexpire'
+
+# The reasons for a change in the batch size reported in BatchSize events.
+BATCH_SIZE_LATENCY = 'latency'
+BATCH_SIZE_MEMORY = 'memory'
+
+class LoadStart(_namedtuple('LoadStart', ['load_namespace', 'load_version'])):
+    """
+    A load has been registered and is about to start.
+    """
+    __slots__ = ()
+
+class LoadEnd(_namedtuple('LoadEnd', ['load_namespace', 'load_version', 'duration'])):
+    """
+    A load is complete.
+    """
+    __slots__ = ()
+
+class RollbackStart(_namedtuple('RollbackStart', ['load_namespace', 'load_version'])):
+    """
+    A rollback of a load is about to start.
+
+    load_version - the version of the load that is being rolled back.
+    """
+    __slots__ = ()
+
+class RollbackEnd(_namedtuple('RollbackEnd', ['load_namespace', 'load_version', 'duration'])):
+    """
+    A rollback of a load is complete.
+    """
+    __slots__ = ()
+
+class PhaseStart(_namedtuple('PhaseStart', ['phase'])):
+    """
+    A phase of a load is starting.
+
+    phase - one of the PHASE_* constants.
+    """
+    __slots__ = ()
+
+class PhaseEnd(_namedtuple('PhaseEnd', ['phase', 'duration'])):
+    """
+    A phase of a load is complete.
+    """
+    __slots__ = ()
+
+class BatchStart(_namedtuple('BatchStart', ['phase', 'batch', 'size'])):
+    """
+    A batch has been read from a source.
+
+    batch - the number of the batch, starting at 1. Batch numbers are unique within a phase,
+      including across partitions.
+    size - the number of documents in the batch.
+    """
+    __slots__ = ()
+
+class BatchSize(_namedtuple('BatchSize', ['phase', 'collection', 'size', 'reason'])):
+    """
+    Adaptive batch sizing has changed the size of the batches read from a source. The size
+    applies to the batches read after the event.
+
+    collection - the collection the batches update, or None if they may update more than one
+      collection.
+    size - the new batch size.
+    reason - BATCH_SIZE_LATENCY if the size was changed to approach the target batch latency, or
+      BATCH_SIZE_MEMORY if the size was reduced as the process exceeded its memory ceiling.
+    """
+    __slots__ = ()
+
+class BatchLookup(_namedtuple('BatchLookup', ['phase', 'batch', 'size', 'duration'])):
+    """
+    The extant documents for a batch have been looked up in the database.
+
+    size - the number of documents in the batch.
+    """
+    __slots__ = ()
+
+class BulkImport(_namedtuple('BulkImport',
+        ['phase', 'batch', 'collection', 'count', 'payload_size', 'key_update_size',
+         'duration'])):
+    """
+    Documents have been written to a collection, either by importing new documents or by
+    updating existing documents by key.
+
+    collection - the name of the collection, or None if the documents were sent to a temporary
+      staging collection.
+    count - the number of documents written.
+    payload_size - the approximate size of the imported documents in bytes when serialized to
+      JSON, or None if unknown.
+    key_update_size - the approximate size in bytes of the keys sent to update queries when
+      serialized to JSON, or None if unknown.
+    """
+    __slots__ = ()
+
+class BatchEnd(_namedtuple('BatchEnd',
+        ['phase', 'batch', 'size', 'created', 'expired', 'unchanged', 'duration'])):
+    """
+    All the updates for a batch have been written to the database.
+
+    created - the number of documents created, including new versions of changed documents,
+      or None if unknown.
+    expired - the number of documents expired, or None if unknown.
+    unchanged - the number of documents that were unchanged and, if the load tracks the last
+      version, had their last version updated, or None if unknown.
+    duration - the time between the batch being read from the source and the updates being
+      written.
+    """
+    __slots__ = ()
+
+class CollectionUpdate(_namedtuple('CollectionUpdate',
+        ['phase', 'collection', 'operation', 'count'])):
+    """
+    Documents in a collection have been updated by a query in the database rather than with
+    import_bulk.
+
+    operation - one of the OP_* constants.
+    count - the number of documents updated.
+    """
+    __slots__ = ()
+
+def event_to_dict(event):
+    """
+    Convert an event to a dict, including the type of the event in the 'event' field.
+    """
+    d = {'event': type(event).__name__}
+    d.update(event._asdict())
+    return d
+
+class JSONLinesObserver:
+    """
+    Writes each event as a JSON object on its own line, with the type of the event in the
+    'event' field and the time the event was observed, in Unix epoch seconds, in the 'time'
+    field.
+    """
+
+    def __init__(self, output):
+        """
+        output - the file-like object to which the events will be written.
+        """
+        self._output = output
+
+    def notify(self, event):
+        d = event_to_dict(event)
+        d['time'] = _time.time()
+        self._output.write(_json.dumps(d) + '\n')
+        if isinstance(event, (BatchEnd, PhaseEnd, LoadEnd, RollbackEnd)):
+            self._output.flush()
+
+class ThroughputSummaryObserver:
+    """
+    Prints a summary of the throughput of each phase of a load as the phase ends, and of the
+    entire load as it ends.
+    """
+
+    def __init__(self, output=None):
+        """
+        output - the file-like object to which the summaries will be written. Defaults to
+          standard out.
+        """
+        self._output = output
+        self._phases = _defaultdict(_PhaseSummary)
+
+    def notify(self, event):
+        if isinstance(event, (BatchLookup, BulkImport, BatchEnd, CollectionUpdate)):
+            self._phases[event.phase].add(event)
+        elif isinstance(event, PhaseEnd):
+            self._print(f'{event.phase}: ' + self._phases[event.phase].format(event.duration))
+        elif isinstance(event, LoadEnd):
+            docs = sum(p.documents for p in self._phases.values())
+            self._print(f'load {event.load_namespace} {event.load_version}: ' +
+                f'{docs} documents in {event.duration:.1f}s ' +
+                f'({_rate(docs, event.duration)} documents/s)')
+        elif isinstance(event, RollbackEnd):
+            docs = sum(sum(p.updates.values()) for p in self._phases.values())
+            self._print(f'rollback {event.load_namespace} {event.load_version}: ' +
+                f'{docs} documents updated in {event.duration:.1f}s')
+
+    def _print(self, line):
+        print(line, file=self._output or _sys.stdout, flush=True)
+
+class _PhaseSummary:
+
+    def __init__(self):
+        self.documents = 0
+        self.batches = 0
+        self.lookup_time = 0
+        self.import_time = 0
+        self.payload_size = 0
+        self.counts = [0, 0, 0]
+        self.updates = _defaultdict(int)
+
+    def add(self, event):
+        if isinstance(event, CollectionUpdate):
+            self.updates[event.operation] += event.count
+        elif isinstance(event, BatchLookup):
+            self.lookup_time += event.duration
+        elif isinstance(event, BulkImport):
+            self.import_time += event.duration
+            self.payload_size += (event.payload_size or 0) + (event.key_update_size or 0)
+        else:
+            self.documents += event.size
+            self.batches += 1
+            for i, c in enumerate([event.created, event.expired, event.unchanged]):
+                self.counts[i] += c or 0
+
+    def format(self, duration):
+        ret = f'{duration:.1f}s'
+        if self.batches:
+            ret = (f'{self.documents} documents in {self.batches} batches in {ret} ' +
+                f'({_rate(self.documents, duration)} documents/s), ' +
+                f'lookups {self.lookup_time:.1f}s, imports {self.import_time:.1f}s ' +
+                f'({self.payload_size / 2**20:.1f} MiB)')
+            if not self.updates:
+                ret += (f', created {self.counts[0]}, expired {self.counts[1]}, ' +
+                    f'unchanged {self.counts[2]}')
+        for op, count in self.updates.items():
+            ret += f', {op} {count}'
+        return ret
+
+def _rate(count, duration):
+    return round(count / duration) if duration > 0 else count
+
+# The upper bounds, in seconds, of the default batch latency histogram buckets.
+DEFAULT_BATCH_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_METRIC_PREFIX = 'delta_load_'
+
+class PrometheusTextfileObserver:
+    """
+    Writes metrics for a load or rollback to a file in the Prometheus text exposition format,
+    for use with the node exporter's textfile collector. The file is rewritten at the end of
+    each phase and at the end of the run, and so always describes the current or most recent
+    run.
+
+    The file is written atomically by writing a temporary file in the same directory and
+    renaming it, so the collector never sees a partial file.
+
+    The metrics are labeled with the load namespace and the operation, either 'load' or
+    'rollback', and, where applicable, the phase and collection:
+
+    delta_load_info - always 1, with the version of the load as a label.
+    delta_load_complete - 1 if the run is complete, 0 if it's in progress or failed.
+    delta_load_duration_seconds - the wall clock time of the run so far.
+    delta_load_phase_duration_seconds - the wall clock time of each completed phase.
+    delta_load_phase_documents - the number of documents written to each collection.
+    delta_load_phase_documents_per_second - the above divided by the phase duration.
+    delta_load_phase_import_bytes - the approximate number of bytes of new documents imported.
+    delta_load_phase_key_update_bytes - the approximate number of bytes of keys sent to update
+      queries, which expire documents and set their last version.
+    delta_load_phase_expired_documents - the number of documents expired.
+    delta_load_batch_duration_seconds - a histogram of the time taken to process each batch.
+    delta_load_phase_batch_size - the latest batch size chosen by adaptive batch sizing for each
+      phase and, where the batches update a single collection, collection.
+    """
+
+    def __init__(self, path, buckets=DEFAULT_BATCH_BUCKETS):
+        """
+        path - the path of the file to write. The file name must end with .prom to be read by
+          the textfile collector.
+        buckets - the upper bounds, in seconds, of the batch latency histogram buckets.
+        """
+        self._path = path
+        self._buckets = sorted(buckets)
+        self._labels = None
+        self._version = None
+        self._start = None
+        self._complete = False
+        self._phases = {}
+
+    def notify(self, event):
+        if isinstance(event, (LoadStart, RollbackStart)):
+            op = 'load' if isinstance(event, LoadStart) else 'rollback'
+            self._labels = {'namespace': event.load_namespace, 'operation': op}
+            self._version = event.load_version
+            self._start = _time.perf_counter()
+            self._complete = False
+            self._phases = {}
+        elif isinstance(event, PhaseStart):
+            self._phases[event.phase] = _PhaseMetrics(len(self._buckets))
+        elif isinstance(event, (BulkImport, BatchEnd, CollectionUpdate, BatchSize)):
+            self._phases[event.phase].add(event, self._buckets)
+        elif isinstance(event, PhaseEnd):
+            self._phases[event.phase].duration = event.duration
+            self._write()
+        elif isinstance(event, (LoadEnd, RollbackEnd)):
+            self._complete = True
+            self._write()
+
+    def _write(self):
+        if self._labels is None:
+            return  # didn't see the start of the run
+        lines = []
+        self._add(lines, 'info', 'The load or rollback described by this file.',
+            [(dict(self._labels, version=self._version), 1)])
+        self._add(lines, 'complete', '1 if the run is complete, 0 otherwise.',
+            [(self._labels, int(self._complete))])
+        self._add(lines, 'duration_seconds', 'The wall clock time of the run so far.',
+            [(self._labels, _time.perf_counter() - self._start)])
+        phases = [(dict(self._labels, phase=p), m) for p, m in self._phases.items()
+                  if m.duration is not None]
+        self._add(lines, 'phase_duration_seconds', 'The wall clock time of each phase.',
+            [(l, m.duration) for l, m in phases])
+        self._add(lines, 'phase_documents',
+            'The number of documents written to each collection in each phase.',
+            [(dict(l, collection=c), n) for l, m in phases for c, n in m.documents.items()])
+        self._add(lines, 'phase_documents_per_second',
+            'The number of documents written to each collection per second of each phase.',
+            [(dict(l, collection=c), n / m.duration if m.duration > 0 else 0)
+             for l, m in phases for c, n in m.documents.items()])
+        self._add(lines, 'phase_import_bytes',
+            'The approximate number of bytes of new documents imported into each collection in ' +
+            'each phase.',
+            [(dict(l, collection=c), n) for l, m in phases for c, n in m.payload_size.items()])
+        self._add(lines, 'phase_key_update_bytes',
+            'The approximate number of bytes of keys sent to update queries for each ' +
+            'collection in each phase.',
+            [(dict(l, collection=c), n) for l, m in phases
+             for c, n in m.key_update_size.items()])
+        self._add(lines, 'phase_expired_documents',
+            'The number of documents expired in each phase.',
+            [(l, m.expired) for l, m in phases])
+        histogram = []
+        for l, m in phases:
+            if m.batches:
+                cumulative = 0
+                for bound, count in zip(self._buckets, m.buckets):
+                    cumulative += count
+                    histogram.append(('_bucket', dict(l, le=_format_value(bound)), cumulative))
+                histogram.append(('_bucket', dict(l, le='+Inf'), m.batches))
+                histogram.append(('_sum', l, m.batch_time))
+                histogram.append(('_count', l, m.batches))
+        self._add(lines, 'batch_duration_seconds',
+            'The time between reading a batch from the source and writing its updates.',
+            histogram, 'histogram')
+        self._add(lines, 'phase_batch_size',
+            'The latest batch size chosen by adaptive batch sizing in each phase.',
+            [(dict(l, collection=c) if c else l, n)
+             for l, m in phases for c, n in m.batch_sizes.items()])
+
+        tmp = f'{self._path}.{_os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        _os.replace(tmp, self._path)
+
+    def _add(self, lines, name, help_, samples, type_='gauge'):
+        name = _METRIC_PREFIX + name
+        lines.append(f'# HELP {name} {help_}')
+        lines.append(f'# TYPE {name} {type_}')
+        for s in samples:
+            suffix, labels, value = s if len(s) == 3 else ('',) + s
+            labels = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f'{name}{suffix}{{{labels}}} {_format_value(value)}')
+
+class _PhaseMetrics:
+
+    def __init__(self, bucket_count):
+        self.duration = None
+        self.documents = _defaultdict(int)
+        self.payload_size = _defaultdict(int)
+        self.key_update_size = _defaultdict(int)
+        self.expired = 0
+        self.batches = 0
+        self.batch_time = 0
+        self.buckets = [0] * bucket_count
+        self.batch_sizes = {}
+
+    def add(self, event, bounds):
+        if isinstance(event, BatchSize):
+            self.batch_sizes[event.collection] = event.size
+        elif isinstance(event, BulkImport):
+            if event.collection:
+                self.documents[event.collection] += event.count
+                self.payload_size[event.collection] += event.payload_size or 0
+                self.key_update_size[event.collection] += event.key_update_size or 0
+        elif isinstance(event, CollectionUpdate):
+            self.documents[event.collection] += event.count
+            if event.operation == OP_EXPIRE:
+                self.expired += event.count
+        else:
+            self.expired += event.expired or 0
+            self.batches += 1
+            self.batch_time += event.duration
+            for i, bound in enumerate(bounds):
+                if event.duration <= bound:
+                    self.buckets[i] += 1
+                    break
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
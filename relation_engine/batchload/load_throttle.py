@@ -0,0 +1,110 @@
+"""
+A throttle that limits the rate at which a delta load or rollback writes to the database, so that
+the load doesn't starve other queries against the database.
+
+A throttle is passed to delta_load.load_graph_delta or delta_load.roll_back_last_load, which call
+before_write before each write and lookup_complete after each lookup of extant documents. A
+throttle may be shared between loads and rollbacks that run concurrently to limit their combined
+write rate.
+
+All durations are in seconds.
+"""
+
+import threading as _threading
+import time as _time
+
+# the factor by which the backoff pause changes as lookups are slow or fast
+_BACKOFF_FACTOR = 2
+
+# the default maximum backoff pause
+DEFAULT_MAX_BACKOFF = 60
+
+class LoadThrottle:
+    """
+    Limits the rate of writes in documents and / or bytes per second, and pauses writes when
+    lookups are slow, which indicates the database is busy with other queries.
+
+    Writes are paced so that, over time, the rate does not exceed the limits; a single write
+    larger than the limits allow in a second is not split, but is followed by a correspondingly
+    long pause.
+
+    When a lookup takes longer than the maximum lookup latency, every subsequent write is
+    preceded by a pause that starts at the maximum lookup latency and doubles with each slow
+    lookup, up to the maximum backoff. Each fast lookup halves the pause until it is shorter
+    than the maximum lookup latency, at which point the pause stops.
+    """
+
+    def __init__(
+            self,
+            documents_per_second=None,
+            bytes_per_second=None,
+            max_lookup_latency=None,
+            max_backoff=DEFAULT_MAX_BACKOFF,
+            clock=None,
+            sleep=None):
+        """
+        documents_per_second - the maximum number of documents to write per second, or None for
+          no limit.
+        bytes_per_second - the maximum number of bytes to send to the database per second, or
+          None for no limit. The size of a write is the approximate size of its payload.
+        max_lookup_latency - the time above which a lookup is considered slow, or None to never
+          back off.
+        max_backoff - the maximum pause before each write while lookups are slow.
+        clock - a function returning a monotonic time. Defaults to time.monotonic.
+        sleep - a function that sleeps for the given time. Defaults to time.sleep.
+        """
+        for name, value in [('documents_per_second', documents_per_second),
+                            ('bytes_per_second', bytes_per_second),
+                            ('max_lookup_latency', max_lookup_latency)]:
+            if value is not None and value <= 0:
+                raise ValueError(f'{name} must be > 0')
+        if max_backoff <= 0:
+            raise ValueError('max_backoff must be > 0')
+        self.documents_per_second = documents_per_second
+        self.bytes_per_second = bytes_per_second
+        self.max_lookup_latency = max_lookup_latency
+        self._max_backoff = max_backoff
+        self._clock = clock or _time.monotonic
+        self._sleep = sleep or _time.sleep
+        # the time at which the next write may start
+        self._next_write = None
+        self._backoff = 0
+        self._lock = _threading.Lock()
+
+    def before_write(self, documents, size=None):
+        """
+        Wait until a write may start without exceeding the limits.
+
+        documents - the number of documents in the write.
+        size - the approximate size of the write in bytes. Required if bytes_per_second is set.
+        """
+        if self.bytes_per_second and size is None:
+            raise ValueError('The write size is required for a bytes per second limit')
+        cost = 0
+        if self.documents_per_second:
+            cost = documents / self.documents_per_second
+        if self.bytes_per_second:
+            cost = max(cost, size / self.bytes_per_second)
+        with self._lock:
+            now = self._clock()
+            start = now if self._next_write is None else max(now, self._next_write)
+            # the write is charged to the time after it starts, so writes run at the limit
+            self._next_write = start + cost
+            pause = start - now + self._backoff
+        if pause > 0:
+            self._sleep(pause)
+
+    def lookup_complete(self, duration):
+        """
+        Record the time taken by a lookup of extant documents in the database.
+        """
+        if not self.max_lookup_latency:
+            return
+        with self._lock:
+            if duration > self.max_lookup_latency:
+                self._backoff = min(self._max_backoff,
+                    max(self._backoff * _BACKOFF_FACTOR, self.max_lookup_latency))
+            else:
+                self._backoff /= _BACKOFF_FACTOR
+                if self._backoff < self.max_lookup_latency:
+                    self._backoff = 0
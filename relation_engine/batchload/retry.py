@@ -0,0 +1,135 @@
+"""
+A policy for retrying database requests that fail transiently, e.g. because the connection to the
+database was dropped or the database was briefly unavailable, so that a long load isn't aborted
+by a single failed request.
+
+A policy is passed to time_travelling_database.ArangoBatchTimeTravellingDB, which retries the
+requests that can safely be repeated. A policy may be shared between loads and rollbacks that
+run concurrently, in which case it counts their combined retries.
+
+All durations are in seconds.
+"""
+
+import random as _random
+import sys as _sys
+import threading as _threading
+import time as _time
+
+# the connection errors and timeouts raised by requests, python-arango's http client, which are
+# OSErrors but not ConnectionErrors or TimeoutErrors. requests is installed with python-arango.
+try:
+    import requests.exceptions as _requests_exceptions
+    import urllib3.exceptions as _urllib3_exceptions
+    _CLIENT_ERRORS = (
+        _requests_exceptions.ConnectionError,
+        _requests_exceptions.Timeout,
+        _urllib3_exceptions.ProtocolError,
+        _urllib3_exceptions.TimeoutError)
+except ImportError:
+    _CLIENT_ERRORS = ()
+
+# the default number of times a failed request is retried
+DEFAULT_MAX_RETRIES = 5
+# the default pause before the first retry. The pause doubles with each retry.
+DEFAULT_INITIAL_BACKOFF = 1
+# the default maximum pause before a retry
+DEFAULT_MAX_BACKOFF = 60
+
+# request timeout, too many requests, bad gateway, service unavailable, gateway timeout
+_TRANSIENT_HTTP_CODES = {408, 429, 502, 503, 504}
+# lock timeout, shutting down, write conflict, cluster timeout, cluster backend unavailable
+_TRANSIENT_ERROR_CODES = {18, 30, 1200, 1457, 1478}
+
+def is_transient(error):
+    """
+    Returns True if an exception raised by a database request indicates that the request may
+    succeed if it is retried.
+
+    Connection errors and timeouts, including those raised by the http client, and errors
+    returned by the database while it is busy or unavailable are transient. Other OSErrors, such
+    as a missing file, are not.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError) + _CLIENT_ERRORS):
+        return True
+    # python-arango's server errors have both codes, client errors have neither
+    return (getattr(error, 'http_code', None) in _TRANSIENT_HTTP_CODES or
+        getattr(error, 'error_code', None) in _TRANSIENT_ERROR_CODES)
+
+def print_retry(error, retry, pause):
+    """
+    An on_retry function for a RetryPolicy that prints the retry to stderr.
+    """
+    print(f'Retry {retry} in {pause:.1f}s after database request failed: {error!r}',
+        file=_sys.stderr)
+
+class RetryPolicy:
+    """
+    Retries operations that fail with a transient error, pausing before each retry for a random
+    time between zero and a backoff that starts at the initial backoff and doubles with each
+    retry, up to the maximum backoff. The random pauses keep concurrent writers that fail
+    together from retrying together.
+
+    Properties:
+    retries - the number of times operations have been retried.
+    """
+
+    def __init__(
+            self,
+            max_retries=DEFAULT_MAX_RETRIES,
+            initial_backoff=DEFAULT_INITIAL_BACKOFF,
+            max_backoff=DEFAULT_MAX_BACKOFF,
+            sleep=None,
+            random=None,
+            on_retry=None):
+        """
+        max_retries - the maximum number of times to retry an operation. 0 disables retries.
+        initial_backoff - the maximum pause before the first retry of an operation.
+        max_backoff - the maximum pause before any retry.
+        sleep - a function that sleeps for the given time. Defaults to time.sleep.
+        random - a function returning a random number in [0, 1). Defaults to random.random.
+        on_retry - a function called before each pause with the exception that caused the
+          retry, the number of the retry, starting at 1, and the pause.
+        """
+        if max_retries < 0:
+            raise ValueError('max_retries must be >= 0')
+        for name, value in [('initial_backoff', initial_backoff), ('max_backoff', max_backoff)]:
+            if value <= 0:
+                raise ValueError(f'{name} must be > 0')
+        self.max_retries = max_retries
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._sleep = sleep or _time.sleep
+        self._random = random or _random.random
+        self._on_retry = on_retry
+        self.retries = 0
+        self._lock = _threading.Lock()
+
+    def call(self, operation, replay=None):
+        """
+        Call an operation, retrying it if it fails with a transient error.
+
+        A request that fails may still have been applied by the database, e.g. if the
+        connection was dropped before the response was received, so only operations with the
+        same effect when repeated may be retried.
+
+        operation - the function to call.
+        replay - a function to call rather than the operation when retrying, for operations that
+          must be altered to be repeated.
+
+        Returns the result of the operation.
+        """
+        retry = 0
+        while True:
+            try:
+                return replay() if retry and replay else operation()
+            except Exception as e:
+                if retry >= self.max_retries or not is_transient(e):
+                    raise
+                retry += 1
+                with self._lock:
+                    self.retries += 1
+                backoff = min(self._max_backoff, self._initial_backoff * 2 ** (retry - 1))
+                pause = self._random() * backoff
+                if self._on_retry:
+                    self._on_retry(e, retry, pause)
+                self._sleep(pause)
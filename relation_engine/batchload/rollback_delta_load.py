@@ -9,6 +9,11 @@ from arango import ArangoClient
 from urllib.parse import urlparse
 
 from relation_engine.batchload.delta_load import roll_back_last_load
+from relation_engine.batchload.load_observers import PrometheusTextfileObserver
+from relation_engine.batchload.load_throttle import LoadThrottle
+from relation_engine.batchload.retry import DEFAULT_MAX_RETRIES
+from relation_engine.batchload.retry import RetryPolicy
+from relation_engine.batchload.retry import print_retry
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDBFactory
 
 
@@ -45,6 +50,26 @@ The most recent load will be removed.
         required=True,
         help='the name of the ArangoDB collection where loads are registered. ' +
             'This is typically the same collection for all delta loaded data.')
+    parser.add_argument(
+        '--max-documents-per-second',
+        type=float,
+        help='the maximum number of nodes and edges to write to the database per second.')
+    parser.add_argument(
+        '--max-mb-per-second',
+        type=float,
+        help='the maximum amount of data, in MiB, to send to the database per second.')
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help='the maximum number of times to retry a database request that fails transiently, ' +
+            'e.g. because the connection was dropped, with increasing backoff. Only requests ' +
+            f'that can safely be repeated are retried. Default {DEFAULT_MAX_RETRIES}.')
+    parser.add_argument(
+        '--prometheus-file',
+        help='the path to a file to which rollback metrics will be written in the Prometheus ' +
+            'text format, e.g. in the node exporter textfile collector directory. The file ' +
+            'name must end with .prom for the collector to read it.')
 
     return parser.parse_args()
 
@@ -62,9 +87,17 @@ def main():
         db = client.db(a.database, a.user, pwd, verify=True)
     else:
         db = client.db(a.database, verify=True)
-    fac = ArangoBatchTimeTravellingDBFactory(db, a.load_registry_collection)
+    retry = RetryPolicy(max_retries=a.max_retries, on_retry=print_retry)
+    fac = ArangoBatchTimeTravellingDBFactory(db, a.load_registry_collection, retry=retry)
+
+    throttle = None
+    if a.max_documents_per_second or a.max_mb_per_second:
+        throttle = LoadThrottle(
+            documents_per_second=a.max_documents_per_second,
+            bytes_per_second=a.max_mb_per_second * 1024 * 1024 if a.max_mb_per_second else None)
 
-    roll_back_last_load(fac, a.load_namespace)
+    observers = [PrometheusTextfileObserver(a.prometheus_file)] if a.prometheus_file else []
+    roll_back_last_load(fac, a.load_namespace, observers=observers, throttle=throttle)
 
 if __name__  == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,175 @@
+# Tests applying changesets using an arangodb database.
+
+# The changeset computation has its own tests that don't require a database.
+
+from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDB
+from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDBFactory
+from relation_engine.batchload.delta_load import load_graph_delta, roll_back_last_load
+from relation_engine.batchload.changeset import compute_changeset, read_changeset
+from relation_engine.batchload.changeset import apply_changeset
+from relation_engine.batchload.test.test_helpers import create_timetravel_collection
+from relation_engine.batchload.test.test_helpers import check_exception
+from arango import ArangoClient
+from pytest import fixture
+import io
+
+HOST = 'localhost'
+PORT = 8529
+DB_NAME = 'test_changeset_integration_db'
+
+@fixture
+def arango_db():
+    client = ArangoClient(protocol='http', host=HOST, port=PORT)
+    sys = client.db('_system', 'root', '', verify=True)
+    sys.delete_database(DB_NAME, ignore_missing=True)
+    sys.create_database(DB_NAME)
+    db = client.db(DB_NAME)
+
+    yield db
+
+    sys.delete_database(DB_NAME)
+
+def _old_sources(prefix):
+    v = [{'id': i, 'data': i} for i in ['same', 'change', 'remove', 'merge', 'target']]
+    e = [
+        {'id': 'same', 'from': 'same', 'to': 'target', 'data': 'x'},
+        {'id': 'change', 'from': 'same', 'to': 'target', 'data': 'x'},
+        {'id': 'vchange', 'from': 'change', 'to': 'same', 'data': 'x'},
+        {'id': 'remove', 'from': 'remove', 'to': 'same', 'data': 'x'},
+        {'id': 'same', 'from': 'target', 'to': 'same', 'data': 'x', '_collection': prefix + 'e1'},
+    ]
+    return v, e
+
+def _new_sources(prefix):
+    v = [{'id': 'same', 'data': 'same'}, {'id': 'change', 'data': 'changed'},
+         {'id': 'target', 'data': 'target'}, {'id': 'new', 'data': 'new'}]
+    e = [
+        {'id': 'same', 'from': 'same', 'to': 'target', 'data': 'x'},
+        {'id': 'change', 'from': 'same', 'to': 'target', 'data': 'y'},
+        {'id': 'vchange', 'from': 'change', 'to': 'same', 'data': 'x'},
+        {'id': 'new', 'from': 'new', 'to': 'same', 'data': 'x', '_collection': prefix + 'e1'},
+        {'id': 'same', 'from': 'target', 'to': 'same', 'data': 'x', '_collection': prefix + 'e1'},
+    ]
+    m = [{'id': 'merge', 'from': 'merge', 'to': 'target'}]
+    return v, e, m
+
+def _create_db(arango_db, prefix):
+    for c in ['v', 'e', 'e1', 'm']:
+        create_timetravel_collection(arango_db, prefix + c, edge=c != 'v')
+    arango_db.create_collection(prefix + 'r')
+    return ArangoBatchTimeTravellingDB(arango_db, prefix + 'r', prefix + 'v',
+        default_edge_collection=prefix + 'e', edge_collections=[prefix + 'e1'],
+        merge_collection=prefix + 'm')
+
+def _get_docs(arango_db, prefix):
+    """
+    Get the documents in all the collections with the collection names removed.
+    """
+    ret = {}
+    for c in ['v', 'e', 'e1', 'm']:
+        docs = []
+        for d in arango_db.collection(prefix + c).all():
+            del d['_rev']
+            for f in ['_id', '_from', '_to']:
+                if f in d:
+                    d[f] = d[f][len(prefix):]
+            docs.append(d)
+        ret[c] = sorted(docs, key=lambda d: d['_key'])
+    return ret
+
+def _compute(prefix):
+    ov, oe = _old_sources(prefix)
+    nv, ne, nm = _new_sources(prefix)
+    out = io.StringIO()
+    compute_changeset(ov, nv, oe, ne, out, merge_source=nm, partitions=1)
+    out.seek(0)
+    return read_changeset(out)
+
+def test_apply_changeset(arango_db):
+    _apply_changeset(arango_db)
+
+def test_apply_changeset_batch_1_pipelined_and_fingerprinted(arango_db):
+    _apply_changeset(arango_db, batch_size=1, pipeline_depth=2, fingerprint=True)
+
+def test_apply_changeset_untracked(arango_db):
+    _apply_changeset(arango_db, track_last_version=False)
+
+def test_apply_changeset_batch_1_untracked_and_pipelined(arango_db):
+    _apply_changeset(arango_db, batch_size=1, pipeline_depth=2, track_last_version=False)
+
+def _apply_changeset(arango_db, **load_args):
+    """
+    Test that applying a changeset has the same result as loading the new graph with
+    load_graph_delta, and that the load can be rolled back.
+    """
+    dbs = {}
+    for prefix in ['d_', 'c_']:
+        dbs[prefix] = _create_db(arango_db, prefix)
+        ov, oe = _old_sources(prefix)
+        load_graph_delta('ns', ov, oe, dbs[prefix], 100, 99, 'v1', **load_args)
+    v1docs = _get_docs(arango_db, 'c_')
+
+    nv, ne, nm = _new_sources('d_')
+    load_graph_delta('ns', nv, ne, dbs['d_'], 300, 299, 'v2', merge_source=nm, **load_args)
+    db = dbs['c_']
+    apply_changeset('ns', _compute('c_'), db, 300, 299, 'v2', **load_args)
+
+    assert _get_docs(arango_db, 'c_') == _get_docs(arango_db, 'd_')
+    assert [l['load_version'] for l in db.get_registered_loads('ns')] == ['v2', 'v1']
+    assert db.get_registered_loads('ns')[0]['state'] == 'complete'
+
+    roll_back_last_load(ArangoBatchTimeTravellingDBFactory(arango_db, 'c_r'), 'ns')
+
+    assert _get_docs(arango_db, 'c_') == v1docs
+
+def test_apply_changeset_chained_merges(arango_db):
+    _apply_changeset_chained_merges(arango_db)
+
+def test_apply_changeset_chained_merges_batch_1(arango_db):
+    _apply_changeset_chained_merges(arango_db, batch_size=1)
+
+def test_apply_changeset_chained_merges_batch_2(arango_db):
+    _apply_changeset_chained_merges(arango_db, batch_size=2)
+
+def _apply_changeset_chained_merges(arango_db, **load_args):
+    """
+    Test that applying a changeset with chained merges has the same result as loading the new
+    graph with load_graph_delta, whatever the batch size.
+    """
+    ov = [{'id': i, 'data': i} for i in 'abcde']
+    nv = [{'id': 'c', 'data': 'c'}]
+    merges = [
+        {'id': 'ab', 'from': 'a', 'to': 'b'},
+        {'id': 'bc', 'from': 'b', 'to': 'c'},
+        {'id': 'ac', 'from': 'a', 'to': 'c'},  # a is already merged
+        {'id': 'da', 'from': 'd', 'to': 'a'},  # a is merged
+        {'id': 'ed', 'from': 'e', 'to': 'd'},
+    ]
+    dbs = {}
+    for prefix in ['d_', 'c_']:
+        dbs[prefix] = _create_db(arango_db, prefix)
+        load_graph_delta('ns', ov, [], dbs[prefix], 100, 99, 'v1', **load_args)
+
+    load_graph_delta('ns', nv, [], dbs['d_'], 300, 299, 'v2', merge_source=merges, **load_args)
+    out = io.StringIO()
+    compute_changeset(ov, nv, [], [], out, merge_source=merges, partitions=1)
+    out.seek(0)
+    apply_changeset('ns', read_changeset(out), dbs['c_'], 300, 299, 'v2', **load_args)
+
+    docs = _get_docs(arango_db, 'c_')
+    assert docs == _get_docs(arango_db, 'd_')
+    assert [(m['_key'], m['_from'], m['_to']) for m in docs['m']] == [
+        ('ab_v2', 'v/a_v1', 'v/b_v1'),
+        ('bc_v2', 'v/b_v1', 'v/c_v1'),
+        ('ed_v2', 'v/e_v1', 'v/d_v1'),
+    ]
+    assert [v['id'] for v in docs['v'] if v['expired'] > 300] == ['c']
+
+def test_apply_changeset_fail_missing_document(arango_db):
+    """
+    Test that applying a changeset to a database that doesn't contain the old graph fails.
+    """
+    db = _create_db(arango_db, 'c_')
+
+    check_exception(lambda: apply_changeset('ns', _compute('c_'), db, 300, 299, 'v2'),
+        ValueError, 'Changeset document same does not exist in collection c_v at timestamp 300')
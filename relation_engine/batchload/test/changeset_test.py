@@ -0,0 +1,145 @@
+# Tests the changeset computation. These tests do not require a database.
+
+from relation_engine.batchload.changeset import compute_changeset, read_changeset
+from relation_engine.batchload.test.test_helpers import check_exception
+from collections import defaultdict
+import io
+import json
+
+def _sources():
+    old_v = [{'id': str(i), 'data': d} for i, d in enumerate('abcde', 1)]
+    new_v = [
+        {'id': '1', 'data': 'a'},   # unchanged
+        {'id': '2', 'data': 'b2'},  # changed
+        {'id': '3', 'data': 'c'},   # unchanged
+        {'id': '6', 'data': 'f'},   # new
+        # 4 is removed, 5 is removed and merged
+    ]
+    old_e = [
+        {'id': 'e1', 'from': '1', 'to': '3', 'data': 'x'},
+        {'id': 'e2', 'from': '2', 'to': '3', 'data': 'x'},
+        {'id': 'e3', 'from': '3', 'to': '1', 'data': 'x', '_collection': 'c'},
+        {'id': 'e4', 'from': '4', 'to': '1', 'data': 'x'},
+    ]
+    new_e = [
+        {'id': 'e1', 'from': '1', 'to': '3', 'data': 'x'},  # unchanged
+        {'id': 'e2', 'from': '2', 'to': '3', 'data': 'x'},  # vertex 2 changed
+        {'id': 'e3', 'from': '3', 'to': '1', 'data': 'y', '_collection': 'c'},  # changed
+        {'id': 'e3', 'from': '3', 'to': '1', 'data': 'x'},  # new, different collection
+        {'id': 'e5', 'from': '6', 'to': '1', 'data': 'x'},  # new
+        # e4 is removed
+    ]
+    merges = [
+        {'id': '5', 'from': '5', 'to': '3'},
+        {'id': '7', 'from': '7', 'to': '1'},  # 7 doesn't exist
+        {'id': '4', 'from': '4', 'to': '5'},  # 5 is merged before this merge
+    ]
+    return old_v, new_v, old_e, new_e, merges
+
+def _compute(partitions, tmp_path):
+    old_v, new_v, old_e, new_e, merges = _sources()
+    out = io.StringIO()
+    counts = compute_changeset(old_v, new_v, old_e, new_e, out, merge_source=merges,
+        partitions=partitions, temp_dir=str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+    out.seek(0)
+    return counts, list(read_changeset(out))
+
+def _v(op, id_=None, doc=None):
+    return {'op': op, 'kind': 'vertex', **({'doc': doc} if doc else {'id': id_})}
+
+def _e(op, col, id_=None, doc=None):
+    return {'op': op, 'kind': 'edge', 'collection': col,
+            **({'doc': doc} if doc else {'id': id_})}
+
+_EXPECTED_COUNTS = {
+    'vertex': {'create': 2, 'expire': 2, 'seen': 2},
+    'edge': {'create': 4, 'expire': 3, 'seen': 1},
+    'merge': 1,
+}
+
+def test_compute_changeset(tmp_path):
+    counts, ops = _compute(1, tmp_path)
+
+    assert counts == _EXPECTED_COUNTS
+    assert ops == [('vertices', o) for o in [
+        _v('seen', '1'),
+        _v('expire', '2'),
+        _v('create', doc={'id': '2', 'data': 'b2'}),
+        _v('seen', '3'),
+        _v('create', doc={'id': '6', 'data': 'f'}),
+    ]] + [
+        ('merges', {'op': 'merge', 'doc': {'id': '5', 'from': '5', 'to': '3'}}),
+        ('vertex_expiry', _v('expire', '4')),
+    ] + [('edges', o) for o in [
+        _e('seen', None, 'e1'),
+        _e('expire', None, 'e2'),
+        _e('create', None, doc={'id': 'e2', 'from': '2', 'to': '3', 'data': 'x'}),
+        _e('expire', 'c', 'e3'),
+        _e('create', 'c', doc={'id': 'e3', 'from': '3', 'to': '1', 'data': 'y'}),
+        _e('create', None, doc={'id': 'e3', 'from': '3', 'to': '1', 'data': 'x'}),
+        _e('create', None, doc={'id': 'e5', 'from': '6', 'to': '1', 'data': 'x'}),
+        _e('expire', None, 'e4'),
+    ]]
+
+def test_compute_changeset_partitioned(tmp_path):
+    _, expected = _compute(1, tmp_path)
+    counts, ops = _compute(7, tmp_path)
+
+    assert counts == _EXPECTED_COUNTS
+    assert [s for s, _ in ops] == [s for s, _ in expected]
+    def sections(ops):
+        # the order within each section depends on the partitioning
+        ret = defaultdict(list)
+        for s, o in ops:
+            ret[s].append(json.dumps(o, sort_keys=True))
+        return {s: sorted(o) for s, o in ret.items()}
+    assert sections(ops) == sections(expected)
+    # a changed document is expired before it's created
+    assert ops.index(('vertices', _v('expire', '2'))) + 1 == ops.index(
+        ('vertices', _v('create', doc={'id': '2', 'data': 'b2'})))
+
+def test_compute_changeset_chained_merges():
+    """
+    Test that a vertex is merged at most once and a merged vertex is never merged into.
+    """
+    old_v = [{'id': i} for i in 'abcde']
+    merges = [
+        {'id': 'ab', 'from': 'a', 'to': 'b'},
+        {'id': 'bc', 'from': 'b', 'to': 'c'},  # b was merged into, but isn't merged
+        {'id': 'ac', 'from': 'a', 'to': 'c'},  # a is already merged
+        {'id': 'da', 'from': 'd', 'to': 'a'},  # a is merged
+        {'id': 'ed', 'from': 'e', 'to': 'd'},
+    ]
+    out = io.StringIO()
+    counts = compute_changeset(old_v, [{'id': 'c'}], [], [], out, merge_source=iter(merges))
+    out.seek(0)
+
+    assert counts['merge'] == 3
+    assert [o for s, o in read_changeset(out) if s != 'vertices'] == [
+        {'op': 'merge', 'doc': {'id': 'ab', 'from': 'a', 'to': 'b'}},
+        {'op': 'merge', 'doc': {'id': 'bc', 'from': 'b', 'to': 'c'}},
+        {'op': 'merge', 'doc': {'id': 'ed', 'from': 'e', 'to': 'd'}},
+        _v('expire', 'd'),
+    ]
+
+def test_compute_changeset_fail_bad_partitions():
+    old_v, new_v, old_e, new_e, _ = _sources()
+    check_exception(lambda: compute_changeset(old_v, new_v, old_e, new_e, io.StringIO(),
+        partitions=0), ValueError, 'partitions must be >= 1')
+
+def test_read_changeset_fail_bad_header():
+    for header in ['', 'foo\n', '[]\n', '{"format": "foo"}\n']:
+        check_exception(lambda: read_changeset(io.StringIO(header + '{}\n')), ValueError,
+            'Input is not a changeset')
+    check_exception(lambda: read_changeset(
+        io.StringIO('{"format": "delta_load_changeset", "version": 2}\n')), ValueError,
+        'Unsupported changeset version: 2')
+
+def test_read_changeset_fail_bad_section():
+    header = '{"format": "delta_load_changeset", "version": 1}\n'
+    for ops, err in [('{"section": "foo"}\n', 'Unknown changeset section: foo'),
+                     ('{"op": "seen", "kind": "vertex", "id": "1"}\n',
+                      'Changeset operation is not in a section')]:
+        check_exception(lambda: list(read_changeset(io.StringIO(header + ops))), ValueError,
+            err)
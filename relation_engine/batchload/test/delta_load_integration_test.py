@@ -11,10 +11,15 @@
 
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDB
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDBFactory
+from relation_engine.batchload.time_travelling_database import BatchUpdater
 from relation_engine.batchload.delta_load import load_graph_delta, roll_back_last_load
+from relation_engine.batchload.delta_load import _fingerprint, ID_ORDER_STRING
+from relation_engine.batchload import load_observers as obs
+from relation_engine.batchload.load_throttle import LoadThrottle
 from relation_engine.batchload.test.test_helpers import create_timetravel_collection
 from relation_engine.batchload.test.test_helpers import check_docs, check_exception
 from arango import ArangoClient
+import copy
 import datetime
 from pytest import fixture
 
@@ -61,10 +66,378 @@ def test_load_no_merge_source_batch_2(arango_db):
 def test_load_no_merge_source_batch_default(arango_db):
     _load_no_merge_source(arango_db, None)
 
-def _load_no_merge_source(arango_db, batchsize):
+def test_load_no_merge_source_batch_1_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 1, pipeline_depth=3)
+
+def test_load_no_merge_source_batch_2_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 2, pipeline_depth=1)
+
+def test_load_no_merge_source_batch_1_partitioned(arango_db):
+    _load_no_merge_source(arango_db, 1, partitions=3)
+
+def test_load_no_merge_source_batch_2_partitioned_and_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 2, partitions=2, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_fingerprinted(arango_db):
+    _load_no_merge_source(arango_db, 2, fingerprint=True)
+
+def test_load_no_merge_source_batch_2_prefiltered(arango_db):
+    _load_no_merge_source(arango_db, 2, prefilter=True)
+
+def test_load_no_merge_source_batch_1_prefiltered_partitioned_and_fingerprinted(arango_db):
+    _load_no_merge_source(arango_db, 1, prefilter=True, partitions=2, fingerprint=True)
+
+def test_load_no_merge_source_batch_2_incremental_expiry(arango_db):
+    _load_no_merge_source(arango_db, 2, incremental_expiry=True)
+
+def test_load_no_merge_source_batch_1_incremental_expiry_and_resumed_in_edges(arango_db):
+    _load_no_merge_source(arango_db, 1, fail_after=(None, 3), incremental_expiry=True)
+
+def test_load_no_merge_source_batch_2_untracked(arango_db):
+    _load_no_merge_source(arango_db, 2, track_last_version=False)
+
+def test_load_no_merge_source_batch_1_untracked_partitioned_and_pipelined(arango_db):
+    _load_no_merge_source(
+        arango_db, 1, track_last_version=False, partitions=2, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_adaptive(arango_db):
+    # the batches grow toward the target latency
+    _load_no_merge_source(arango_db, 2, target_batch_latency=10)
+
+def test_load_no_merge_source_batch_2_adaptive_to_memory_and_pipelined(arango_db):
+    # the process is always over the limit, so the batches never grow toward the target
+    _load_no_merge_source(
+        arango_db, 2, target_batch_latency=10, max_rss=1, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_1_adaptive_and_resumed_in_edges(arango_db):
+    _load_no_merge_source(arango_db, 1, fail_after=(None, 3), target_batch_latency=10)
+
+def test_load_no_merge_source_batch_2_throttled(arango_db):
+    _load_no_merge_source(arango_db, 2, throttle=LoadThrottle(
+        documents_per_second=1000, bytes_per_second=10**6, max_lookup_latency=10))
+
+def test_load_no_merge_source_batch_1_throttled_partitioned_and_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 1, throttle=LoadThrottle(documents_per_second=1000),
+        partitions=2, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_auto_flushed(arango_db):
+    _load_no_merge_source(arango_db, 2, flush_size=1)
+
+def test_load_no_merge_source_batch_2_auto_flushed_and_observed(arango_db):
+    _load_no_merge_source_observed(arango_db, flush_bytes=200)
+
+def test_load_no_merge_source_batch_2_auto_flushed_and_throttled(arango_db):
+    _load_no_merge_source(arango_db, 2, flush_size=1,
+        throttle=LoadThrottle(documents_per_second=1000, bytes_per_second=10**6))
+
+def test_load_no_merge_source_batch_1_auto_flushed_partitioned_and_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 1, flush_size=2, partitions=2, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_uncached(arango_db):
+    _load_no_merge_source(arango_db, 2, cache_vertices=False)
+
+def test_load_no_merge_source_batch_1_sorted(arango_db):
+    _load_no_merge_source(arango_db, 1, id_order=ID_ORDER_STRING)
+
+def test_load_no_merge_source_batch_2_sorted_and_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 2, id_order=ID_ORDER_STRING, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_sorted_and_fingerprinted(arango_db):
+    _load_no_merge_source(arango_db, 2, id_order=ID_ORDER_STRING, fingerprint=True)
+
+def test_load_no_merge_source_batch_2_server_side(arango_db):
+    _load_no_merge_source(arango_db, 2, server_side=True)
+
+def test_load_no_merge_source_batch_default_server_side_and_fingerprinted(arango_db):
+    _load_no_merge_source(arango_db, None, server_side=True, fingerprint=True)
+
+def test_load_no_merge_source_batch_2_dry_run_first(arango_db):
+    _load_no_merge_source(arango_db, 2, dry_run_first=True)
+
+def test_load_no_merge_source_batch_1_dry_run_first_partitioned_and_pipelined(arango_db):
+    _load_no_merge_source(arango_db, 1, dry_run_first=True, partitions=2, pipeline_depth=2)
+
+def test_load_no_merge_source_batch_2_resumed_in_vertices(arango_db):
+    _load_no_merge_source(arango_db, 2, fail_after=(3, None))
+
+def test_load_no_merge_source_batch_1_pipelined_and_resumed_in_edges(arango_db):
+    _load_no_merge_source(arango_db, 1, fail_after=(None, 3), pipeline_depth=2)
+
+def test_load_no_merge_source_batch_1_partitioned_and_resumed_in_edges(arango_db):
+    _load_no_merge_source(arango_db, 1, fail_after=(None, 2), partitions=2)
+
+def test_load_no_merge_source_batch_2_observed(arango_db):
+    _load_no_merge_source_observed(arango_db)
+
+def test_load_no_merge_source_batch_2_observed_and_pipelined(arango_db):
+    _load_no_merge_source_observed(arango_db, pipeline_depth=2)
+
+class _RecordingObserver:
+
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event):
+        self.events.append(event)
+
+def _load_no_merge_source_observed(arango_db, **load_args):
+    """
+    Test that the events observed for a load match the load.
+    """
+    o = _RecordingObserver()
+    _load_no_merge_source(arango_db, 2, observers=[o], **load_args)
+    events = o.events
+
+    assert events[0] == obs.LoadStart('ns', 'v2')
+    assert type(events[-1]) == obs.LoadEnd
+    assert events[-1][:2] == ('ns', 'v2')
+
+    phases = [(type(e), e.phase) for e in events if type(e) in (obs.PhaseStart, obs.PhaseEnd)]
+    assert phases == [
+        (obs.PhaseStart, 'vertices'), (obs.PhaseEnd, 'vertices'),
+        (obs.PhaseStart, 'vertex_expiry'), (obs.PhaseEnd, 'vertex_expiry'),
+        (obs.PhaseStart, 'edges'), (obs.PhaseEnd, 'edges'),
+        (obs.PhaseStart, 'edge_expiry'), (obs.PhaseEnd, 'edge_expiry'),
+    ]
+
+    for phase, counts in [('vertices', (3, 2, 2)), ('edges', (4, 3, 1))]:
+        for etype in [obs.BatchStart, obs.BatchLookup, obs.BatchEnd]:
+            batches = [(e.batch, e.size) for e in events if type(e) == etype and e.phase == phase]
+            assert sorted(batches) == [(1, 2), (2, 2), (3, 1)]
+        ends = [e for e in events if type(e) == obs.BatchEnd and e.phase == phase]
+        assert tuple(sum(e[i] for e in ends) for i in (3, 4, 5)) == counts
+        imports = [e for e in events if type(e) == obs.BulkImport and e.phase == phase]
+        assert sum(e.count for e in imports) == sum(counts)
+        assert all(e.payload_size + e.key_update_size > 0 for e in imports if e.count)
+        # each phase both creates documents and expires or updates extant documents
+        assert sum(e.payload_size for e in imports) > 0
+        assert sum(e.key_update_size for e in imports) > 0
+
+    updates = [e for e in events if type(e) == obs.CollectionUpdate]
+    assert updates == [
+        obs.CollectionUpdate('vertex_expiry', 'v', 'expire', 3),
+        obs.CollectionUpdate('edge_expiry', 'def_e', 'expire', 2),
+        obs.CollectionUpdate('edge_expiry', 'e1', 'expire', 1),
+        obs.CollectionUpdate('edge_expiry', 'e2', 'expire', 2),
+    ]
+
+def _dry_run_no_merge_source(arango_db, db, vsource, esource, batchsize, **load_args):
+    """
+    Check that a dry run of the load in _load_no_merge_source reports the updates the load
+    will make and doesn't alter the database.
+    """
+    cols = ['v', 'def_e', 'e1', 'e2', 'r']
+    docs = {c: sorted(arango_db.collection(c).all(), key=lambda d: d['_key']) for c in cols}
+
+    report = load_graph_delta('ns', copy.deepcopy(vsource), copy.deepcopy(esource), db, 500, 400,
+        'v2', batch_size=batchsize, dry_run=True, **load_args)
+
+    assert {c: sorted(arango_db.collection(c).all(), key=lambda d: d['_key'])
+            for c in cols} == docs
+    assert all(r.pop('bytes') > 0 for r in report.values())
+    assert report == {
+        'v': {'created': 3, 'expired': 3, 'unchanged': 2},
+        'def_e': {'created': 2, 'expired': 2, 'unchanged': 0},
+        'e1': {'created': 0, 'expired': 1, 'unchanged': 1},
+        'e2': {'created': 2, 'expired': 2, 'unchanged': 0},
+    }
+
+class _SourceFailure(Exception):
+    pass
+
+class _FailingSource:
+    """
+    A source that fails after producing a number of nodes or edges.
+    """
+
+    def __init__(self, items, count):
+        self._items = items
+        self._count = count
+
+    def __iter__(self):
+        for i, item in enumerate(copy.deepcopy(self._items)):
+            if i == self._count:
+                raise _SourceFailure('source failed')
+            yield item
+
+def _fail_no_merge_source(db, vsource, esource, batchsize, fail_after, **load_args):
+    """
+    Start the load in _load_no_merge_source with sources that fail and check that the load is
+    left in progress.
+    """
+    vfail, efail = fail_after
+    if vfail is not None:
+        vsource = _FailingSource(vsource, vfail)
+    if efail is not None:
+        esource = _FailingSource(esource, efail)
+
+    check_exception(lambda: load_graph_delta('ns', vsource, copy.deepcopy(esource), db, 500, 400,
+        'v2', batch_size=batchsize, **load_args), _SourceFailure, 'source failed')
+
+    load = db.get_registered_loads('ns')[0]
+    assert load['state'] == 'in_progress'
+    adaptive = 'target_batch_latency' in load_args or 'max_rss' in load_args
+    assert load['checkpoint']['batch_size'] == (None if adaptive else batchsize)
+    if efail is not None:
+        assert load['checkpoint']['complete_phases'] == ['vertices', 'vertex_expiry']
+
+class _SortedSource(list):
+    """
+    A list of nodes or edges that declares it is sorted by ID.
+    """
+
+    def __init__(self, items, id_order):
+        super().__init__(sorted(items, key=lambda i: i['id']))
+        self.id_order = id_order
+
+def test_load_fail_unsorted_source(arango_db):
+    """
+    Tests that the algorithm fails if a source that declares it is sorted is not.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    vsource = _SortedSource([], ID_ORDER_STRING)
+    vsource.extend([{'id': 'b', 'data': 'foo'}, {'id': 'a', 'data': 'bar'}])
+
+    check_exception(lambda: load_graph_delta('ns', vsource, [], att, 1, 1, "2"),
+        ValueError, 'Source for collection v is not sorted by ID in the declared order: ' +
+        'a does not follow the prior ID')
+
+def test_load_fail_bad_partitions(arango_db):
+    """
+    Tests that the algorithm fails to start if the partition count is less than 1.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    check_exception(lambda: load_graph_delta('ns', [], [], att, 1, 1, "2", partitions=0),
+        ValueError, 'partitions must be >= 1')
+
+def test_load_fail_bad_pipeline_depth(arango_db):
+    """
+    Tests that the algorithm fails to start if the pipeline depth is negative.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    check_exception(lambda: load_graph_delta('ns', [], [], att, 1, 1, "2", pipeline_depth=-1),
+        ValueError, 'pipeline_depth must be >= 0')
+
+def test_load_fail_bad_batch_sizing(arango_db):
+    """
+    Tests that the algorithm fails to start if the target batch latency, max RSS, or flush
+    limits are not positive.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    check_exception(lambda: load_graph_delta(
+            'ns', [], [], att, 1, 1, "2", target_batch_latency=0),
+        ValueError, 'target_batch_latency must be > 0')
+    check_exception(lambda: load_graph_delta('ns', [], [], att, 1, 1, "2", max_rss=-1),
+        ValueError, 'max_rss must be > 0')
+    check_exception(lambda: load_graph_delta('ns', [], [], att, 1, 1, "2", flush_size=0),
+        ValueError, 'flush_size must be > 0')
+    check_exception(lambda: load_graph_delta('ns', [], [], att, 1, 1, "2", flush_bytes=-1),
+        ValueError, 'flush_bytes must be > 0')
+
+def test_load_fail_server_side_pipelined(arango_db):
+    """
+    Tests that the algorithm fails to start if a server side load is pipelined, partitioned,
+    dry run, untracked, or throttled.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    for args in [{'pipeline_depth': 1}, {'partitions': 2}]:
+        check_exception(lambda: load_graph_delta(
+                'ns', [], [], att, 1, 1, "2", server_side=True, **args),
+            ValueError, 'Server side loads cannot be pipelined or partitioned')
+    check_exception(lambda: load_graph_delta(
+            'ns', [], [], att, 1, 1, "2", server_side=True, dry_run=True),
+        ValueError, 'Server side loads cannot be dry run')
+    check_exception(lambda: load_graph_delta(
+            'ns', [], [], att, 1, 1, "2", server_side=True, track_last_version=False),
+        ValueError, 'Server side loads must track the last version')
+    check_exception(lambda: load_graph_delta(
+            'ns', [], [], att, 1, 1, "2", server_side=True, throttle=LoadThrottle()),
+        ValueError, 'Server side loads cannot be throttled')
+
+def test_load_fail_resume_untracked(arango_db):
+    """
+    Test that loads that don't track the last version can't be resumed.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    check_exception(lambda: load_graph_delta(
+            'ns', [], [], att, 1, 1, "2", resume=True, track_last_version=False),
+        ValueError, 'Loads that do not track the last version cannot be resumed')
+
+def test_load_merges_resumed_between_updaters(arango_db, monkeypatch):
+    """
+    Test resuming a load that failed after writing the merge edges for a batch but before
+    expiring the merged vertices.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    create_timetravel_collection(arango_db, 'm', edge=True)
+    arango_db.create_collection('r')
+    _import_bulk(vcol, [{'id': i, 'data': i} for i in 'abcd'],
+        100, ADB_MAX_TIME, 99, ADB_MAX_TIME, 'v1')
+    att = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e',
+        merge_collection='m')
+    vsource = [{'id': i, 'data': i} for i in 'abcd']
+    merges = [{'id': 'ab', 'from': 'a', 'to': 'b'}, {'id': 'cd', 'from': 'c', 'to': 'd'}]
+
+    update = BatchUpdater.update
+    def fail_expiry(bulk):
+        # the vertices are unchanged, so only merged vertices are expired
+        if bulk.get_collection() == 'v' and bulk.count_by_type()[1]:
+            raise ValueError('expiry failed')
+        update(bulk)
+    monkeypatch.setattr(BatchUpdater, 'update', fail_expiry)
+    check_exception(lambda: load_graph_delta('ns', vsource, [], att, 500, 400, 'v2',
+            merge_source=merges, batch_size=1),
+        ValueError, 'expiry failed')
+    assert [m['_key'] for m in arango_db.collection('m').all()] == ['ab_v2']
+
+    monkeypatch.undo()
+    load_graph_delta('ns', vsource, [], att, 500, 400, 'v2', merge_source=merges, batch_size=1,
+        resume=True)
+    assert sorted(m['_key'] for m in arango_db.collection('m').all()) == ['ab_v2', 'cd_v2']
+    assert {v['id']: v['expired'] for v in arango_db.collection('v').all()} == {
+        'a': 499, 'b': ADB_MAX_TIME, 'c': 499, 'd': ADB_MAX_TIME}
+
+def _load_no_merge_source(arango_db, batchsize, id_order=None, dry_run_first=False,
+        fail_after=None, **load_args):
     """
     Test delta loading a small graph, including deleted, updated, unchanged, and new nodes and
     edges.
+    If id_order is provided, the sources are sorted by ID and declare that order.
+    If dry_run_first is True, the load is dry run prior to the load and the dry run report is
+    checked.
+    If fail_after is provided, it is a tuple of the number of vertices and edges after which the
+    respective source fails, or None for a source that does not fail. The load is started with
+    the failing sources and then resumed.
     """
     vcol = create_timetravel_collection(arango_db, 'v')
     def_ecol = create_timetravel_collection(arango_db, 'def_e', edge=True)
@@ -145,13 +518,25 @@ def _load_no_merge_source(arango_db, batchsize):
         {'_collection': 'def_e', 'id': 'gap', 'from': 'gap', 'to': 'same1', 'data': 'bar'}
     ]
 
+    if id_order:
+        vsource = _SortedSource(vsource, id_order)
+        esource = _SortedSource(esource, id_order)
+
     db = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='def_e',
             edge_collections=['e1', 'e2'])
     
+    if dry_run_first:
+        _dry_run_no_merge_source(arango_db, db, vsource, esource, batchsize, **load_args)
+
+    if fail_after:
+        _fail_no_merge_source(db, vsource, esource, batchsize, fail_after, **load_args)
+        load_args['resume'] = True
+
     if batchsize:
-        load_graph_delta('ns', vsource, esource, db, 500, 400, 'v2', batch_size=batchsize)
+        load_graph_delta('ns', vsource, esource, db, 500, 400, 'v2', batch_size=batchsize,
+            **load_args)
     else: 
-        load_graph_delta('ns', vsource, esource, db, 500, 400, 'v2')
+        load_graph_delta('ns', vsource, esource, db, 500, 400, 'v2', **load_args)
 
     vexpected = [
         {'id': 'expire', '_key': 'expire_v0', '_id': 'v/expire_v0',
@@ -186,6 +571,8 @@ def _load_no_merge_source(arango_db, batchsize):
          'release_created': 400, 'release_expired': ADB_MAX_TIME, 'data': ['old', 'data1']},
     ]
 
+    _add_fingerprints(vexpected, 'v2', load_args)
+    _untrack_last_versions(vexpected, 'v2', 'v1', load_args)
     check_docs(arango_db, vexpected, 'v')
 
     def_e_expected = [
@@ -215,6 +602,8 @@ def _load_no_merge_source(arango_db, batchsize):
          'release_created': 400, 'release_expired': ADB_MAX_TIME, 'data': 'bar'},
     ]
 
+    _add_fingerprints(def_e_expected, 'v2', load_args)
+    _untrack_last_versions(def_e_expected, 'v2', 'v1', load_args)
     check_docs(arango_db, def_e_expected, 'def_e')
 
     e1_expected = [
@@ -228,6 +617,8 @@ def _load_no_merge_source(arango_db, batchsize):
          'release_created': 99, 'release_expired': ADB_MAX_TIME, 'data': 'bing'},
     ]
 
+    _add_fingerprints(e1_expected, 'v2', load_args)
+    _untrack_last_versions(e1_expected, 'v2', 'v1', load_args)
     check_docs(arango_db, e1_expected, 'e1')
 
     e2_expected = [
@@ -249,6 +640,8 @@ def _load_no_merge_source(arango_db, batchsize):
          'release_created': 400, 'release_expired': ADB_MAX_TIME, 'data': 'boof'},
     ]
 
+    _add_fingerprints(e2_expected, 'v2', load_args)
+    _untrack_last_versions(e2_expected, 'v2', 'v1', load_args)
     check_docs(arango_db, e2_expected, 'e2')
 
     registry_expected = {
@@ -265,11 +658,31 @@ def _load_no_merge_source(arango_db, batchsize):
         'merge_collection': None, 
         'edge_collections': ['def_e', 'e1', 'e2']
     }
+    if load_args.get('track_last_version') is False:
+        registry_expected['track_last_version'] = False
 
     _check_registry_doc(arango_db, registry_expected, 'r', compare_times_to_now=True)
 
 
 def test_merge_edges(arango_db):
+    _merge_edges(arango_db)
+
+def test_merge_edges_uncached(arango_db):
+    _merge_edges(arango_db, cache_vertices=False)
+
+def test_merge_edges_prefiltered(arango_db):
+    _merge_edges(arango_db, prefilter=True)
+
+def test_merge_edges_incremental_expiry(arango_db):
+    _merge_edges(arango_db, incremental_expiry=True)
+
+def test_merge_edges_auto_flushed(arango_db):
+    _merge_edges(arango_db, flush_size=1)
+
+def test_merge_edges_server_side(arango_db):
+    _merge_edges(arango_db, server_side=True)
+
+def _merge_edges(arango_db, **load_args):
     """
     Test that merge edges are handled appropriately.
     """
@@ -314,7 +727,8 @@ def test_merge_edges(arango_db):
     db = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e',
             merge_collection='m')
     
-    load_graph_delta('mns', vsource, esource, db, 500, 400, 'v2', merge_source=msource)
+    load_graph_delta('mns', vsource, esource, db, 500, 400, 'v2', merge_source=msource,
+        **load_args)
 
     vexpected = [
         {'id': 'root', '_key': 'root_v1', '_id': 'v/root_v1',
@@ -369,6 +783,58 @@ def test_merge_edges(arango_db):
 
     _check_registry_doc(arango_db, registry_expected, 'r', compare_times_to_now=True)
 
+def test_load_fingerprinted_reload(arango_db):
+    """
+    Test that fingerprints stored in a load are used to detect changes in the next load.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+
+    db = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    load_graph_delta('fns',
+        [{'id': 'same', 'data': 'foo'}, {'id': 'up', 'data': 'bar'}],
+        [{'id': 'e', 'from': 'same', 'to': 'up', 'data': 'baz'}],
+        db, 100, 99, 'v1', fingerprint=True)
+
+    load_graph_delta('fns',
+        [{'id': 'same', 'data': 'foo'}, {'id': 'up', 'data': 'bar2'}],
+        [{'id': 'e', 'from': 'same', 'to': 'up', 'data': 'baz'}],
+        db, 500, 400, 'v2', fingerprint=True)
+
+    vexpected = [
+        {'id': 'same', '_key': 'same_v1', '_id': 'v/same_v1',
+         'first_version': 'v1', 'last_version': 'v2', 'created': 100, 'expired': ADB_MAX_TIME,
+         'release_created': 99, 'release_expired': ADB_MAX_TIME, 'data': 'foo'},
+        {'id': 'up', '_key': 'up_v1', '_id': 'v/up_v1',
+         'first_version': 'v1', 'last_version': 'v1', 'created': 100, 'expired': 499,
+         'release_created': 99, 'release_expired': 399, 'data': 'bar'},
+        {'id': 'up', '_key': 'up_v2', '_id': 'v/up_v2',
+         'first_version': 'v2', 'last_version': 'v2', 'created': 500, 'expired': ADB_MAX_TIME,
+         'release_created': 400, 'release_expired': ADB_MAX_TIME, 'data': 'bar2'},
+    ]
+    for d in vexpected:
+        d['fingerprint'] = _fingerprint(d)
+
+    check_docs(arango_db, vexpected, 'v')
+
+    # the edge is unchanged but the vertex it points to is updated
+    eexpected = [
+        {'id': 'e', 'from': 'same', 'to': 'up',
+         '_key': 'e_v1', '_id': 'e/e_v1', '_from': 'v/same_v1', '_to': 'v/up_v1',
+         'first_version': 'v1', 'last_version': 'v1', 'created': 100, 'expired': 499,
+         'release_created': 99, 'release_expired': 399, 'data': 'baz'},
+        {'id': 'e', 'from': 'same', 'to': 'up',
+         '_key': 'e_v2', '_id': 'e/e_v2', '_from': 'v/same_v1', '_to': 'v/up_v2',
+         'first_version': 'v2', 'last_version': 'v2', 'created': 500, 'expired': ADB_MAX_TIME,
+         'release_created': 400, 'release_expired': ADB_MAX_TIME, 'data': 'baz'},
+    ]
+    for d in eexpected:
+        d['fingerprint'] = _fingerprint(d)
+
+    check_docs(arango_db, eexpected, 'e')
+
 ######################################
 # Rollback tests
 ######################################
@@ -390,6 +856,14 @@ def test_rollback_fail_nothing_to_roll_back(arango_db):
         'Nothing to roll back')
 
 def test_rollback_with_merge_collection(arango_db):
+    _rollback_with_merge_collection(arango_db)
+
+def test_rollback_with_merge_collection_throttled(arango_db):
+    # batches of 1 document
+    _rollback_with_merge_collection(arango_db,
+        throttle=LoadThrottle(documents_per_second=1000, bytes_per_second=10**6), batch_size=1)
+
+def _rollback_with_merge_collection(arango_db, **rollback_args):
     """
     Test rolling back a load including a merge collection.
     """
@@ -433,7 +907,7 @@ def test_rollback_with_merge_collection(arango_db):
 
     fac = ArangoBatchTimeTravellingDBFactory(arango_db, 'r')
 
-    roll_back_last_load(fac, 'ns1')
+    roll_back_last_load(fac, 'ns1', **rollback_args)
 
     vexpected = [
         {'id': '1', '_key': '1_v1', '_id': 'v/1_v1',
@@ -534,7 +1008,8 @@ def test_rollback_without_merge_collection(arango_db):
 
     fac = ArangoBatchTimeTravellingDBFactory(arango_db, 'r')
 
-    roll_back_last_load(fac, 'ns1')
+    o = _RecordingObserver()
+    roll_back_last_load(fac, 'ns1', observers=[o])
 
     vexpected = [
         {'id': '1', '_key': '1_v1', '_id': 'v/1_v1',
@@ -584,10 +1059,73 @@ def test_rollback_without_merge_collection(arango_db):
 
     _check_registry_doc(arango_db, registry_expected, 'r')
 
+    events = o.events
+    assert events[0] == obs.RollbackStart('ns1', 'v2')
+    assert type(events[-1]) == obs.RollbackEnd
+    assert events[-1][:2] == ('ns1', 'v2')
+    updates = [e for e in events if type(e) == obs.CollectionUpdate]
+    assert updates == [
+        obs.CollectionUpdate('rollback_delete', 'e', 'delete', 2),
+        obs.CollectionUpdate('rollback_delete', 'v', 'delete', 2),
+        obs.CollectionUpdate('rollback_unexpire', 'e', 'unexpire', 2),
+        obs.CollectionUpdate('rollback_unexpire', 'v', 'unexpire', 2),
+        obs.CollectionUpdate('rollback_last_version', 'e', 'set_last_version', 1),
+        obs.CollectionUpdate('rollback_last_version', 'v', 'set_last_version', 1),
+    ]
+
+def test_rollback_untracked(arango_db):
+    """
+    Test that rolling back a load that doesn't track the last version restores the prior load
+    without resetting the last version.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('r')
+    db = ArangoBatchTimeTravellingDB(arango_db, 'r', 'v', default_edge_collection='e')
+
+    vsource = [{'id': '1', 'k': '1'}, {'id': '2', 'k': '2'}, {'id': '3', 'k': '3'}]
+    esource = [{'id': '1', 'from': '1', 'to': '2'}, {'id': '2', 'from': '2', 'to': '3'}]
+    load_graph_delta('ns', vsource, esource, db, 100, 99, 'v1')
+    vexpected, eexpected = [[{k: v for k, v in d.items() if k != '_rev'}
+                             for d in arango_db.collection(c).all()] for c in ['v', 'e']]
+
+    load_graph_delta('ns', [{'id': '1', 'k': '1'}, {'id': '2', 'k': 'changed'}],
+        [{'id': '1', 'from': '1', 'to': '2'}], db, 300, 299, 'v2', track_last_version=False)
+
+    assert arango_db.collection('v').get('1_v1')['last_version'] == 'v1'
+    assert arango_db.collection('v').get('1_v1')['expired'] == ADB_MAX_TIME
+    assert arango_db.collection('v').get('3_v1')['expired'] == 299
+    assert arango_db.collection('e').get('2_v1')['expired'] == 299
+    assert db.get_registered_loads('ns')[0]['track_last_version'] is False
+
+    o = _RecordingObserver()
+    roll_back_last_load(ArangoBatchTimeTravellingDBFactory(arango_db, 'r'), 'ns', observers=[o])
+
+    check_docs(arango_db, vexpected, 'v')
+    check_docs(arango_db, eexpected, 'e')
+    assert [e.phase for e in o.events if type(e) == obs.PhaseStart] == [
+        'rollback_delete', 'rollback_unexpire']
+
 ######################################
 # Helper funcs
 ######################################
 
+def _add_fingerprints(expected, load_version, load_args):
+    if load_args.get('fingerprint'):
+        for d in expected:
+            if d['first_version'] == load_version:
+                d['fingerprint'] = _fingerprint(d)
+
+def _untrack_last_versions(expected, load_version, prior_version, load_args):
+    """
+    Revert the last version of the documents that are unchanged in a load if the load doesn't
+    track the last version.
+    """
+    if load_args.get('track_last_version') is False:
+        for d in expected:
+            if d['last_version'] == load_version and d['first_version'] != load_version:
+                d['last_version'] = prior_version
+
 # modifies docs in place!
 # vert_col_name != None implies an edge
 def _import_bulk(
@@ -0,0 +1,177 @@
+# Tests the parts of the delta loader that do not require a database.
+
+import time
+
+from relation_engine.batchload import delta_load
+from relation_engine.batchload import load_observers as obs
+from relation_engine.batchload.load_throttle import LoadThrottle
+
+class _Events:
+
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event):
+        self.events.append(event)
+
+def _sizer(target_latency=None, max_rss=None, rss=None):
+    events = _Events()
+    rss = rss if rss is not None else []
+    sizer = delta_load._BatchSizer(events, 'vertices', 'v', 1000, target_latency, max_rss,
+        get_rss=lambda: rss[0] if rss else None)
+    return sizer, events
+
+def test_batch_sizer_fixed():
+    sizer, events = _sizer()
+    sizer.add_latency(delta_load._LATENCY_WRITE, 1000, 100)
+    assert [sizer.next_size() for _ in range(3)] == [1000, 1000, 1000]
+    assert events.events == []
+
+def test_batch_sizer_latency():
+    sizer, events = _sizer(target_latency=1)
+    # no change until a batch is written
+    sizer.add_latency(delta_load._LATENCY_LOOKUP, 1000, 0)
+    assert sizer.next_size() == 1000
+
+    # 0.1 ms per document -> 10000 documents per second, reached by at most doubling per write
+    sizes = []
+    for _ in range(5):
+        sizer.add_latency(delta_load._LATENCY_WRITE, 1000, 0.1)
+        sizes.append(sizer.next_size())
+        # only changes once per write
+        assert sizer.next_size() == sizes[-1]
+    assert sizes == [2000, 4000, 8000, 10000, 10000]
+
+    # a change within the deadband is not made
+    sizer.add_latency(delta_load._LATENCY_WRITE, 1000, 0.11)
+    assert sizer.next_size() == 10000
+
+    # shrinks to the lower bound at most
+    for _ in range(20):
+        sizer.add_latency(delta_load._LATENCY_WRITE, 100, 100)
+        sizer.next_size()
+    assert sizer.next_size() == 100
+
+    assert events.events[:4] == [
+        obs.BatchSize('vertices', 'v', 2000, obs.BATCH_SIZE_LATENCY),
+        obs.BatchSize('vertices', 'v', 4000, obs.BATCH_SIZE_LATENCY),
+        obs.BatchSize('vertices', 'v', 8000, obs.BATCH_SIZE_LATENCY),
+        obs.BatchSize('vertices', 'v', 10000, obs.BATCH_SIZE_LATENCY),
+    ]
+    assert events.events[-1] == obs.BatchSize('vertices', 'v', 100, obs.BATCH_SIZE_LATENCY)
+
+def test_batch_sizer_memory():
+    rss = [50]
+    sizer, events = _sizer(target_latency=1, max_rss=100, rss=rss)
+    sizer.add_latency(delta_load._LATENCY_WRITE, 1000, 0.25)
+    rss[0] = 150
+    assert sizer.next_size() == 500
+    # doesn't shrink again unless memory use is still increasing, and doesn't grow
+    sizer.add_latency(delta_load._LATENCY_WRITE, 1000, 0.25)
+    assert sizer.next_size() == 500
+    rss[0] = 160
+    assert sizer.next_size() == 250
+    # grows once back under the limit
+    rss[0] = 90
+    sizer.add_latency(delta_load._LATENCY_WRITE, 250, 0.0625)
+    assert sizer.next_size() == 500
+
+    assert events.events == [
+        obs.BatchSize('vertices', 'v', 500, obs.BATCH_SIZE_MEMORY),
+        obs.BatchSize('vertices', 'v', 250, obs.BATCH_SIZE_MEMORY),
+        obs.BatchSize('vertices', 'v', 500, obs.BATCH_SIZE_LATENCY),
+    ]
+
+def test_batch_sizer_unknown_rss():
+    sizer, events = _sizer(max_rss=100)
+    assert sizer.next_size() == 1000
+    assert events.events == []
+
+def test_chunkiter_callable_size():
+    sizes = iter([1, 2, 3, 3])
+    chunks = [list(c) for c in delta_load._chunkiter(range(7), lambda: next(sizes))]
+    assert chunks == [[0], [1, 2], [3, 4, 5], [6]]
+
+class _Updater:
+
+    auto_flush = False
+
+    def __init__(self, expired):
+        self._expired = expired
+        self._keys = []
+
+    def expire_vertex(self, key, expiration_time, release_expiration_time):
+        self._keys.append(key)
+
+    def update(self):
+        self._expired.extend(self._keys)
+        self._keys = []
+
+    def count(self):
+        return len(self._keys)
+
+    def count_by_type(self):
+        return 0, len(self._keys), 0
+
+    def payload_size(self):
+        return 0
+
+    def payload_sizes(self):
+        return 0, 0
+
+    def get_collection(self):
+        return 'v'
+
+    def close(self):
+        pass
+
+class _ExpiryDB:
+    """
+    A database with extant documents that are not in a load, which sleeps before fetching each
+    pair of documents as a streaming query would.
+    """
+
+    def __init__(self, keys, fetch_time):
+        self._keys = keys
+        self._fetch_time = fetch_time
+        self.expired = []
+
+    def get_extant_documents_without_last_version(
+            self, collection, timestamp, version, fields=None):
+        for i, k in enumerate(self._keys):
+            if i % 2 == 0:
+                time.sleep(self._fetch_time)
+            yield {'_key': k}
+
+    def get_batch_updater(self, collection=None, track_last_version=True, ignore_duplicates=False):
+        return _Updater(self.expired)
+
+def _expire_unseen(db, throttle=None, target_batch_latency=None):
+    events = _Events()
+    load = delta_load._DeltaLoad(db, 500, 400, 'v2', 2, 0, 1, False, None, [events],
+        incremental_expiry=True, target_batch_latency=target_batch_latency, throttle=throttle)
+    delta_load._expire_unseen(load, obs.PHASE_VERTEX_EXPIRY, 'v')
+    return events.events
+
+def test_expire_unseen_lookup_latency():
+    db = _ExpiryDB(['k1', 'k2', 'k3', 'k4', 'k5'], 0.05)
+    events = _expire_unseen(db)
+
+    assert db.expired == ['k1', 'k2', 'k3', 'k4', 'k5']
+    # the time taken to stream each batch from the database is reported as the lookup time
+    lookups = [e for e in events if type(e) == obs.BatchLookup]
+    assert [e[:3] for e in lookups] == [
+        (obs.PHASE_VERTEX_EXPIRY, 1, 2),
+        (obs.PHASE_VERTEX_EXPIRY, 2, 2),
+        (obs.PHASE_VERTEX_EXPIRY, 3, 1),
+    ]
+    assert all(e.duration >= 0.05 for e in lookups)
+
+def test_expire_unseen_throttle_backoff():
+    db = _ExpiryDB(['k1', 'k2', 'k3', 'k4', 'k5'], 0.05)
+    sleeps = []
+    _expire_unseen(db, throttle=LoadThrottle(max_lookup_latency=0.01, sleep=sleeps.append))
+
+    assert db.expired == ['k1', 'k2', 'k3', 'k4', 'k5']
+    # each slow streaming read backs off the write of its batch further
+    assert sleeps == [0.01, 0.02, 0.04]
@@ -0,0 +1,203 @@
+# Tests the delta load observers. These tests do not require a database.
+
+from relation_engine.batchload import load_observers as obs
+import io
+import json
+import os
+
+def _events():
+    return [
+        obs.LoadStart('ns', 'v2'),
+        obs.PhaseStart('vertices'),
+        obs.BatchStart('vertices', 1, 3),
+        obs.BatchLookup('vertices', 1, 3, 0.5),
+        obs.BulkImport('vertices', 1, 'v', 4, 2**20, 0, 1.5),
+        obs.BatchEnd('vertices', 1, 3, 2, 1, 1, 2.5),
+        obs.BatchStart('vertices', 2, 1),
+        obs.BatchLookup('vertices', 2, 1, 0.5),
+        obs.BulkImport('vertices', 2, 'v', 1, 2**20, 2**20, 0.5),
+        obs.BatchEnd('vertices', 2, 1, 1, 0, 0, 1.5),
+        obs.PhaseEnd('vertices', 2.0),
+        obs.PhaseStart('vertex_expiry'),
+        obs.CollectionUpdate('vertex_expiry', 'v', 'expire', 2),
+        obs.PhaseEnd('vertex_expiry', 1.0),
+        obs.PhaseStart('edges'),
+        obs.BatchStart('edges', 1, 4),
+        obs.BulkImport('edges', 1, None, 4, None, None, 0.5),
+        obs.BatchEnd('edges', 1, 4, None, None, None, 0.5),
+        obs.CollectionUpdate('edges', 'e', 'create', 3),
+        obs.CollectionUpdate('edges', 'e', 'expire', 1),
+        obs.CollectionUpdate('edges', 'e', 'set_last_version', 1),
+        obs.PhaseEnd('edges', 4.0),
+        obs.LoadEnd('ns', 'v2', 8.0),
+    ]
+
+def test_event_to_dict():
+    assert obs.event_to_dict(obs.BatchEnd('edges', 1, 4, 2, 1, None, 0.5)) == {
+        'event': 'BatchEnd', 'phase': 'edges', 'batch': 1, 'size': 4, 'created': 2,
+        'expired': 1, 'unchanged': None, 'duration': 0.5}
+
+def test_json_lines_observer():
+    out = io.StringIO()
+    o = obs.JSONLinesObserver(out)
+    for e in _events():
+        o.notify(e)
+
+    lines = [json.loads(l) for l in out.getvalue().splitlines()]
+    assert len(lines) == len(_events())
+    for l, e in zip(lines, _events()):
+        assert type(l.pop('time')) == float
+        assert l == obs.event_to_dict(e)
+
+def test_throughput_summary_observer():
+    out = io.StringIO()
+    o = obs.ThroughputSummaryObserver(out)
+    for e in _events():
+        o.notify(e)
+
+    assert out.getvalue().splitlines() == [
+        'vertices: 4 documents in 2 batches in 2.0s (2 documents/s), lookups 1.0s, ' +
+            'imports 2.0s (3.0 MiB), created 3, expired 1, unchanged 1',
+        'vertex_expiry: 1.0s, expire 2',
+        'edges: 4 documents in 1 batches in 4.0s (1 documents/s), lookups 0.0s, ' +
+            'imports 0.5s (0.0 MiB), create 3, expire 1, set_last_version 1',
+        'load ns v2: 8 documents in 8.0s (1 documents/s)',
+    ]
+
+def test_throughput_summary_observer_rollback():
+    out = io.StringIO()
+    o = obs.ThroughputSummaryObserver(out)
+    for e in _rollback_events():
+        o.notify(e)
+
+    assert out.getvalue().splitlines() == [
+        'rollback_delete: 1.0s, delete 5',
+        'rollback_unexpire: 2.0s, unexpire 3',
+        'rollback_last_version: 0.5s, set_last_version 0',
+        'rollback ns v2: 8 documents updated in 4.0s',
+    ]
+
+def _rollback_events():
+    return [
+        obs.RollbackStart('ns', 'v2'),
+        obs.PhaseStart('rollback_delete'),
+        obs.CollectionUpdate('rollback_delete', 'e', 'delete', 2),
+        obs.CollectionUpdate('rollback_delete', 'v', 'delete', 3),
+        obs.PhaseEnd('rollback_delete', 1.0),
+        obs.PhaseStart('rollback_unexpire'),
+        obs.CollectionUpdate('rollback_unexpire', 'e', 'unexpire', 1),
+        obs.CollectionUpdate('rollback_unexpire', 'v', 'unexpire', 2),
+        obs.PhaseEnd('rollback_unexpire', 2.0),
+        obs.PhaseStart('rollback_last_version'),
+        obs.CollectionUpdate('rollback_last_version', 'e', 'set_last_version', 0),
+        obs.CollectionUpdate('rollback_last_version', 'v', 'set_last_version', 0),
+        obs.PhaseEnd('rollback_last_version', 0.5),
+        obs.RollbackEnd('ns', 'v2', 4.0),
+    ]
+
+def _read_metrics(path):
+    """
+    Returns the samples in a metrics file, other than the run duration, as a dict of the sample
+    name and labels to the value, and checks every metric has help and type comments.
+    """
+    samples = {}
+    described = set()
+    with open(path) as f:
+        for l in f.read().splitlines():
+            if l.startswith('# TYPE '):
+                described.add(l.split()[2])
+            elif not l.startswith('# HELP '):
+                name, value = l.rsplit(' ', 1)
+                assert name.split('{')[0].replace('_bucket', '').replace('_sum', '').replace(
+                    '_count', '') in described
+                if not name.startswith('delta_load_duration_seconds'):
+                    samples[name] = value
+    return samples
+
+def test_prometheus_textfile_observer(tmp_path):
+    path = str(tmp_path / 'load.prom')
+    o = obs.PrometheusTextfileObserver(path, buckets=[1, 2])
+    events = _events()
+    for e in events[:11]:  # to the end of the vertex phase
+        o.notify(e)
+    assert os.listdir(tmp_path) == ['load.prom']
+
+    lbl = 'namespace="ns",operation="load"'
+    vlbl = lbl + ',phase="vertices"'
+    assert _read_metrics(path) == {
+        f'delta_load_info{{{lbl},version="v2"}}': '1',
+        f'delta_load_complete{{{lbl}}}': '0',
+        f'delta_load_phase_duration_seconds{{{vlbl}}}': '2',
+        f'delta_load_phase_documents{{{vlbl},collection="v"}}': '5',
+        f'delta_load_phase_documents_per_second{{{vlbl},collection="v"}}': '2.5',
+        f'delta_load_phase_import_bytes{{{vlbl},collection="v"}}': str(2 * 2**20),
+        f'delta_load_phase_key_update_bytes{{{vlbl},collection="v"}}': str(2**20),
+        f'delta_load_phase_expired_documents{{{vlbl}}}': '1',
+        f'delta_load_batch_duration_seconds_bucket{{{vlbl},le="1"}}': '0',
+        f'delta_load_batch_duration_seconds_bucket{{{vlbl},le="2"}}': '1',
+        f'delta_load_batch_duration_seconds_bucket{{{vlbl},le="+Inf"}}': '2',
+        f'delta_load_batch_duration_seconds_sum{{{vlbl}}}': '4',
+        f'delta_load_batch_duration_seconds_count{{{vlbl}}}': '2',
+    }
+
+    for e in events[11:]:
+        o.notify(e)
+    assert os.listdir(tmp_path) == ['load.prom']
+
+    metrics = _read_metrics(path)
+    assert metrics[f'delta_load_complete{{{lbl}}}'] == '1'
+    xlbl = lbl + ',phase="vertex_expiry"'
+    assert metrics[f'delta_load_phase_documents{{{xlbl},collection="v"}}'] == '2'
+    assert metrics[f'delta_load_phase_expired_documents{{{xlbl}}}'] == '2'
+    elbl = lbl + ',phase="edges"'
+    # documents sent to a staging collection are not counted, only the updates
+    assert metrics[f'delta_load_phase_documents{{{elbl},collection="e"}}'] == '5'
+    assert metrics[f'delta_load_phase_documents_per_second{{{elbl},collection="e"}}'] == '1.25'
+    assert metrics[f'delta_load_phase_expired_documents{{{elbl}}}'] == '1'
+    assert metrics[f'delta_load_batch_duration_seconds_bucket{{{elbl},le="1"}}'] == '1'
+    assert f'delta_load_phase_import_bytes{{{elbl},collection="e"}}' not in metrics
+    assert f'delta_load_phase_key_update_bytes{{{elbl},collection="e"}}' not in metrics
+
+def test_prometheus_textfile_observer_rollback(tmp_path):
+    path = str(tmp_path / 'rollback.prom')
+    o = obs.PrometheusTextfileObserver(path)
+    for e in _rollback_events():
+        o.notify(e)
+
+    metrics = _read_metrics(path)
+    lbl = 'namespace="ns",operation="rollback"'
+    assert metrics[f'delta_load_info{{{lbl},version="v2"}}'] == '1'
+    assert metrics[f'delta_load_complete{{{lbl}}}'] == '1'
+    dlbl = lbl + ',phase="rollback_delete"'
+    assert metrics[f'delta_load_phase_duration_seconds{{{dlbl}}}'] == '1'
+    assert metrics[f'delta_load_phase_documents{{{dlbl},collection="v"}}'] == '3'
+    assert metrics[f'delta_load_phase_expired_documents{{{dlbl}}}'] == '0'
+    assert not any(m.startswith('delta_load_batch_duration_seconds') for m in metrics)
+
+def test_prometheus_textfile_observer_escapes_labels(tmp_path):
+    path = str(tmp_path / 'load.prom')
+    o = obs.PrometheusTextfileObserver(path)
+    o.notify(obs.LoadStart('n"s\\\n', 'v2'))
+    o.notify(obs.LoadEnd('n"s\\\n', 'v2', 1.0))
+
+    metrics = _read_metrics(path)
+    assert metrics['delta_load_complete{namespace="n\\"s\\\\\\n",operation="load"}'] == '1'
+
+def test_prometheus_textfile_observer_batch_size(tmp_path):
+    path = str(tmp_path / 'load.prom')
+    o = obs.PrometheusTextfileObserver(path)
+    for e in [obs.LoadStart('ns', 'v2'),
+              obs.PhaseStart('vertices'),
+              obs.BatchSize('vertices', 'v', 2000, obs.BATCH_SIZE_LATENCY),
+              obs.BatchSize('vertices', 'v', 1000, obs.BATCH_SIZE_MEMORY),
+              obs.PhaseEnd('vertices', 2.0),
+              obs.PhaseStart('edges'),
+              obs.BatchSize('edges', None, 500, obs.BATCH_SIZE_LATENCY),
+              obs.PhaseEnd('edges', 2.0)]:
+        o.notify(e)
+
+    metrics = _read_metrics(path)
+    lbl = 'namespace="ns",operation="load"'
+    assert metrics[f'delta_load_phase_batch_size{{{lbl},phase="vertices",collection="v"}}'] == (
+        '1000')
+    assert metrics[f'delta_load_phase_batch_size{{{lbl},phase="edges"}}'] == '500'
@@ -0,0 +1,85 @@
+# Tests the delta load throttle. These tests do not require a database.
+
+from relation_engine.batchload.load_throttle import LoadThrottle
+from relation_engine.batchload.test.test_helpers import check_exception
+
+class _Clock:
+    """
+    A clock that only advances when slept on.
+    """
+
+    def __init__(self):
+        self.time = 100
+        self.sleeps = []
+
+    def __call__(self):
+        return self.time
+
+    def sleep(self, duration):
+        self.sleeps.append(duration)
+        self.time += duration
+
+def _throttle(**kwargs):
+    clock = _Clock()
+    return LoadThrottle(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+def test_unlimited():
+    t, clock = _throttle()
+    for _ in range(3):
+        t.before_write(1000, 10**9)
+        t.lookup_complete(100)
+    assert clock.sleeps == []
+
+def test_documents_per_second():
+    t, clock = _throttle(documents_per_second=100)
+    t.before_write(50)
+    t.before_write(200)
+    t.before_write(10)
+    assert clock.sleeps == [0.5, 2]
+
+    # time spent elsewhere counts toward the wait, but isn't banked
+    clock.time += 10
+    t.before_write(100)
+    t.before_write(100)
+    assert clock.sleeps == [0.5, 2, 1]
+
+def test_bytes_per_second():
+    t, clock = _throttle(documents_per_second=100, bytes_per_second=1000)
+    t.before_write(10, 2000)
+    t.before_write(300, 1000)
+    t.before_write(1, 1)
+    assert clock.sleeps == [2, 3]
+
+def test_backoff():
+    t, clock = _throttle(max_lookup_latency=1, max_backoff=5)
+    t.lookup_complete(1)
+    t.before_write(10)
+    assert clock.sleeps == []
+
+    for _ in range(4):
+        t.lookup_complete(1.5)
+        t.before_write(10)
+    assert clock.sleeps == [1, 2, 4, 5]
+
+    for _ in range(3):
+        t.lookup_complete(0.5)
+        t.before_write(10)
+    # the pause stops once it's shorter than the max latency
+    assert clock.sleeps == [1, 2, 4, 5, 2.5, 1.25]
+
+def test_backoff_with_rate():
+    t, clock = _throttle(documents_per_second=10, max_lookup_latency=1)
+    t.before_write(10)
+    t.lookup_complete(2)
+    t.before_write(10)
+    assert clock.sleeps == [2]
+
+def test_fail_missing_size():
+    t, _ = _throttle(bytes_per_second=1000)
+    check_exception(lambda: t.before_write(10), ValueError,
+        'The write size is required for a bytes per second limit')
+
+def test_fail_bad_args():
+    for arg in ['documents_per_second', 'bytes_per_second', 'max_lookup_latency']:
+        check_exception(lambda: LoadThrottle(**{arg: 0}), ValueError, f'{arg} must be > 0')
+    check_exception(lambda: LoadThrottle(max_backoff=0), ValueError, 'max_backoff must be > 0')
@@ -0,0 +1,139 @@
+# Tests the database request retry policy. These tests do not require a database.
+
+from relation_engine.batchload.retry import RetryPolicy, is_transient
+from relation_engine.batchload.test.test_helpers import check_exception
+from pytest import importorskip
+
+class _ServerError(Exception):
+    """
+    An error with the codes of a python-arango server error.
+    """
+
+    def __init__(self, http_code, error_code):
+        super().__init__(f'{http_code} {error_code}')
+        self.http_code = http_code
+        self.error_code = error_code
+
+class _Operation:
+    """
+    An operation that raises the given errors before succeeding.
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'done'
+
+def _policy(**kwargs):
+    sleeps = []
+    retries = []
+    p = RetryPolicy(sleep=sleeps.append, random=lambda: 1,
+        on_retry=lambda e, r, pause: retries.append((e.args[0], r, pause)), **kwargs)
+    return p, sleeps, retries
+
+def test_is_transient():
+    assert is_transient(ConnectionError('reset')) is True
+    assert is_transient(TimeoutError('timed out')) is True
+    for http_code in [408, 429, 502, 503, 504]:
+        assert is_transient(_ServerError(http_code, None)) is True
+    for error_code in [18, 30, 1200, 1457, 1478]:
+        assert is_transient(_ServerError(500, error_code)) is True
+
+    assert is_transient(_ServerError(404, 1202)) is False
+    assert is_transient(_ServerError(409, 1210)) is False
+    assert is_transient(_ServerError(500, 4)) is False
+    assert is_transient(ValueError('bad')) is False
+    assert is_transient(OSError('disk full')) is False
+    assert is_transient(FileNotFoundError('missing')) is False
+    assert is_transient(PermissionError('denied')) is False
+
+def test_is_transient_http_client():
+    requests = importorskip('requests')
+    urllib3 = importorskip('urllib3')
+    assert is_transient(requests.exceptions.ConnectionError('refused')) is True
+    assert is_transient(requests.exceptions.ConnectTimeout('timed out')) is True
+    assert is_transient(requests.exceptions.ReadTimeout('timed out')) is True
+    assert is_transient(urllib3.exceptions.ProtocolError('aborted')) is True
+    assert is_transient(urllib3.exceptions.ReadTimeoutError(None, '/', 'timed out')) is True
+
+    assert is_transient(requests.exceptions.InvalidURL('bad url')) is False
+
+def test_no_failure():
+    p, sleeps, _ = _policy()
+    op = _Operation()
+    assert p.call(op) == 'done'
+    assert op.calls == 1
+    assert sleeps == []
+    assert p.retries == 0
+
+def test_retry_with_backoff():
+    p, sleeps, retries = _policy(max_retries=6, initial_backoff=2, max_backoff=10)
+    op = _Operation(*[ConnectionError(f'fail{i}') for i in range(5)])
+    assert p.call(op) == 'done'
+    assert op.calls == 6
+    assert sleeps == [2, 4, 8, 10, 10]
+    assert retries == [('fail0', 1, 2), ('fail1', 2, 4), ('fail2', 3, 8), ('fail3', 4, 10),
+        ('fail4', 5, 10)]
+    assert p.retries == 5
+
+    # the backoff starts again for the next operation, but the retries are counted in total
+    op = _Operation(_ServerError(503, None))
+    assert p.call(op) == 'done'
+    assert sleeps == [2, 4, 8, 10, 10, 2]
+    assert p.retries == 6
+
+def test_jitter():
+    sleeps = []
+    randoms = [0.5, 0.25]
+    p = RetryPolicy(sleep=sleeps.append, random=lambda: randoms.pop(0))
+    p.call(_Operation(ConnectionError(), ConnectionError()))
+    assert sleeps == [0.5, 0.5]
+
+def test_replay():
+    p, _, _ = _policy()
+    op = _Operation(ConnectionError('fail'))
+    replay = _Operation()
+    assert p.call(op, replay) == 'done'
+    assert op.calls == 1
+    assert replay.calls == 1
+
+    op = _Operation()
+    replay = _Operation()
+    p.call(op, replay)
+    assert op.calls == 1
+    assert replay.calls == 0
+
+def test_fail_retries_exhausted():
+    p, sleeps, _ = _policy(max_retries=2)
+    err = ConnectionError('fail2')
+    op = _Operation(ConnectionError('fail0'), ConnectionError('fail1'), err)
+    check_exception(lambda: p.call(op), ConnectionError, 'fail2')
+    assert op.calls == 3
+    assert sleeps == [1, 2]
+    assert p.retries == 2
+
+def test_no_retries():
+    p, sleeps, _ = _policy(max_retries=0)
+    op = _Operation(ConnectionError('fail'))
+    check_exception(lambda: p.call(op), ConnectionError, 'fail')
+    assert op.calls == 1
+    assert sleeps == []
+    assert p.retries == 0
+
+def test_fail_not_transient():
+    p, sleeps, _ = _policy()
+    op = _Operation(ConnectionError('fail'), ValueError('bad'))
+    check_exception(lambda: p.call(op), ValueError, 'bad')
+    assert op.calls == 2
+    assert sleeps == [1]
+    assert p.retries == 1
+
+def test_fail_bad_args():
+    check_exception(lambda: RetryPolicy(max_retries=-1), ValueError, 'max_retries must be >= 0')
+    for arg in ['initial_backoff', 'max_backoff']:
+        check_exception(lambda: RetryPolicy(**{arg: 0}), ValueError, f'{arg} must be > 0')
@@ -4,17 +4,26 @@
 
 # TODO TEST more tests
 
+from relation_engine.batchload import time_travelling_database as ttdb
+from relation_engine.batchload.retry import RetryPolicy
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDB
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDBFactory
+from relation_engine.batchload.time_travelling_database import _encode_document
+from relation_engine.batchload.time_travelling_database import _insert_encoded_documents
 from relation_engine.batchload.test.test_helpers import create_timetravel_collection
 from relation_engine.batchload.test.test_helpers import check_docs, check_exception
+from concurrent.futures import ThreadPoolExecutor
+import json
 from arango import ArangoClient
-from pytest import fixture
+from arango.exceptions import AQLQueryExecuteError, DocumentInsertError
+from pytest import fixture, raises
 
 HOST = 'localhost'
 PORT = 8529
 DB_NAME = 'test_timetravel_delta_batch_load_db'
 
+ADB_MAX_TIME = 2**53 - 1
+
 @fixture
 def arango_db():
     client = ArangoClient(protocol='http', host=HOST, port=PORT)
@@ -283,6 +292,36 @@ def test_register_load_start(arango_db):
 
     check_docs(arango_db, expected, 'reg')
 
+def test_register_load_start_untracked(arango_db):
+    """
+    Tests registering the start of a load that doesn't track the last version.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    att.register_load_start('GeneOntology', '09-08-07', 1000, 800, 500, track_last_version=False)
+
+    expected = [{
+        '_key': 'GeneOntology_09-08-07',
+        '_id': 'reg/GeneOntology_09-08-07',
+        'load_namespace': 'GeneOntology',
+        'load_version': '09-08-07',
+        'load_timestamp': 1000,
+        'release_timestamp': 800,
+        'start_time': 500,
+        'completion_time': None,
+        'state': 'in_progress',
+        'vertex_collection': 'v',
+        'merge_collection': None, 
+        'edge_collections': ['e'],
+        'track_last_version': False,
+    }]
+
+    check_docs(arango_db, expected, 'reg')
+
 def test_register_load_start_with_merge_col_and_multiple_edge_cols(arango_db):
     """
     Tests registering the start of a load with the db with more collections.
@@ -376,6 +415,58 @@ def test_register_load_complete_fail_not_started(arango_db):
     check_exception(lambda: att.register_load_complete('GeneOntology', '09-08-07', 800),
         ValueError, 'Load is not registered, cannot be completed')
 
+def test_register_load_checkpoint(arango_db):
+    """
+    Tests registering load checkpoints with the db and that completing the load removes the
+    checkpoint.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    att.register_load_start('GeneOntology', '09-08-07', 1000, 700, 500)
+    att.register_load_checkpoint('GeneOntology', '09-08-07', {'a': {'b': 1, 'c': 2}, 'd': [1]})
+    att.register_load_checkpoint('GeneOntology', '09-08-07', {'a': {'b': 3}, 'd': None})
+
+    expected = {
+        '_key': 'GeneOntology_09-08-07',
+        '_id': 'reg/GeneOntology_09-08-07',
+        'load_namespace': 'GeneOntology',
+        'load_version': '09-08-07',
+        'load_timestamp': 1000,
+        'release_timestamp': 700,
+        'start_time': 500,
+        'completion_time': None,
+        'state': 'in_progress',
+        'vertex_collection': 'v',
+        'merge_collection': None,
+        'edge_collections': ['e'],
+        'checkpoint': {'a': {'b': 3}, 'd': None},
+    }
+
+    check_docs(arango_db, [expected], 'reg')
+
+    att.register_load_complete('GeneOntology', '09-08-07', 800)
+
+    del expected['checkpoint']
+    expected.update({'completion_time': 800, 'state': 'complete'})
+    check_docs(arango_db, [expected], 'reg')
+
+def test_register_load_checkpoint_fail_not_started(arango_db):
+    """
+    Test the case where a load is not registered and so cannot record a checkpoint.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    check_exception(lambda: att.register_load_checkpoint('GeneOntology', '09-08-07', {}),
+        ValueError, 'Load is not registered, cannot record a checkpoint')
+
 def test_register_load_rollback(arango_db):
     """
     Tests registering the rollback of a load with the db.
@@ -673,6 +764,140 @@ def test_get_edges(arango_db):
     check_exception(lambda:  att.get_edges(['bar'], 200), ValueError,
         'db contains > 1 document for id bar, timestamp 200, collection edges')
 
+def test_get_vertices_with_fields(arango_db):
+    """
+    Tests that getting vertices with a field list only returns the requested fields plus the id.
+    """
+    col_name = 'verts'
+    col = create_timetravel_collection(arango_db, col_name)
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': '1', 'id': 'foo', 'created': 100, 'expired': 600, 'big': [1, 2]},
+                     {'_key': '2', 'id': 'bar', 'created': 100, 'expired': 600, 'big': [3, 4]},
+                     ])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', col_name, edge_collections=['e'])
+
+    ret = att.get_vertices(['foo', 'bar'], 300, fields=['_key', '_id', 'fingerprint'])
+    assert ret == {
+        'foo': {'_key': '1', '_id': 'verts/1', 'id': 'foo'},
+        'bar': {'_key': '2', '_id': 'verts/2', 'id': 'bar'}
+    }
+
+    ret = att.get_vertices(['foo'], 300, fields=['big'])
+    assert ret == {'foo': {'id': 'foo', 'big': [1, 2]}}
+
+def test_get_edges_with_fields(arango_db):
+    """
+    Tests that getting edges with a field list only returns the requested fields plus the id.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    col_name = 'edges'
+    col = create_timetravel_collection(arango_db, col_name, edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': '1', '_from': 'fake/1', '_to': 'fake/2', 'id': 'foo',
+                      'created': 100, 'expired': 600, 'big': [1, 2]},
+                     ])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection=col_name)
+
+    ret = att.get_edges(['foo'], 300, fields=['_key', '_from', '_to'])
+    assert ret == {'foo': {'_key': '1', '_from': 'fake/1', '_to': 'fake/2', 'id': 'foo'}}
+
+def test_get_extant_documents(arango_db):
+    """
+    Tests streaming the documents that exist at a specific time in ID order.
+    """
+    col_name = 'verts'
+    col = create_timetravel_collection(arango_db, col_name)
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': '1', 'id': '10', 'created': 100, 'expired': 600, 'big': 1},
+                     {'_key': '2', 'id': '9', 'created': 100, 'expired': 600, 'big': 2},
+                     {'_key': '3', 'id': '2', 'created': 100, 'expired': 200, 'big': 3},
+                     {'_key': '4', 'id': '11', 'created': 100, 'expired': 600, 'big': 4},
+                     {'_key': '5', 'id': '100', 'created': 100, 'expired': 600, 'big': 5},
+                     {'_key': '6', 'id': '20', 'created': 100, 'expired': 600, 'big': 6},
+                     {'_key': '7', 'id': '1000', 'created': 100, 'expired': 200, 'big': 7},
+                     ])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', col_name, edge_collections=['e'])
+
+    ret = list(att.get_extant_documents(col_name, 300))
+    assert ret == [
+        {'_key': '1', '_id': 'verts/1', 'id': '10', 'created': 100, 'expired': 600, 'big': 1},
+        {'_key': '5', '_id': 'verts/5', 'id': '100', 'created': 100, 'expired': 600, 'big': 5},
+        {'_key': '4', '_id': 'verts/4', 'id': '11', 'created': 100, 'expired': 600, 'big': 4},
+        {'_key': '6', '_id': 'verts/6', 'id': '20', 'created': 100, 'expired': 600, 'big': 6},
+        {'_key': '2', '_id': 'verts/2', 'id': '9', 'created': 100, 'expired': 600, 'big': 2},
+    ]
+
+    # the IDs are streamed one length at a time
+    ret = list(att.get_extant_documents(col_name, 300, fields=['_key'], numeric_ids=True))
+    assert ret == [{'_key': '2', 'id': '9'}, {'_key': '1', 'id': '10'}, {'_key': '4', 'id': '11'},
+        {'_key': '6', 'id': '20'}, {'_key': '5', 'id': '100'}]
+
+    ret = list(att.get_extant_documents('e', 300))
+    assert ret == []
+    ret = list(att.get_extant_documents('e', 300, numeric_ids=True))
+    assert ret == []
+
+def test_count_extant_documents(arango_db):
+    """
+    Tests counting the documents that exist at a specific time.
+    """
+    col_name = 'verts'
+    col = create_timetravel_collection(arango_db, col_name)
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': '1', 'id': '10', 'created': 100, 'expired': 600},
+                     {'_key': '2', 'id': '9', 'created': 100, 'expired': 300},
+                     {'_key': '3', 'id': '2', 'created': 100, 'expired': 200},
+                     {'_key': '4', 'id': '11', 'created': 400, 'expired': 600},
+                     ])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', col_name, edge_collections=['e'])
+
+    assert att.count_extant_documents(col_name, 300) == 2
+    assert att.count_extant_documents(col_name, 50) == 0
+    assert att.count_extant_documents('e', 300) == 0
+
+def test_get_extant_documents_without_last_version(arango_db):
+    """
+    Tests streaming the documents that exist at a specific time without a given last version.
+    """
+    col_name = 'verts'
+    col = create_timetravel_collection(arango_db, col_name)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': '1', 'id': '10', 'created': 100, 'expired': 600,
+                      'last_version': '1', 'data': 'a'},
+                     {'_key': '2', 'id': '9', 'created': 100, 'expired': 600,
+                      'last_version': '2', 'data': 'b'},
+                     {'_key': '3', 'id': '2', 'created': 100, 'expired': 200,
+                      'last_version': '1', 'data': 'c'},
+                     {'_key': '4', 'id': '11', 'created': 100, 'expired': 600,
+                      'last_version': '3', 'data': 'd'},
+                     ])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', col_name)
+
+    docs = att.get_extant_documents_without_last_version(col_name, 300, '2')
+    assert sorted(docs, key=lambda d: d['id']) == [
+        {'_key': '1', 'id': '10', 'created': 100, 'expired': 600, 'last_version': '1',
+         'data': 'a'},
+        {'_key': '4', 'id': '11', 'created': 100, 'expired': 600, 'last_version': '3',
+         'data': 'd'},
+        ]
+
+    docs = att.get_extant_documents_without_last_version(col_name, 150, '3', fields=['_key'])
+    assert sorted(docs, key=lambda d: d['id']) == [
+        {'_key': '1', 'id': '10'}, {'_key': '3', 'id': '2'}, {'_key': '2', 'id': '9'}]
+
 def test_expire_extant_vertices_without_last_version(arango_db):
     """
     Tests expiring vertices that exist at a specfic time without a given last version.
@@ -699,7 +924,7 @@ def test_expire_extant_vertices_without_last_version(arango_db):
     att = ArangoBatchTimeTravellingDB(arango_db, 'reg', col_name,    default_edge_collection='e')
 
     # test 1
-    att.expire_extant_vertices_without_last_version(100, 99, "2")
+    assert att.expire_extant_vertices_without_last_version(100, 99, "2") == 2
 
     expected = [
         {'_key': '0', '_id': 'verts/0', 'id': 'baz', 'created': 100, 'expired': 300,
@@ -720,7 +945,7 @@ def test_expire_extant_vertices_without_last_version(arango_db):
     col.delete_match({})
     col.import_bulk(test_data)
 
-    att.expire_extant_vertices_without_last_version(299, 297, "1")
+    assert att.expire_extant_vertices_without_last_version(299, 297, "1") == 2
 
     expected = [
         {'_key': '0', '_id': 'verts/0', 'id': 'baz', 'created': 100, 'expired': 299,
@@ -767,7 +992,8 @@ def test_expire_extant_edges_without_last_version(arango_db):
         arango_db, 'reg', 'v', edge_collections=[col_name], merge_collection='m')
 
     # test 1
-    att.expire_extant_edges_without_last_version(100, 99, '2', edge_collection=col_name)
+    assert att.expire_extant_edges_without_last_version(
+        100, 99, '2', edge_collection=col_name) == 2
 
     expected = [
         {'_key': '0', '_id': 'edges/0', 'id': 'baz', 'created': 100, 'expired': 300,
@@ -793,7 +1019,8 @@ def test_expire_extant_edges_without_last_version(arango_db):
     col.delete_match({})
     col.import_bulk(test_data)
 
-    att.expire_extant_edges_without_last_version(299, 297, '1', edge_collection=col_name)
+    assert att.expire_extant_edges_without_last_version(
+        299, 297, '1', edge_collection=col_name) == 2
 
     expected = [
         {'_key': '0', '_id': 'edges/0', 'id': 'baz', 'created': 100, 'expired': 299,
@@ -869,7 +1096,7 @@ def test_delete_created_documents_noop(arango_db):
     for col, edge in [(vertcol, False), (mergecol, True), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.delete_created_documents(col.name, 101)
+        assert att.delete_created_documents(col.name, 101) == 0
     
         check_docs(arango_db, actual_expected, col.name)
 
@@ -888,7 +1115,7 @@ def test_delete_created_documents(arango_db):
     for col, edge in [(vertcol, False), (mergecol, True), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.delete_created_documents(col.name, 100)
+        assert att.delete_created_documents(col.name, 100) == 3
         actual_expected = actual_expected[3:]
     
         check_docs(arango_db, actual_expected, col.name)
@@ -922,7 +1149,7 @@ def test_undo_expire_documents_noop(arango_db):
     for col, edge in [(vertcol, False), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.undo_expire_documents(col.name, 301)
+        assert att.undo_expire_documents(col.name, 301) == 0
     
         check_docs(arango_db, actual_expected, col.name)
 
@@ -940,7 +1167,7 @@ def test_undo_expire_documents(arango_db):
     for col, edge in [(vertcol, False), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.undo_expire_documents(col.name, 300)
+        assert att.undo_expire_documents(col.name, 300) == 2
         actual_expected[0]['expired'] = 9007199254740991
         actual_expected[3]['expired'] = 9007199254740991
         actual_expected[0]['release_expired'] = 9007199254740991
@@ -974,7 +1201,7 @@ def test_reset_last_version_noop(arango_db):
     for col, edge in [(vertcol, False), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.reset_last_version(col.name, '3', '2')
+        assert att.reset_last_version(col.name, '3', '2') == 0
     
         check_docs(arango_db, actual_expected, col.name)
 
@@ -991,13 +1218,44 @@ def test_reset_last_version(arango_db):
     for col, edge in [(vertcol, False), (edgecol, True)]:
         actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
         col.import_bulk(actual_td)
-        att.reset_last_version(col.name, '2', '0')
+        assert att.reset_last_version(col.name, '2', '0') == 3
         actual_expected[0]['last_version'] = '0'
         actual_expected[3]['last_version'] = '0'
         actual_expected[4]['last_version'] = '0'
     
         check_docs(arango_db, actual_expected, col.name)
 
+def test_revert_documents_in_batches(arango_db):
+    """
+    Test deleting created documents, un-expiring documents, and resetting last versions in
+    batches.
+    """
+    vertcol = create_timetravel_collection(arango_db, 'v')
+    edgecol = create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    for col, edge in [(vertcol, False), (edgecol, True)]:
+        actual_td, actual_expected = _prep_data_for_revert_tests(col.name, edge)
+        col.import_bulk(actual_td)
+        batches = []
+        assert att.reset_last_version(
+            col.name, '2', '0', batch_size=2, before_batch=batches.append) == 3
+        assert att.undo_expire_documents(
+            col.name, 300, batch_size=2, before_batch=batches.append) == 2
+        assert att.delete_created_documents(
+            col.name, 100, batch_size=2, before_batch=batches.append) == 3
+        assert [len(b) for b in batches] == [2, 1, 2, 2, 1]
+        for i in [0, 3, 4]:
+            actual_expected[i]['last_version'] = '0'
+        for i in [0, 3]:
+            actual_expected[i]['expired'] = 9007199254740991
+            actual_expected[i]['release_expired'] = 9007199254740991
+        actual_expected = actual_expected[3:]
+
+        check_docs(arango_db, actual_expected, col.name)
+
 def test_reset_last_version_fail_no_collection(arango_db):
     """
     Tests attempting to delete created documents on a non-existant collection.
@@ -1011,6 +1269,171 @@ def test_reset_last_version_fail_no_collection(arango_db):
     check_exception(lambda: att.reset_last_version('y', 'v2', 'v1'),
         ValueError, 'Collection y was not registered at initialization')
 
+####################################
+# Staging tests
+####################################
+
+def test_create_and_drop_staging_collection(arango_db):
+    """
+    Tests creating and dropping a staging collection. Dropping a missing collection is a noop.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    name = att.create_staging_collection()
+    assert name.startswith('delta_load_staging_')
+    assert arango_db.has_collection(name)
+    name2 = att.create_staging_collection()
+    assert name2 != name
+
+    att.drop_staging_collection(name)
+    assert not arango_db.has_collection(name)
+    att.drop_staging_collection(name)
+    att.drop_staging_collection(name2)
+
+def _staging_test_doc(key, id_, created, expired, first_ver, last_ver, **data):
+    doc = {'_key': key, '_id': 'v/' + key, 'id': id_,
+           'created': created, 'expired': expired,
+           'release_created': created - 100,
+           'release_expired': expired if expired == ADB_MAX_TIME else expired - 100,
+           'first_version': first_ver, 'last_version': last_ver}
+    doc.update(data)
+    return doc
+
+def test_apply_staged_vertices(arango_db):
+    """
+    Tests applying staged vertices, including unchanged, changed, new, and unstaged vertices and
+    fingerprinted vertices.
+    """
+    col = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    existing = [
+        _staging_test_doc('same_1', 'same', 100, ADB_MAX_TIME, '1', '1', a=1),
+        _staging_test_doc('change_1', 'change', 100, ADB_MAX_TIME, '1', '1', a=1),
+        _staging_test_doc('fp_1', 'fp', 100, ADB_MAX_TIME, '1', '1', a=1, fingerprint='abc'),
+        _staging_test_doc('untouched_1', 'untouched', 100, ADB_MAX_TIME, '1', '1', a=1),
+        _staging_test_doc('old_0', 'new', 100, 300, '0', '0', a=3),
+    ]
+    col.import_bulk(existing)
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', edge_collections=['e'])
+
+    stage = att.create_staging_collection()
+    att.stage_vertices(stage, [
+        ({'id': 'same', 'a': 1}, None),
+        ({'id': 'change', 'a': 2}, None),
+        # the fingerprint takes precedence over the contents
+        ({'id': 'fp', 'a': 2}, 'abc')])
+    att.stage_vertices(stage, [({'id': 'new', 'a': 3}, 'def')])
+
+    assert att.apply_staged_vertices(stage, 500, 400, '2') == (2, 1, 2)
+    att.drop_staging_collection(stage)
+
+    expected = [
+        _staging_test_doc('same_1', 'same', 100, ADB_MAX_TIME, '1', '2', a=1),
+        _staging_test_doc('change_1', 'change', 100, 499, '1', '1', a=1),
+        _staging_test_doc('change_2', 'change', 500, ADB_MAX_TIME, '2', '2', a=2),
+        _staging_test_doc('fp_1', 'fp', 100, ADB_MAX_TIME, '1', '2', a=1, fingerprint='abc'),
+        _staging_test_doc('untouched_1', 'untouched', 100, ADB_MAX_TIME, '1', '1', a=1),
+        _staging_test_doc('old_0', 'new', 100, 300, '0', '0', a=3),
+        _staging_test_doc('new_2', 'new', 500, ADB_MAX_TIME, '2', '2', a=3, fingerprint='def'),
+    ]
+    check_docs(arango_db, expected, 'v')
+
+def test_apply_staged_edges(arango_db):
+    """
+    Tests applying staged edges, including edges with changed vertices and edges destined for
+    another collection.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    col = create_timetravel_collection(arango_db, 'e', edge=True)
+    create_timetravel_collection(arango_db, 'e2', edge=True)
+    arango_db.create_collection('reg')
+
+    vcol.import_bulk([
+        _staging_test_doc('v1_1', 'v1', 100, ADB_MAX_TIME, '1', '2'),
+        _staging_test_doc('v2_1', 'v2', 100, 499, '1', '1'),
+        _staging_test_doc('v2_2', 'v2', 500, ADB_MAX_TIME, '2', '2'),
+        _staging_test_doc('v3_1', 'v3', 100, ADB_MAX_TIME, '1', '2'),
+    ])
+
+    def edge(key, id_, from_, to, created, expired, last_ver, **data):
+        e = _staging_test_doc(key, id_, created, expired, key.split('_')[1], last_ver,
+            _from='v/' + from_, _to='v/' + to, **data)
+        e['_id'] = 'e/' + key
+        e['from'] = from_.split('_')[0]
+        e['to'] = to.split('_')[0]
+        return e
+
+    col.import_bulk([
+        edge('same_1', 'same', 'v1_1', 'v3_1', 100, ADB_MAX_TIME, '1', b=1),
+        edge('moved_1', 'moved', 'v1_1', 'v2_1', 100, ADB_MAX_TIME, '1', b=1),
+    ])
+
+    att = ArangoBatchTimeTravellingDB(
+        arango_db, 'reg', 'v', default_edge_collection='e', edge_collections=['e2'])
+
+    stage = att.create_staging_collection()
+    att.stage_edges(stage, [
+        ({'id': 'same', 'from': 'v1', 'to': 'v3', 'b': 1}, None, None),
+        ({'id': 'moved', 'from': 'v1', 'to': 'v2', 'b': 1}, None, 'e'),
+        ({'id': 'new', 'from': 'v3', 'to': 'v1', 'b': 2}, 'xyz', None),
+        ({'id': 'other', 'from': 'v3', 'to': 'v1', 'b': 2}, None, 'e2'),
+    ])
+
+    assert att.apply_staged_edges(stage, 500, 400, '2') == (2, 1, 1)
+    att.drop_staging_collection(stage)
+
+    expected = [
+        edge('same_1', 'same', 'v1_1', 'v3_1', 100, ADB_MAX_TIME, '2', b=1),
+        edge('moved_1', 'moved', 'v1_1', 'v2_1', 100, 499, '1', b=1),
+        edge('moved_2', 'moved', 'v1_1', 'v2_2', 500, ADB_MAX_TIME, '2', b=1),
+        edge('new_2', 'new', 'v3_1', 'v1_1', 500, ADB_MAX_TIME, '2', b=2, fingerprint='xyz'),
+    ]
+    check_docs(arango_db, expected, 'e')
+    check_docs(arango_db, [], 'e2')
+
+def test_apply_staged_edges_fail_missing_vertex(arango_db):
+    """
+    Tests that applying staged edges fails if a vertex for an edge doesn't exist.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    vcol.import_bulk([_staging_test_doc('v1_1', 'v1', 100, ADB_MAX_TIME, '1', '1')])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    stage = att.create_staging_collection()
+    att.stage_edges(stage, [({'id': 'e1', 'from': 'v1', 'to': 'v2'}, None, None)])
+
+    check_exception(lambda: att.apply_staged_edges(stage, 500, 400, '2'), ValueError,
+        'Edge e1 in collection e has a vertex that does not exist at timestamp 500')
+    att.drop_staging_collection(stage)
+    check_docs(arango_db, [], 'e')
+
+def test_stage_edges_fail_no_collection(arango_db):
+    """
+    Tests that staging an edge for an unregistered collection fails.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    stage = att.create_staging_collection()
+    check_exception(lambda: att.stage_edges(
+            stage, [({'id': 'e1', 'from': 'v1', 'to': 'v2'}, None, 'y')]),
+        ValueError, 'Edge collection y was not registered at initialization')
+    att.drop_staging_collection(stage)
+
 ####################################
 # Batch updater tests
 ####################################
@@ -1145,6 +1568,335 @@ def test_batch_create_vertices(arango_db):
     ]
     check_docs(arango_db, expected, 'v')
 
+def test_batch_create_vertex_and_edge_with_fingerprint(arango_db):
+    """
+    Test creating a vertex and an edge with content fingerprints.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    b = att.get_batch_updater()
+    b.create_vertex('id1', 'ver1', 800, 700, {'foo': 'bar'}, fingerprint='abc')
+    b.update()
+
+    eb = att.get_batch_updater('e')
+    eb.create_edge('id2', {'id': 'whee', '_id': 'v/1'}, {'id': 'whoo', '_id': 'v/2'},
+        'ver1', 800, 700, {'foo': 'bar1'}, fingerprint='def')
+    eb.update()
+
+    assert vcol.count() == 1
+    vexpected = [
+        {'_key': 'id1_ver1',
+         '_id': 'v/id1_ver1',
+         'created': 800,
+         'expired': 9007199254740991,
+         'release_created': 700,
+         'release_expired': 9007199254740991,
+         'first_version': 'ver1',
+         'id': 'id1',
+         'last_version': 'ver1',
+         'foo': 'bar',
+         'fingerprint': 'abc'}
+    ]
+    check_docs(arango_db, vexpected, 'v')
+
+    eexpected = [
+        {'_key': 'id2_ver1',
+         '_id': 'e/id2_ver1',
+         'from': 'whee',
+         '_from': 'v/1',
+         'to': 'whoo',
+         '_to': 'v/2',
+         'created': 800,
+         'expired': 9007199254740991,
+         'release_created': 700,
+         'release_expired': 9007199254740991,
+         'first_version': 'ver1',
+         'id': 'id2',
+         'last_version': 'ver1',
+         'foo': 'bar1',
+         'fingerprint': 'def'}
+    ]
+    check_docs(arango_db, eexpected, 'e')
+
+def test_batch_count_by_type_and_payload_size(arango_db):
+    """
+    Test counting updates by type and getting the size of the updates.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+    # the documents that are expired or have their last version updated must exist
+    vcol.import_bulk([{'_key': 'id3_ver0', 'id': 'id3'}, {'_key': 'id4_ver0', 'id': 'id4'}])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    b = att.get_batch_updater()
+    assert b.count_by_type() == (0, 0, 0)
+    assert b.payload_size() == 0
+    b.create_vertex('id1', 'ver1', 800, 700, {'foo': 'bar'})
+    b.create_vertex('id2', 'ver1', 800, 700, {'foo': 'bar'})
+    b.expire_vertex('id3_ver0', 799, 699)
+    b.set_last_version_on_vertex('id4_ver0', 'ver1')
+    assert b.count_by_type() == (2, 1, 1)
+    assert b.payload_size() > 0
+    # the expiry and last version updates send their keys, each quoted and separated
+    assert b.payload_sizes() == (b.payload_size() - 24, 24)
+
+    eb = att.get_batch_updater('e')
+    edge = {'_key': 'id5_ver0', '_from': 'v/1', '_to': 'v/2'}
+    eb.expire_edge(edge, 799, 699)
+    eb.set_last_version_on_edge(edge, 'ver1')
+    assert eb.count_by_type() == (0, 1, 1)
+
+    b.update()
+    assert b.count_by_type() == (0, 0, 0)
+    assert b.payload_size() == 0
+    assert b.payload_sizes() == (0, 0)
+
+def test_batch_create_vertex_fail_exists(arango_db):
+    """
+    Test that creating a vertex that already exists fails without writing the batch.
+    """
+    col = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+    col.import_bulk([{'_key': 'id2_ver1', 'id': 'id2', 'foo': 'bar'}])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    b = att.get_batch_updater()
+    b.create_vertex('id1', 'ver1', 800, 700, {'foo': 'bar1'})
+    b.create_vertex('id2', 'ver1', 800, 700, {'foo': 'bar2'})
+    with raises(DocumentInsertError) as got:
+        b.update()
+    assert 'id2_ver1' in str(got.value)
+
+    check_docs(arango_db, [{'_id': 'v/id2_ver1', '_key': 'id2_ver1', 'id': 'id2', 'foo': 'bar'}],
+        'v')
+
+def test_batch_create_vertex_fail_exists_not_retried(arango_db):
+    """
+    Test that an import that fails because a vertex already exists isn't retried, and so isn't
+    replayed skipping the existing vertex.
+    """
+    col = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+    col.import_bulk([{'_key': 'id2_ver1', 'id': 'id2', 'foo': 'bar'}])
+
+    retry = RetryPolicy(sleep=lambda _: None)
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e',
+        retry=retry)
+
+    b = att.get_batch_updater()
+    b.create_vertex('id1', 'ver1', 800, 700, {'foo': 'bar1'})
+    b.create_vertex('id2', 'ver1', 800, 700, {'foo': 'bar2'})
+    with raises(DocumentInsertError):
+        b.update()
+    assert retry.retries == 0
+
+    check_docs(arango_db, [{'_id': 'v/id2_ver1', '_key': 'id2_ver1', 'id': 'id2', 'foo': 'bar'}],
+        'v')
+
+def test_batch_create_vertex_non_ascii(arango_db):
+    """
+    Test that documents with non-ASCII characters and large integers survive serialization.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+
+    b = att.get_batch_updater()
+    b.create_vertex('id1', 'ver1', 800, 700, {'name': 'Escherichia coli ☃ ö', 'big': 2**52})
+    b.create_vertex('id2', 'ver1', 800, 700, {'nested': {'k': ['ü', None, 1.5, True]}})
+    assert b.payload_size() > 0
+    b.update()
+
+    expected = [
+        {'_key': 'id1_ver1',
+         '_id': 'v/id1_ver1',
+         'created': 800,
+         'expired': 9007199254740991,
+         'release_created': 700,
+         'release_expired': 9007199254740991,
+         'first_version': 'ver1',
+         'id': 'id1',
+         'last_version': 'ver1',
+         'name': 'Escherichia coli ☃ ö',
+         'big': 2**52},
+        {'_key': 'id2_ver1',
+         '_id': 'v/id2_ver1',
+         'created': 800,
+         'expired': 9007199254740991,
+         'release_created': 700,
+         'release_expired': 9007199254740991,
+         'first_version': 'ver1',
+         'id': 'id2',
+         'last_version': 'ver1',
+         'nested': {'k': ['ü', None, 1.5, True]}}
+    ]
+    check_docs(arango_db, expected, 'v')
+
+class _RecordingCollection:
+    """
+    A collection that records the requests it's asked to execute rather than sending them.
+    """
+
+    name = 'v'
+
+    def __init__(self):
+        self.requests = []
+
+    def _execute(self, request, response_handler):
+        self.requests.append(request)
+        return 'sent'
+
+    def import_bulk(self, documents, **kwargs):
+        self.requests.append((documents, kwargs))
+        return 'imported'
+
+def test_insert_encoded_documents_request():
+    """
+    Test that encoded documents are sent to the import API as UTF-8 JSON lines. This doesn't
+    require a database, but checks the python-arango internals the import relies on.
+    """
+    col = _RecordingCollection()
+    docs = [{'_key': 'k1', 'name': 'Café ü'}, {'_key': 'k2', 'big': 2**70, 'nested': {'a': [1]}}]
+    assert _insert_encoded_documents(col, [_encode_document(d) for d in docs]) == 'sent'
+
+    req = col.requests[0]
+    assert req.method == 'post'
+    assert req.endpoint == '/_api/import'
+    assert req.params == {'type': 'documents', 'collection': 'v', 'complete': 1, 'details': 1,
+        'onDuplicate': 'error'}
+    assert type(req.data) == bytes
+    lines = req.data.split(b'\n')
+    assert [json.loads(l.decode('utf-8')) for l in lines] == docs
+
+    _insert_encoded_documents(col, [_encode_document(docs[0])], on_duplicate='ignore')
+    assert col.requests[1].params['onDuplicate'] == 'ignore'
+    assert col.requests[1].data == _encode_document(docs[0])
+
+def test_insert_encoded_documents_fallback(monkeypatch):
+    """
+    Test that encoded documents are decoded and passed to import_bulk if the python-arango
+    internals the import relies on aren't available.
+    """
+    monkeypatch.setattr(ttdb, '_ENCODED_IMPORTS', False)
+    col = _RecordingCollection()
+    docs = [{'_key': 'k1', 'name': 'Café ü'}, {'_key': 'k2', 'big': 2**70}]
+    assert _insert_encoded_documents(
+        col, [_encode_document(d) for d in docs], on_duplicate='ignore') == 'imported'
+    assert col.requests == [
+        (docs, {'halt_on_error': True, 'details': True, 'on_duplicate': 'ignore'})]
+
+def test_encode_document():
+    """
+    Test that documents are encoded as python-arango encodes them.
+    """
+    assert _encode_document({'_key': 'k1', 'name': 'Café', 'n': [1.5, float('nan')]}) == (
+        b'{"_key":"k1","name":"Caf\\u00e9","n":[1.5,NaN]}')
+
+def test_batch_auto_flush(arango_db):
+    """
+    Test that an automatically flushing updater writes its updates in chunks.
+    """
+    col = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+    col.import_bulk([{'_key': '1', 'id': 'foo', 'last_version': '1'}])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    flushes = []
+    b = att.get_batch_updater(flush_size=2, before_flush=lambda *args: flushes.append(args))
+    plain = att.get_batch_updater()
+
+    for u in [b, plain]:
+        u.create_vertex('id1', 'ver1', 800, 700, {'foo': 'bar'})
+        u.create_vertex('id2', 'ver1', 800, 700, {'foo': 'bar'})
+        u.create_vertex('id3', 'ver1', 800, 700, {'foo': 'bar'})
+    size = plain.payload_size()
+    b.set_last_version_on_vertex('1', 'ver1')
+
+    assert b.count() == 4
+    assert b.count_by_type() == (3, 0, 1)
+    # the key in the last version update is listed rather than imported
+    assert b.payload_size() == size + len('["1"]')
+    assert b.payload_sizes() == (size, len('["1"]'))
+
+    b.update()
+    assert [f[0] for f in flushes] == [2, 2]
+    assert sum(f[1] for f in flushes) == size + len('["1"]')
+    assert b.count() == 0
+    assert b.count_by_type() == (0, 0, 0)
+    assert b.payload_size() == 0
+    assert b.payload_sizes() == (0, 0)
+
+    assert col.count() == 4
+    assert col.get('1')['last_version'] == 'ver1'
+    assert col.get('id3_ver1')['foo'] == 'bar'
+
+    # the updater's thread is kept between updates until the updater is closed
+    b.create_vertex('id4', 'ver1', 800, 700, {'foo': 'bar'})
+    b.update()
+    b.close()
+    assert col.get('id4_ver1')['foo'] == 'bar'
+
+def test_batch_auto_flush_shared_executor(arango_db):
+    """
+    Test that an automatically flushing updater writes on a provided executor and doesn't shut
+    it down when it's closed.
+    """
+    col = create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    with ThreadPoolExecutor(1) as pool:
+        for id_ in ['id1', 'id2']:
+            with att.get_batch_updater(flush_size=1, executor=pool) as b:
+                b.create_vertex(id_, 'ver1', 800, 700, {'foo': 'bar'})
+                b.update()
+        assert pool.submit(lambda: 'open').result() == 'open'
+
+    assert col.count() == 2
+
+def test_batch_auto_flush_fail_write(arango_db):
+    """
+    Test that a failed background write is raised by update().
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    b = att.get_batch_updater(flush_size=1)
+    b.set_last_version_on_vertex('missing', 'ver1')
+    with raises(AQLQueryExecuteError):
+        b.update()
+    assert b.count() == 0
+    b.close()
+
+def test_batch_auto_flush_fail_bad_args(arango_db):
+    """
+    Test creating an automatically flushing updater with bad arguments.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    check_exception(lambda: att.get_batch_updater(flush_size=-1), ValueError,
+        'flush_size must be > 0')
+    check_exception(lambda: att.get_batch_updater(flush_bytes=-1), ValueError,
+        'flush_bytes must be > 0')
+
 def test_batch_create_vertex_fail_not_vertex_collection(arango_db):
     """
     Test failing to add a vertex to a batch updater as the batch updater is for edges.
@@ -1329,6 +2081,88 @@ def test_batch_set_last_version_on_vertex(arango_db):
                 ]
     check_docs(arango_db, expected, 'v')
 
+def test_batch_set_last_version_with_other_updates(arango_db):
+    """
+    Test setting the last version on edges, to more than one version, in the same batch as
+    other updates. Only the edge keys are required.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    col = create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': str(i), '_from': 'v/2', '_to': 'v/1', 'id': str(i),
+                      'last_version': '1', 'expired': 600} for i in range(1, 5)])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    b = att.get_batch_updater('e')
+
+    b.set_last_version_on_edge({'_key': '1'}, '2')
+    b.set_last_version_on_edge({'_key': '2'}, '3')
+    b.set_last_version_on_edge({'_key': '3'}, '2')
+    b.expire_edge({'_key': '4', '_from': 'v/2', '_to': 'v/1'}, 300, 250)
+
+    assert b.count() == 4
+    assert b.count_by_type() == (0, 1, 3)
+    b.update()
+    assert b.count() == 0
+    assert b.count_by_type() == (0, 0, 0)
+
+    expected = [{'_id': 'e/1', '_key': '1', '_from': 'v/2', '_to': 'v/1', 'id': '1',
+                 'last_version': '2', 'expired': 600},
+                {'_id': 'e/2', '_key': '2', '_from': 'v/2', '_to': 'v/1', 'id': '2',
+                 'last_version': '3', 'expired': 600},
+                {'_id': 'e/3', '_key': '3', '_from': 'v/2', '_to': 'v/1', 'id': '3',
+                 'last_version': '2', 'expired': 600},
+                {'_id': 'e/4', '_key': '4', '_from': 'v/2', '_to': 'v/1', 'id': '4',
+                 'last_version': '1', 'expired': 300, 'release_expired': 250},
+                ]
+    check_docs(arango_db, expected, 'e')
+
+def test_batch_set_last_version_untracked(arango_db):
+    """
+    Test that a batch updater that doesn't track the last version counts documents as
+    unchanged without updating them.
+    """
+    vcol = create_timetravel_collection(arango_db, 'v')
+    ecol = create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    vexpected = [{'_id': 'v/1', '_key': '1', 'id': 'foo', 'last_version': '1'}]
+    eexpected = [{'_id': 'e/1', '_key': '1', '_from': 'v/1', '_to': 'v/1', 'id': 'foo',
+                  'last_version': '1'}]
+    vcol.import_bulk(vexpected)
+    ecol.import_bulk(eexpected)
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    b = att.get_batch_updater(track_last_version=False)
+    b.set_last_version_on_vertex('1', '2')
+    be = att.get_batch_updater('e', track_last_version=False)
+    be.set_last_version_on_edge({'_key': '1', '_from': 'v/1', '_to': 'v/1'}, '2')
+    # the documents aren't needed to count them
+    b.set_last_version_on_vertex(None, '2')
+    be.set_last_version_on_edge(None, '2')
+
+    for bu in [b, be]:
+        assert bu.count() == 0
+        assert bu.count_by_type() == (0, 0, 2)
+        assert bu.payload_size() == 0
+        bu.update()
+        assert bu.count_by_type() == (0, 0, 0)
+
+    check_docs(arango_db, vexpected, 'v')
+    check_docs(arango_db, eexpected, 'e')
+
+    check_exception(lambda: b.set_last_version_on_edge({}, '2'), ValueError,
+        'Batch updater is configured for a vertex collection')
+
+    tracked = att.get_batch_updater()
+    check_exception(lambda: tracked.set_last_version_on_vertex(None, '2'), ValueError,
+        'A document is required to update its last version')
+    tracked = att.get_batch_updater('e')
+    check_exception(lambda: tracked.set_last_version_on_edge(None, '2'), ValueError,
+        'A document is required to update its last version')
+    assert tracked.count_by_type() == (0, 0, 0)
+
 def test_batch_set_last_version_on_vertex_fail_not_vertex_collection(arango_db):
     """
     Test failing to set the last version on a vertex in a batch updater as the batch updater is
@@ -1402,6 +2236,14 @@ def test_batch_set_last_version_on_edge_fail_not_edge_collection(arango_db):
     check_exception(lambda: b.set_last_version_on_edge({}, '2'), ValueError,
         'Batch updater is configured for a vertex collection')
 
+    tracked = att.get_batch_updater()
+    check_exception(lambda: tracked.set_last_version_on_vertex(None, '2'), ValueError,
+        'A document is required to update its last version')
+    tracked = att.get_batch_updater('e')
+    check_exception(lambda: tracked.set_last_version_on_edge(None, '2'), ValueError,
+        'A document is required to update its last version')
+    assert tracked.count_by_type() == (0, 0, 0)
+
 def test_batch_expire_vertex(arango_db):
     """
     Test expiring vertices.
@@ -1492,6 +2334,41 @@ def test_batch_expire_edge(arango_db):
                 ]
     check_docs(arango_db, expected, 'e')
 
+def test_batch_expire_edge_key_only_with_mixed_updates(arango_db):
+    """
+    Test that expiring an edge only requires its key, and that expirations at different times
+    and last version updates in the same batch are applied to the correct edges.
+    """
+    create_timetravel_collection(arango_db, 'v')
+    col = create_timetravel_collection(arango_db, 'e', edge=True)
+    arango_db.create_collection('reg')
+
+    col.import_bulk([{'_key': str(k), '_from': 'v/2', '_to': 'v/1', 'id': str(k),
+                      'expired': 1000, 'release_expired': 900, 'last_version': '1'}
+                     for k in range(1, 5)])
+
+    att = ArangoBatchTimeTravellingDB(arango_db, 'reg', 'v', default_edge_collection='e')
+    b = att.get_batch_updater('e')
+
+    b.expire_edge({'_key': '1'}, 500, 400)
+    b.set_last_version_on_edge({'_key': '2'}, '2')
+    b.expire_edge({'_key': '3'}, 600, 500)
+    b.expire_edge({'_key': '2'}, 500, 400)
+    assert b.count() == 4
+    assert b.count_by_type() == (0, 3, 1)
+    b.update()
+
+    expected = [{'_id': 'e/1', '_key': '1', '_from': 'v/2', '_to': 'v/1', 'id': '1',
+                 'expired': 500, 'release_expired': 400, 'last_version': '1'},
+                {'_id': 'e/2', '_key': '2', '_from': 'v/2', '_to': 'v/1', 'id': '2',
+                 'expired': 500, 'release_expired': 400, 'last_version': '2'},
+                {'_id': 'e/3', '_key': '3', '_from': 'v/2', '_to': 'v/1', 'id': '3',
+                 'expired': 600, 'release_expired': 500, 'last_version': '1'},
+                {'_id': 'e/4', '_key': '4', '_from': 'v/2', '_to': 'v/1', 'id': '4',
+                 'expired': 1000, 'release_expired': 900, 'last_version': '1'},
+                ]
+    check_docs(arango_db, expected, 'e')
+
 def test_batch_expire_edge_fail_not_edge_collection(arango_db):
     """
     Test failing to set the last version on an edge in a batch updater as the batch updater is
@@ -10,8 +10,16 @@ more classes and methods can be added as needed.
 
 # TODO CODE check id, from, and to for validity per https://www.arangodb.com/docs/stable/data-modeling-naming-conventions-document-keys.html
 
+from collections import deque as _deque
+import concurrent.futures as _futures
+import itertools as _itertools
+import json as _json
+import uuid as _uuid
+
 from arango.exceptions import AQLQueryExecuteError as _AQLQueryExecuteError
 from arango.exceptions import DocumentDeleteError as _DocumentDeleteError
+from arango.exceptions import DocumentInsertError as _DocumentInsertError
+from arango.request import Request as _Request
 
 _INTERNAL_ARANGO_FIELDS = ['_rev']
 
@@ -30,6 +38,7 @@ _FLD_CREATED = 'created'
 _FLD_EXPIRED = 'expired'
 _FLD_RELEASE_CREATED = 'release_created'
 _FLD_RELEASE_EXPIRED = 'release_expired'
+_FLD_FINGERPRINT = 'fingerprint'
 
 _FLD_RGSTR_LOAD_NAMESPACE = 'load_namespace'
 _FLD_RGSTR_LOAD_VERSION = 'load_version'
@@ -41,6 +50,8 @@ _FLD_RGSTR_EDGE_COLLECTIONS = 'edge_collections'
 _FLD_RGSTR_START_TIME = 'start_time'
 _FLD_RGSTR_COMPLETE_TIME = 'completion_time'
 _FLD_RGSTR_STATE = 'state'
+_FLD_RGSTR_CHECKPOINT = 'checkpoint'
+_FLD_RGSTR_TRACK_LAST_VERSION = 'track_last_version'
 _FLD_RGSTR_STATE_IN_PROGRESS = 'in_progress'
 _FLD_RGSTR_STATE_COMPLETE = 'complete'
 _FLD_RGSTR_STATE_ROLLBACK = 'rollback'
@@ -49,6 +60,34 @@ _FLD_RGSTR_STATE_ROLLBACK = 'rollback'
 # in unix epoch ms this is 2255/6/5
 _MAX_ADB_INTEGER = 2**53 - 1
 
+# encodes documents as python-arango does, escaping non-ASCII characters and writing NaN and
+# Infinity as is for the server to reject, so the size of the encoded document is the length of
+# the string
+_JSON_ENCODER = _json.JSONEncoder(separators=(',', ':'))
+
+# whether the python-arango internals _insert_encoded_documents depends on are available, or None
+# if not yet checked
+_ENCODED_IMPORTS = None
+
+# the number of documents to fetch per round trip when streaming documents from the database
+_STREAM_BATCH_SIZE = 10000
+# the default time, in seconds, a streaming query is kept alive between fetches
+_STREAM_TTL_SEC = 3600
+
+_STAGING_COLLECTION_PREFIX = 'delta_load_staging_'
+# fields in staged documents. The incoming document is nested so its fields can't collide with
+# the staging fields.
+_FLD_STG_ID = 'id'
+_FLD_STG_DOC = 'doc'
+_FLD_STG_COLLECTION = 'collection'
+_FLD_STG_FINGERPRINT = 'fingerprint'
+
+# The fields ignored when comparing a staged document to the extant document in the database.
+# Must match the fields ignored by the delta loader when comparing documents in memory.
+_STG_COMPARE_IGNORED_FIELDS = [_FLD_FULL_ID, _FLD_KEY, _FLD_TO, _FLD_FROM, _FLD_CREATED,
+    _FLD_EXPIRED, _FLD_RELEASE_CREATED, _FLD_RELEASE_EXPIRED, _FLD_VER_FST, _FLD_VER_LST,
+    _FLD_FINGERPRINT] + _INTERNAL_ARANGO_FIELDS
+
 class ArangoBatchTimeTravellingDBFactory:
     """
     This class allows for creating a time travelling database based on ArangoDB but delegating
@@ -56,12 +95,15 @@ class ArangoBatchTimeTravellingDBFactory:
 
     database - the python_arango ArangoDB database containing the data to query or modify.
     load_registry_collection - the name of the collection where loads will be listed.
+    retry - a batchload.retry.RetryPolicy with which to retry requests that fail transiently,
+      which is passed on to the database instances. If not provided requests are not retried.
     """
     
     # may want to make this an BatchTimeTravellingDBFactory interface, but pretty unlikely we'll switch...
 
-    def __init__(self, database, load_registry_collection):
+    def __init__(self, database, load_registry_collection, retry=None):
         self._database = database
+        self._retry = retry
         # TODO CODE could check if any loads are in progress for the namespace and bail if so
         self._registry_collection = _init_collection(database, load_registry_collection)
 
@@ -78,7 +120,8 @@ class ArangoBatchTimeTravellingDBFactory:
 
         load_namespace - the namespace of the loads to return.
         """
-        return _get_registered_loads(self._database, self._registry_collection, load_namespace)
+        return _get_registered_loads(
+            self._database, self._registry_collection, load_namespace, self._retry)
 
     def get_instance(
             self,
@@ -106,7 +149,8 @@ class ArangoBatchTimeTravellingDBFactory:
             vertex_collection,
             default_edge_collection=default_edge_collection,
             edge_collections=edge_collections,
-            merge_collection=merge_collection)
+            merge_collection=merge_collection,
+            retry=self._retry)
 
 class ArangoBatchTimeTravellingDB:
     """
@@ -122,7 +166,8 @@ class ArangoBatchTimeTravellingDB:
             vertex_collection,
             default_edge_collection=None,
             edge_collections=None,
-            merge_collection=None):
+            merge_collection=None,
+            retry=None):
         """
         Create the DB interface.
 
@@ -138,11 +183,16 @@ class ArangoBatchTimeTravellingDB:
           The collections are checked for existence and cached for performance reasons.
         merge_collection - a collection containing edges that indicate that a node has been 
           merged into another node.
+        retry - a batchload.retry.RetryPolicy with which to retry requests that fail transiently.
+          Only requests that can safely be repeated are retried: queries, updates to the load
+          registry other than registering a load, the writes of batch updaters, and expiring
+          documents without the last version. If not provided requests are not retried.
 
         Specifying an edge collection in a method argument that is not in edge_collections,
         is not the default edge collection, or is not the merge collection will result in an error.
         """
         self._database = database
+        self._retry = retry
         self._merge_collection = None
         if merge_collection:
             self._merge_collection = self._init_col(merge_collection, edge=True)
@@ -221,7 +271,8 @@ class ArangoBatchTimeTravellingDB:
             load_version,
             timestamp,
             release_timestamp,
-            current_time):
+            current_time,
+            track_last_version=True):
         """
         Register that a load is starting in the database.
 
@@ -232,6 +283,9 @@ class ArangoBatchTimeTravellingDB:
         release_timestamp - the timestamp in unix epoch milliseconds when the data was released
           at the source.
         current_time - the current time in unix epoch milliseconds.
+        track_last_version - False if the load does not update the last version of the
+          documents that are unchanged in the load. This is recorded in the registry document
+          as a track_last_version field set to false.
         """
         doc = {_FLD_KEY: load_namespace + '_' + load_version,
                _FLD_RGSTR_START_TIME: current_time,
@@ -244,6 +298,8 @@ class ArangoBatchTimeTravellingDB:
                _FLD_RGSTR_VERTEX_COLLECTION: self._vertex_collection.name,
                _FLD_RGSTR_MERGE_COLLECTION: self.get_merge_collection(),
                _FLD_RGSTR_EDGE_COLLECTIONS: sorted(list(self._edgecols.keys()))}
+        if not track_last_version:
+            doc[_FLD_RGSTR_TRACK_LAST_VERSION] = False
         
         try:
             self._database.aql.execute(
@@ -257,7 +313,8 @@ class ArangoBatchTimeTravellingDB:
 
     def register_load_complete(self, load_namespace, load_version, current_time):
         """
-        Register that a load has completed in the database.
+        Register that a load has completed in the database. Any checkpoint recorded for the load
+        is removed.
 
         load_namespace - the unique namespace of the data set, e.g. NCBI_TAXA, GENE_ONTOLOGY,
           ENVO, etc.
@@ -266,18 +323,42 @@ class ArangoBatchTimeTravellingDB:
         """
         doc = {_FLD_KEY: load_namespace + '_' + load_version,
                _FLD_RGSTR_COMPLETE_TIME: current_time,
-               _FLD_RGSTR_STATE: _FLD_RGSTR_STATE_COMPLETE}
+               _FLD_RGSTR_STATE: _FLD_RGSTR_STATE_COMPLETE,
+               _FLD_RGSTR_CHECKPOINT: None}
         
         try:
-            self._database.aql.execute(
-                f'UPDATE @d in @@col',
+            _call(self._retry, lambda: self._database.aql.execute(
+                f'UPDATE @d in @@col OPTIONS {{keepNull: false}}',
                 bind_vars={'d': doc, '@col': self._registry_collection.name}
-            )
+            ))
         except _AQLQueryExecuteError as e:
             if e.error_code == 1202:
                 raise ValueError('Load is not registered, cannot be completed')
             raise e
 
+    def register_load_checkpoint(self, load_namespace, load_version, checkpoint):
+        """
+        Record the progress of an in progress load in the database so that the load can be
+        resumed if it fails. Any prior checkpoint for the load is replaced.
+
+        load_namespace - the unique namespace of the data set, e.g. NCBI_TAXA, GENE_ONTOLOGY,
+          ENVO, etc.
+        load_version - the version of the load that is unique within the namespace.
+        checkpoint - the progress of the load as a JSON serializable dict.
+        """
+        doc = {_FLD_KEY: load_namespace + '_' + load_version,
+               _FLD_RGSTR_CHECKPOINT: checkpoint}
+
+        try:
+            _call(self._retry, lambda: self._database.aql.execute(
+                f'UPDATE @d in @@col OPTIONS {{mergeObjects: false}}',
+                bind_vars={'d': doc, '@col': self._registry_collection.name}
+            ))
+        except _AQLQueryExecuteError as e:
+            if e.error_code == 1202:
+                raise ValueError('Load is not registered, cannot record a checkpoint')
+            raise e
+
     def register_load_rollback(self, load_namespace, load_version):
         """
         Register that a load is in the process of being rolled back.
@@ -290,10 +371,10 @@ class ArangoBatchTimeTravellingDB:
                _FLD_RGSTR_STATE: _FLD_RGSTR_STATE_ROLLBACK}
         
         try:
-            self._database.aql.execute(
+            _call(self._retry, lambda: self._database.aql.execute(
                 f'UPDATE @d in @@col',
                 bind_vars={'d': doc, '@col': self._registry_collection.name}
-            )
+            ))
         # could combine some of this code with the above method... meh
         except _AQLQueryExecuteError as e:
             if e.error_code == 1202:
@@ -307,7 +388,8 @@ class ArangoBatchTimeTravellingDB:
 
         load_namespace - the namespace of the loads to return.
         """
-        return _get_registered_loads(self._database, self._registry_collection, load_namespace)
+        return _get_registered_loads(
+            self._database, self._registry_collection, load_namespace, self._retry)
 
     def delete_registered_load(self, load_namespace, load_version):
         """
@@ -346,7 +428,7 @@ class ArangoBatchTimeTravellingDB:
         # for some reason is None works, just a check doesn't
         return None if self._merge_collection is None else self._merge_collection.name
 
-    def get_vertices(self, ids, timestamp):
+    def get_vertices(self, ids, timestamp, fields=None):
         """
         Get vertices that exist at the given timestamp from a collection.
 
@@ -354,37 +436,44 @@ class ArangoBatchTimeTravellingDB:
 
         ids - the IDs of the vertices to get.
         timestamp - the time at which the vertices must exist in Unix epoch milliseconds.
+        fields - the fields to return for each vertex. If not provided, all fields other than
+          internal ArangoDB fields are returned. The id field is always returned.
 
         Returns a dict of vertex ID -> vertex. Missing vertices are not included and do not
           cause an error.
         """
         col_name = self._vertex_collection.name
-        return self._get_documents(ids, timestamp, col_name)
+        return self._get_documents(ids, timestamp, col_name, fields)
 
-    def _get_documents(self, ids, timestamp, collection_name):
+    def _get_documents(self, ids, timestamp, collection_name, fields=None):
         id_idx = self._id_indexes[collection_name]
-        cur = self._database.aql.execute(
-          f"""
+        bind_vars = {'ids': ids, 'timestamp': timestamp, '@col': collection_name, 'id_idx': id_idx}
+        ret = _get_projection(fields, bind_vars)
+        query = f"""
           FOR d IN @@col
               OPTIONS {{indexHint: @id_idx, forceIndexHint: true}}
               FILTER d.{_FLD_ID} IN @ids
               FILTER d.{_FLD_EXPIRED} >= @timestamp AND d.{_FLD_CREATED} <= @timestamp
-              RETURN d
-          """,
-          bind_vars={'ids': ids, 'timestamp': timestamp, '@col': collection_name, 'id_idx': id_idx}
-        )
+              RETURN {ret}
+          """
+        # the results may take more than one round trip, so they're fetched again on retry
+        return _call(self._retry,
+            lambda: self._fetch_documents(query, bind_vars, timestamp, collection_name))
+
+    def _fetch_documents(self, query, bind_vars, timestamp, collection_name):
+        cur = self._database.aql.execute(query, bind_vars=bind_vars)
         ret = {}
         try:
             for d in cur:
                 if d[_FLD_ID] in ret:
                     raise ValueError(f'db contains > 1 document for id {d[_FLD_ID]}, ' +
                         f'timestamp {timestamp}, collection {collection_name}')
-                ret[d[_FLD_ID]] = _clean(d)
+                ret[d[_FLD_ID]] = d
         finally:
             cur.close(ignore_missing=True)
         return ret
 
-    def get_edges(self, ids, timestamp, edge_collection=None):
+    def get_edges(self, ids, timestamp, edge_collection=None, fields=None):
         """
         Get edges that exist at the given timestamp from a collection.
 
@@ -394,12 +483,168 @@ class ArangoBatchTimeTravellingDB:
         timestamp - the time at which the edges must exist in Unix epoch milliseconds.
         edge_collection - the collection name to query. If none is provided, the default will
           be used.
+        fields - the fields to return for each edge. If not provided, all fields other than
+          internal ArangoDB fields are returned. The id field is always returned.
 
         Returns a dict of edge ID -> edge. Missing edges are not included and do not
           cause an error.
         """
         col_name = self._get_edge_collection(edge_collection).name
-        return self._get_documents(ids, timestamp, col_name)
+        return self._get_documents(ids, timestamp, col_name, fields)
+
+    def get_extant_documents(
+            self,
+            collection,
+            timestamp,
+            fields=None,
+            numeric_ids=False,
+            ttl=_STREAM_TTL_SEC):
+        """
+        Iterate over all the documents in a collection that exist at the given timestamp,
+        sorted by ID. The documents are streamed from the database, and so the database doesn't
+        need to hold the entire result set in memory.
+
+        collection - the name of the collection to query.
+        timestamp - the time at which the documents must exist in Unix epoch milliseconds.
+        fields - the fields to return for each document. If not provided, all fields other than
+          internal ArangoDB fields are returned. The id field is always returned.
+        numeric_ids - True to sort the documents by the numeric value of their IDs rather than
+          the string value. The IDs must be non-negative integers without leading zeros, which
+          sort by their length and then by their string value, so the documents with IDs of each
+          length are streamed in turn in ID index order, and the database doesn't need to sort
+          the collection. This costs one pass over the ID index to find the length of the
+          longest ID and then one pass per ID length, e.g. 8 passes for IDs of up to 7 digits,
+          rather than the single pass needed for string order.
+        ttl - the maximum time in seconds that may elapse between fetching documents before the
+          database discards the query.
+
+        Returns a generator of documents.
+        """
+        col = self._get_collection(collection) # ensure collection exists
+        if not numeric_ids:
+            yield from self._stream_extant_documents(col, timestamp, fields, ttl)
+            return
+        max_length = _call(self._retry, lambda: self._get_max_extant_id_length(col, timestamp))
+        for length in range(1, max_length + 1):
+            yield from self._stream_extant_documents(col, timestamp, fields, ttl, length)
+
+    def _stream_extant_documents(self, col, timestamp, fields, ttl, id_length=None):
+        # the id index is sorted by id, so the database doesn't need to sort the results
+        bind_vars = {'timestamp': timestamp, '@col': col.name, 'id_idx': self._id_indexes[col.name]}
+        ret = _get_projection(fields, bind_vars)
+        length_filter = ''
+        if id_length:
+            bind_vars['id_length'] = id_length
+            length_filter = f'FILTER LENGTH(d.{_FLD_ID}) == @id_length'
+        # only the first request is retried, as a streaming query can't be restarted part way
+        cur = _call(self._retry, lambda: self._database.aql.execute(
+          f"""
+          FOR d IN @@col
+              OPTIONS {{indexHint: @id_idx, forceIndexHint: true}}
+              FILTER d.{_FLD_EXPIRED} >= @timestamp AND d.{_FLD_CREATED} <= @timestamp
+              {length_filter}
+              SORT d.{_FLD_ID}
+              RETURN {ret}
+          """,
+          bind_vars=bind_vars,
+          batch_size=_STREAM_BATCH_SIZE,
+          ttl=ttl,
+          stream=True
+        ))
+        try:
+            for d in cur:
+                yield d
+        finally:
+            cur.close(ignore_missing=True)
+
+    def _get_max_extant_id_length(self, col, timestamp):
+        cur = self._database.aql.execute(
+          f"""
+          FOR d IN @@col
+              OPTIONS {{indexHint: @id_idx, forceIndexHint: true}}
+              FILTER d.{_FLD_EXPIRED} >= @timestamp AND d.{_FLD_CREATED} <= @timestamp
+              COLLECT AGGREGATE max_length = MAX(LENGTH(d.{_FLD_ID}))
+              RETURN max_length
+          """,
+          bind_vars={'timestamp': timestamp, '@col': col.name,
+              'id_idx': self._id_indexes[col.name]}
+        )
+        try:
+            # the maximum is null if there are no documents
+            return next(cur, None) or 0
+        finally:
+            cur.close(ignore_missing=True)
+
+    def count_extant_documents(self, collection, timestamp):
+        """
+        Count the documents in a collection that exist at the given timestamp.
+
+        collection - the name of the collection to query.
+        timestamp - the time at which the documents must exist in Unix epoch milliseconds.
+
+        Returns the number of documents.
+        """
+        col = self._get_collection(collection) # ensure collection exists
+        return _call(self._retry, lambda: self._count_extant_documents(col, timestamp))
+
+    def _count_extant_documents(self, col, timestamp):
+        cur = self._database.aql.execute(
+          f"""
+          FOR d IN @@col
+              FILTER d.{_FLD_EXPIRED} >= @timestamp AND d.{_FLD_CREATED} <= @timestamp
+              COLLECT WITH COUNT INTO count
+              RETURN count
+          """,
+          bind_vars={'timestamp': timestamp, '@col': col.name}
+        )
+        try:
+            return next(cur)
+        finally:
+            cur.close(ignore_missing=True)
+
+    def get_extant_documents_without_last_version(
+            self,
+            collection,
+            timestamp,
+            version,
+            fields=None,
+            ttl=_STREAM_TTL_SEC):
+        """
+        Iterate over the documents in a collection that exist at the given timestamp where the
+        last version field is not equal to the given version. The documents are streamed from
+        the database in no particular order.
+
+        collection - the name of the collection to query.
+        timestamp - the time at which the documents must exist in Unix epoch milliseconds.
+        version - the version the last version field must not equal.
+        fields - the fields to return for each document. If not provided, all fields other than
+          internal ArangoDB fields are returned. The id field is always returned.
+        ttl - the maximum time in seconds that may elapse between fetching documents before the
+          database discards the query.
+
+        Returns a generator of documents.
+        """
+        col = self._get_collection(collection) # ensure collection exists
+        bind_vars = {'timestamp': timestamp, 'version': version, '@col': col.name}
+        ret = _get_projection(fields, bind_vars)
+        # only the first request is retried, as a streaming query can't be restarted part way
+        cur = _call(self._retry, lambda: self._database.aql.execute(
+          f"""
+          FOR d IN @@col
+              FILTER d.{_FLD_EXPIRED} >= @timestamp AND d.{_FLD_CREATED} <= @timestamp
+              FILTER d.{_FLD_VER_LST} != @version
+              RETURN {ret}
+          """,
+          bind_vars=bind_vars,
+          batch_size=_STREAM_BATCH_SIZE,
+          ttl=ttl,
+          stream=True
+        ))
+        try:
+            for d in cur:
+                yield d
+        finally:
+            cur.close(ignore_missing=True)
 
     # may need to separate timestamp into find and expire timestamps, but YAGNI for now
     def expire_extant_vertices_without_last_version(self, timestamp, release_timestamp, version):
@@ -412,9 +657,11 @@ class ArangoBatchTimeTravellingDB:
         release_timestamp - the timestamp to use as the expiration date at the data source
           in Unix epoch milliseconds.
         version - the version required for the last version field for a vertex to avoid expiration.
+
+        Returns the number of expired vertices.
         """
         col = self._vertex_collection
-        self._expire_extant_document_without_last_version(
+        return self._expire_extant_document_without_last_version(
             timestamp, release_timestamp, version, col)
 
     # may need to separate timestamp into find and expire timestamps, but YAGNI for now
@@ -435,9 +682,11 @@ class ArangoBatchTimeTravellingDB:
         version - the version required for the last version field for a edges to avoid expiration.
         edge_collection - the collection name to query. If none is provided, the default will
           be used.
+
+        Returns the number of expired edges.
         """
         col = self._get_edge_collection(edge_collection)
-        self._expire_extant_document_without_last_version(
+        return self._expire_extant_document_without_last_version(
             timestamp, release_timestamp, version, col)
     
     def _expire_extant_document_without_last_version(
@@ -446,7 +695,7 @@ class ArangoBatchTimeTravellingDB:
             release_timestamp,
             version,
             col):
-        self._database.aql.execute(
+        return self._execute_update(
             f"""
             FOR d IN @@col
                 FILTER d.{_FLD_EXPIRED} >= @timestamp && d.{_FLD_CREATED} <= @timestamp
@@ -459,50 +708,70 @@ class ArangoBatchTimeTravellingDB:
                 'timestamp': timestamp,
                 'reltimestamp': release_timestamp,
                 '@col': col.name},
+            # documents expired by a failed attempt still match, and are expired again with
+            # the same timestamps
+            idempotent=True,
         )
 
     # TODO PERF could add created index to speed this up
-    def delete_created_documents(self, collection, creation_time):
+    def delete_created_documents(
+            self, collection, creation_time, batch_size=None, before_batch=None):
         """
         Deletes any documents in the collection that were created at the given time.
 
         collection - the collection to modify.
         creation_time - the time of creation, in unix epoch milliseconds, of the documents to
           delete.
+        batch_size - if provided, the keys of the documents to delete are streamed from the
+          database and the documents are deleted batch_size documents at a time rather than in
+          a single query.
+        before_batch - a function that is called with the list of keys in each batch before the
+          batch is deleted. Only called if batch_size is provided.
+
+        Returns the number of deleted documents.
         """
         col = self._get_collection(collection) # ensure collection exists
-        self._database.aql.execute(
-            f"""
-            FOR d IN @@col
-                FILTER d.{_FLD_CREATED} == @timestamp
-                REMOVE d IN @@col
-            """,
-            bind_vars={'timestamp': creation_time, '@col': col.name},
-        )
-
-    def undo_expire_documents(self, collection, expire_time):
+        return self._update_matching(
+            col,
+            f'd.{_FLD_CREATED} == @timestamp',
+            {'timestamp': creation_time},
+            'REMOVE d IN @@col',
+            {},
+            batch_size,
+            before_batch)
+
+    def undo_expire_documents(self, collection, expire_time, batch_size=None, before_batch=None):
         """
         Unexpires any documents that were expired at the given time.
 
         collection - the collection to modify
         expire_time - the time of expiration, in unix epoch milliseconds, of the documents to
           un-expire.
+        batch_size - if provided, update the documents in batches as for
+          delete_created_documents().
+        before_batch - a function that is called with the list of keys in each batch before the
+          batch is updated.
+
+        Returns the number of un-expired documents.
         """
         col = self._get_collection(collection) # ensure collection exists
-        self._database.aql.execute(
+        return self._update_matching(
+            col,
+            f'd.{_FLD_EXPIRED} == @timestamp',
+            {'timestamp': expire_time},
             f"""
-            FOR d IN @@col
-                FILTER d.{_FLD_EXPIRED} == @timestamp
-                UPDATE d WITH {{
-                    {_FLD_EXPIRED}: {_MAX_ADB_INTEGER},
-                    {_FLD_RELEASE_EXPIRED}: {_MAX_ADB_INTEGER}
-                }} IN @@col
+            UPDATE d WITH {{
+                {_FLD_EXPIRED}: {_MAX_ADB_INTEGER},
+                {_FLD_RELEASE_EXPIRED}: {_MAX_ADB_INTEGER}
+            }} IN @@col
             """,
-            bind_vars={'timestamp': expire_time, '@col': col.name},
-        )
+            {},
+            batch_size,
+            before_batch)
 
     # TODO PERF could add last_version index to speed this up
-    def reset_last_version(self, collection, last_version, new_last_version):
+    def reset_last_version(
+            self, collection, last_version, new_last_version, batch_size=None, before_batch=None):
         """
         Updates documents from one last version to another. Only documents with the given last
         version are affected.
@@ -510,19 +779,285 @@ class ArangoBatchTimeTravellingDB:
         collection - the collection to modify
         last_version - any documents with this last_version will be modified.
         new_last_version - the documents will be modified to this last version.
+        batch_size - if provided, update the documents in batches as for
+          delete_created_documents().
+        before_batch - a function that is called with the list of keys in each batch before the
+          batch is updated.
+
+        Returns the number of modified documents.
         """
         col = self._get_collection(collection) # ensure collection exists
-        self._database.aql.execute(
+        return self._update_matching(
+            col,
+            f'd.{_FLD_VER_LST} == @last_version',
+            {'last_version': last_version},
+            f'UPDATE d WITH {{{_FLD_VER_LST}: @new_last}} IN @@col',
+            {'new_last': new_last_version},
+            batch_size,
+            before_batch)
+
+    def _update_matching(
+            self,
+            col,
+            filter_,
+            filter_vars,
+            update,
+            update_vars,
+            batch_size=None,
+            before_batch=None,
+            ttl=_STREAM_TTL_SEC):
+        """
+        Modify the documents in a collection that match a filter and return the number of
+        modified documents.
+
+        filter_ - an AQL expression that matches the documents to modify, where d is the document.
+        filter_vars - the bind variables for the filter.
+        update - an AQL modification operation on d in @@col, where d is the document or, if
+          batch_size is provided, the document key.
+        update_vars - the bind variables for the update.
+        """
+        if not batch_size:
+            return self._execute_update(
+                f"""
+                FOR d IN @@col
+                    FILTER {filter_}
+                    {update}
+                """,
+                bind_vars=dict(filter_vars, **update_vars, **{'@col': col.name}),
+            )
+        cur = _call(self._retry, lambda: self._database.aql.execute(
             f"""
             FOR d IN @@col
-                FILTER d.{_FLD_VER_LST} == @last_version
-                UPDATE d WITH {{{_FLD_VER_LST}: @new_last}} IN @@col
+                FILTER {filter_}
+                RETURN d.{_FLD_KEY}
             """,
-            bind_vars={
-                'last_version': last_version,
-                'new_last': new_last_version,
-                '@col': col.name},
+            bind_vars=dict(filter_vars, **{'@col': col.name}),
+            batch_size=_STREAM_BATCH_SIZE,
+            ttl=ttl,
+            stream=True
+        ))
+        count = 0
+        try:
+            while True:
+                keys = list(_itertools.islice(cur, batch_size))
+                if not keys:
+                    return count
+                if before_batch:
+                    before_batch(keys)
+                count += self._execute_update(
+                    f"""
+                    FOR d IN @keys
+                        {update}
+                    """,
+                    bind_vars=dict(update_vars, keys=keys, **{'@col': col.name}),
+                )
+        finally:
+            cur.close(ignore_missing=True)
+
+    def create_staging_collection(self):
+        """
+        Create a temporary collection with a unique name in which to stage incoming vertices or
+        edges so that the delta between the incoming and extant documents can be calculated in
+        the database. The caller is responsible for dropping the collection with
+        drop_staging_collection().
+
+        Returns the name of the staging collection.
+        """
+        name = _STAGING_COLLECTION_PREFIX + _uuid.uuid4().hex
+        self._database.create_collection(name)
+        return name
+
+    def drop_staging_collection(self, staging_collection):
+        """
+        Drop a staging collection. Does nothing if the collection does not exist.
+
+        staging_collection - the name of the staging collection.
+        """
+        self._database.delete_collection(staging_collection, ignore_missing=True)
+
+    def stage_vertices(self, staging_collection, vertices):
+        """
+        Add vertices to a staging collection.
+
+        staging_collection - the name of the staging collection.
+        vertices - a list of tuples of the vertex as a dict, which must contain an id field, and
+          a hash of the vertex contents or None.
+        """
+        self._database.collection(staging_collection).import_bulk(
+            [_create_staged_document(v, fp) for v, fp in vertices], on_duplicate='error')
+
+    def stage_edges(self, staging_collection, edges):
+        """
+        Add edges to a staging collection.
+
+        staging_collection - the name of the staging collection.
+        edges - a list of tuples of the edge as a dict, which must contain id, from, and to
+          fields, a hash of the edge contents or None, and the name of the edge collection in
+          which the edge is to be saved. If the collection name is None the default edge
+          collection is used.
+        """
+        docs = []
+        for e, fp, col in edges:
+            doc = _create_staged_document(e, fp)
+            doc[_FLD_STG_COLLECTION] = self._get_edge_collection(col).name
+            docs.append(doc)
+        self._database.collection(staging_collection).import_bulk(docs, on_duplicate='error')
+
+    def apply_staged_vertices(self, staging_collection, timestamp, release_timestamp, version):
+        """
+        Apply the delta between the vertices in a staging collection and the vertices that exist
+        at the given timestamp in the vertex collection:
+
+        * Extant vertices that are unchanged have their last version set to the given version.
+        * Extant vertices that have changed are expired at timestamp - 1 and release_timestamp - 1.
+        * New versions of the changed vertices are created, along with vertices that do not yet
+          exist.
+
+        Vertices that are not staged are not touched.
+
+        staging_collection - the name of the staging collection containing the vertices.
+        timestamp - the time at which the new vertices begin to exist in Unix epoch milliseconds.
+        release_timestamp - the time at which the new vertices were released at the data source
+          in Unix epoch milliseconds.
+        version - the version of the load.
+
+        Returns a tuple of the number of vertices created, expired, and with an updated last
+        version.
+        """
+        return self._apply_staged_documents(
+            staging_collection, self._vertex_collection, timestamp, release_timestamp, version)
+
+    def apply_staged_edges(
+            self,
+            staging_collection,
+            timestamp,
+            release_timestamp,
+            version,
+            edge_collection=None):
+        """
+        Apply the delta between the edges in a staging collection that are destined for an edge
+        collection and the edges that exist at the given timestamp in that collection. The delta
+        is applied in the same way as apply_staged_vertices(), except that edges are also
+        considered to have changed if the vertices at either end of the edge have changed.
+
+        The vertices must be up to date in the database at the given timestamp.
+
+        staging_collection - the name of the staging collection containing the edges.
+        timestamp - the time at which the new edges begin to exist in Unix epoch milliseconds.
+        release_timestamp - the time at which the new edges were released at the data source
+          in Unix epoch milliseconds.
+        version - the version of the load.
+        edge_collection - the collection name to update. If none is provided, the default will
+          be used.
+
+        Returns a tuple of the number of edges created, expired, and with an updated last
+        version.
+        """
+        col = self._get_edge_collection(edge_collection)
+        return self._apply_staged_documents(
+            staging_collection, col, timestamp, release_timestamp, version, edge=True)
+
+    def _apply_staged_documents(
+            self,
+            staging_collection,
+            col,
+            timestamp,
+            release_timestamp,
+            version,
+            edge=False):
+        bind_vars = {'@stage': staging_collection, 'timestamp': timestamp}
+        edge_lookup = ''
+        if edge:
+            vcol = self._vertex_collection
+            edge_lookup = _get_staged_edge_lookup(
+                bind_vars, col, vcol, self._id_indexes[vcol.name])
+            self._check_staged_edge_vertices(edge_lookup, bind_vars, col.name, timestamp)
+        bind_vars.update({'@col': col.name, 'id_idx': self._id_indexes[col.name]})
+        # find the extant document for each staged document
+        query = f"""
+            FOR s IN @@stage
+                {edge_lookup}
+                LET d = FIRST(
+                    FOR x IN @@col
+                        OPTIONS {{indexHint: @id_idx, forceIndexHint: true}}
+                        FILTER x.{_FLD_ID} == s.{_FLD_STG_ID}
+                        FILTER x.{_FLD_EXPIRED} >= @timestamp AND x.{_FLD_CREATED} <= @timestamp
+                        RETURN x
+                )
+            """
+        # Arango doesn't allow modifying the same collection more than once per query, so
+        # unchanged documents are marked as seen first, which then distinguishes the changed
+        # documents. Expiring the changed documents then leaves the documents to be created
+        # without an extant document.
+        unchanged = self._execute_update(
+            f"""
+            {query}
+                FILTER d != null
+                FILTER {_get_staged_unchanged_expression(edge)}
+                UPDATE d WITH {{{_FLD_VER_LST}: @version}} IN @@col
+            """,
+            dict(bind_vars, version=version, ignored=_STG_COMPARE_IGNORED_FIELDS),
         )
+        expired = self._execute_update(
+            f"""
+            {query}
+                FILTER d != null
+                FILTER d.{_FLD_VER_LST} != @version
+                UPDATE d WITH {{{_FLD_EXPIRED}: @expired, {_FLD_RELEASE_EXPIRED}: @relexpired}}
+                    IN @@col
+            """,
+            dict(bind_vars, version=version, expired=timestamp - 1,
+                relexpired=release_timestamp - 1),
+        )
+        created = self._execute_update(
+            f"""
+            {query}
+                FILTER d == null
+                INSERT MERGE(s.{_FLD_STG_DOC}, {_get_staged_create_expression(edge)}) IN @@col
+            """,
+            dict(bind_vars, version=version, reltimestamp=release_timestamp),
+        )
+        return created, expired, unchanged
+
+    def _check_staged_edge_vertices(self, edge_lookup, bind_vars, collection_name, timestamp):
+        missing = _call(self._retry, lambda: self._find_staged_edge_without_vertices(
+            edge_lookup, bind_vars))
+        if missing:
+            raise ValueError(f'Edge {missing[0]} in collection {collection_name} has a vertex ' +
+                f'that does not exist at timestamp {timestamp}')
+
+    def _find_staged_edge_without_vertices(self, edge_lookup, bind_vars):
+        cur = self._database.aql.execute(
+            f"""
+            FOR s IN @@stage
+                {edge_lookup}
+                FILTER f == null OR t == null
+                LIMIT 1
+                RETURN s.{_FLD_STG_ID}
+            """,
+            bind_vars=bind_vars,
+        )
+        try:
+            return list(cur)
+        finally:
+            cur.close(ignore_missing=True)
+
+    def _execute_update(self, query, bind_vars, idempotent=False):
+        """
+        Execute an AQL query that modifies documents and return the number of modified documents.
+
+        idempotent - True if the query modifies the same documents in the same way when it is
+          repeated after it has been applied, in which case it's retried if it fails
+          transiently. Otherwise a repeated query would modify fewer or other documents and
+          return the wrong count, if the failed attempt was applied.
+        """
+        def execute():
+            cur = self._database.aql.execute(query, bind_vars=bind_vars)
+            try:
+                return cur.statistics()['modified']
+            finally:
+                cur.close(ignore_missing=True)
+        return _call(self._retry, execute) if idempotent else execute()
 
     def _get_collection(self, collection):
         if self._vertex_collection.name == collection:
@@ -547,23 +1082,56 @@ class ArangoBatchTimeTravellingDB:
             raise ValueError(f'Edge collection {collection} was not registered at initialization')
         return self._edgecols[collection]
 
-    def get_batch_updater(self, edge_collection_name=None):
+    def get_batch_updater(
+            self,
+            edge_collection_name=None,
+            track_last_version=True,
+            flush_size=None,
+            flush_bytes=None,
+            before_flush=None,
+            executor=None,
+            ignore_duplicates=False):
         """
         Get a batch updater for a collection. Updates can be added to the updater and then
         applied at once.
 
         edge_collection_name - the name of the edge collection that will be updated. If not
           provided the vertex collection is used.
-
-        Returns a BatchUpdater.
+        track_last_version - False to count the documents passed to the updater's
+          set_last_version methods as unchanged without updating them.
+        flush_size - if provided, get an AutoFlushingBatchUpdater that writes its pending
+          updates on a background thread once there are this many.
+        flush_bytes - if provided, get an AutoFlushingBatchUpdater that writes its pending
+          updates on a background thread once their approximate size reaches this many bytes.
+        before_flush - for an AutoFlushingBatchUpdater, a function to call before each write.
+        executor - for an AutoFlushingBatchUpdater, the executor on which to write the updates.
+          If not provided, the updater starts its own thread.
+        ignore_duplicates - True to skip created documents that already exist rather than
+          failing the write, e.g. when repeating a write that may have been applied.
+
+        Returns a BatchUpdater, which must be closed once it's no longer needed.
         """
         if not edge_collection_name:
-            return BatchUpdater(self._vertex_collection, False)
-        return BatchUpdater(self._get_edge_collection(edge_collection_name), True)
+            col, edge = self._vertex_collection, False
+        else:
+            col, edge = self._get_edge_collection(edge_collection_name), True
+        if flush_size or flush_bytes:
+            return AutoFlushingBatchUpdater(self._database, col, edge, track_last_version,
+                flush_size, flush_bytes, before_flush=before_flush, retry=self._retry,
+                executor=executor, ignore_duplicates=ignore_duplicates)
+        return BatchUpdater(self._database, col, edge, track_last_version, self._retry,
+            ignore_duplicates)
 
 class BatchUpdater:
 
-    def __init__(self, collection, edge=False):
+    def __init__(
+            self,
+            database,
+            collection,
+            edge=False,
+            track_last_version=True,
+            retry=None,
+            ignore_duplicates=False):
         """
         Do not create this class directly - call ArangoBatchTimeTravellingDB.get_batch_updater().
 
@@ -571,16 +1139,49 @@ class BatchUpdater:
 
         Create a batch updater.
 
+        database - the python-arango database containing the collection.
         collection - the python-arango collection where updates will be applied.
         edge - True if the collection is an edge collection. Checking this property requires
           an http call, and so providing the type is required.
+        track_last_version - False to count the documents passed to the set_last_version methods
+          as having an updated last version without updating them.
+        retry - a batchload.retry.RetryPolicy with which to retry writes that fail transiently.
+        ignore_duplicates - True to skip created documents that already exist rather than
+          failing the write.
 
         Properties:
         is_edge - True if the updater will update against an edge collection, false otherwise.
+        auto_flush - True if the updater writes its updates as they're added rather than when
+          it's applied.
         """
+        self._database = database
         self._col = collection
         self.is_edge = edge
-        self._updates = []
+        self.auto_flush = False
+        self._track_last_version = track_last_version
+        self._retry = retry
+        self._on_duplicate = 'ignore' if ignore_duplicates else 'error'
+        # the updates are written through two channels. New documents are inserted with an
+        # import that fails if a document already exists, which saves the database merging each
+        # one into an existing document. They are serialized to JSON as they're added, so
+        # they're sent without another copy of the documents and their size is known without
+        # serializing them.
+        self._inserts = []
+        # Changes to existing documents are patched by key. Setting the last version and
+        # expiring documents only changes a few fields to values shared by most of the
+        # documents in a batch, so this maps the fields to update, as a tuple of (field, value)
+        # pairs, to the keys of the documents to update, and each set of keys is updated with
+        # a single query.
+        self._key_updates = {}
+        self._created = 0
+        self._expired = 0
+        self._last_versions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def get_collection(self):
         """
@@ -588,7 +1189,7 @@ class BatchUpdater:
         """
         return self._col.name
 
-    def create_vertex(self, id_, version, created_time, release_time, data):
+    def create_vertex(self, id_, version, created_time, release_time, data, fingerprint=None):
         """
         Save a vertex in the database.
 
@@ -605,12 +1206,15 @@ class BatchUpdater:
         release_time - the time at which the vertex was released at the data source in Unix epoch
           milliseconds.
         data - the vertex contents as a dict.
+        fingerprint - a hash of the vertex contents, if any, to store in the vertex's fingerprint
+          field.
 
         Returns the key for the vertex.
         """
         self._ensure_vertex()
-        vert = _create_vertex(data, id_, version, created_time, release_time)
-        self._updates.append(vert)
+        vert = _create_vertex(data, id_, version, created_time, release_time, fingerprint)
+        self._insert(vert)
+        self._created += 1
         return vert[_FLD_KEY]
 
     def create_edge(
@@ -621,7 +1225,8 @@ class BatchUpdater:
             version,
             created_time,
             release_time,
-            data=None):
+            data=None,
+            fingerprint=None):
         """
         Save an edge in the database.
 
@@ -641,41 +1246,57 @@ class BatchUpdater:
         release_time - the time at which the edge was released at the data source in Unix epoch
           milliseconds.
         data - the edge contents as a dict.
+        fingerprint - a hash of the edge contents, if any, to store in the edge's fingerprint
+          field.
 
         Returns the key for the edge.
         """
         self._ensure_edge()
-        edge = _create_edge(id_, from_vertex, to_vertex, version, created_time, release_time, data)
-        self._updates.append(edge)
+        edge = _create_edge(
+            id_, from_vertex, to_vertex, version, created_time, release_time, data, fingerprint)
+        self._insert(edge)
+        self._created += 1
         return edge[_FLD_KEY]
 
     def set_last_version_on_vertex(self, key, last_version):
         """
         Set the last version field on a vertex.
 
-        key - the key of the vertex.
+        key - the key of the vertex, or None if the updater doesn't track the last version, in
+          which case the vertex is only counted.
         last_version - the version to set.
         """
         self._ensure_vertex()
-        self._updates.append({_FLD_KEY: key, _FLD_VER_LST: last_version})
+        self._set_last_version(key, last_version)
 
     def set_last_version_on_edge(self, edge, last_version):
         """
         Set the last version field on an edge.
 
-        edge - the edge to update. This must have been fetched from the database.
+        edge - the edge to update. This must have been fetched from the database. May be None
+          if the updater doesn't track the last version, in which case the edge is only counted.
         last_version - the version to set.
         """
-        self._update_edge(edge, {_FLD_VER_LST: last_version})
-    
-    def _update_edge(self, edge, update):
         self._ensure_edge()
-        update[_FLD_KEY] = edge[_FLD_KEY]
-        # this is really lame. Arango requires the _to and _from edges even when the
-        # document you're updating already has them.
-        update[_FLD_FROM] = edge[_FLD_FROM]
-        update[_FLD_TO] = edge[_FLD_TO]
-        self._updates.append(update)
+        self._set_last_version(edge[_FLD_KEY] if edge else None, last_version)
+
+    def _set_last_version(self, key, last_version):
+        if self._track_last_version:
+            if not key:
+                raise ValueError('A document is required to update its last version')
+            self._add_key_update(key, ((_FLD_VER_LST, last_version),))
+        self._last_versions += 1
+
+    def _expire(self, key, expiration_time, release_expiration_time):
+        self._expired += 1
+        self._add_key_update(key,
+            ((_FLD_EXPIRED, expiration_time), (_FLD_RELEASE_EXPIRED, release_expiration_time)))
+
+    def _insert(self, doc):
+        self._inserts.append(_encode_document(doc))
+
+    def _add_key_update(self, key, update):
+        self._key_updates.setdefault(update, []).append(key)
 
     def expire_vertex(self, key, expiration_time, release_expiration_time):
         """
@@ -688,10 +1309,7 @@ class BatchUpdater:
           expired at the data source.
         """
         self._ensure_vertex()
-        self._updates.append({
-            _FLD_KEY: key,
-            _FLD_EXPIRED: expiration_time,
-            _FLD_RELEASE_EXPIRED: release_expiration_time})
+        self._expire(key, expiration_time, release_expiration_time)
 
     def expire_edge(self, edge, expiration_time, release_expiration_time):
         """
@@ -703,22 +1321,56 @@ class BatchUpdater:
         release_expiration_time - the time, in Unix epoch milliseconds, when the edge was expired
           at the data source.
         """
-        self._update_edge(edge, {
-            _FLD_EXPIRED: expiration_time,
-            _FLD_RELEASE_EXPIRED: release_expiration_time})
+        self._ensure_edge()
+        self._expire(edge[_FLD_KEY], expiration_time, release_expiration_time)
 
     def update(self):
         """
         Apply the updates collected so far and clear the update list.
         """
-        self._col.import_bulk(self._updates, on_duplicate="update")
-        self._updates.clear()
+        self._write(self._inserts, self._key_updates)
+        self._inserts.clear()
+        self._key_updates.clear()
+        self._created = self._expired = self._last_versions = 0
+
+    def close(self):
+        """
+        Release any resources held by the updater. The updater may be used as a context manager
+        to close it.
+        """
+        pass
 
     def count(self):
         """
         Get the number of pending updates.
         """
-        return len(self._updates)
+        return len(self._inserts) + sum(len(k) for k in self._key_updates.values())
+
+    def count_by_type(self):
+        """
+        Get the number of pending updates by the type of the update.
+
+        Returns a tuple of the number of documents created, the number of documents expired, and
+        the number of documents with an updated last version.
+        """
+        return self._created, self._expired, self._last_versions
+
+    def payload_size(self):
+        """
+        Get the approximate size, in bytes, of the pending updates when serialized to JSON.
+        """
+        return sum(self.payload_sizes())
+
+    def payload_sizes(self):
+        """
+        Get the approximate sizes, in bytes, of the pending updates when serialized to JSON by
+        the channel they are written with.
+
+        Returns a tuple of the size of the documents to be imported and the size of the keys
+        sent to update queries.
+        """
+        return (sum(len(d) + 1 for d in self._inserts),
+            sum(_get_key_size(k) for keys in self._key_updates.values() for k in keys))
 
     def _ensure_vertex(self):
         if self.is_edge:
@@ -728,7 +1380,284 @@ class BatchUpdater:
         if not self.is_edge:
             raise ValueError('Batch updater is configured for a vertex collection')
 
-def _create_vertex(data, id_, version, created_time, release_time):
+    def _write(self, inserts, key_updates):
+        # the key updates are written first so that if the write fails part way through, an
+        # extant document is never left alongside its new version. An expired document without
+        # its new version is treated as a new document when the load is resumed, so no document
+        # is inserted twice.
+        for update, keys in key_updates.items():
+            # setting fields to fixed values has the same effect however many times it's applied,
+            # so the update can be retried as is
+            _call(self._retry, lambda: self._update_keys(keys, update))
+        if inserts:
+            # the documents are keyed by ID and version, so if a failed import was applied the
+            # documents it inserted are identical to those to be inserted, and can be skipped.
+            # The import is all or nothing, so the replay either inserts all the documents or
+            # none of them.
+            _call(self._retry,
+                lambda: _insert_encoded_documents(self._col, inserts, self._on_duplicate),
+                lambda: _insert_encoded_documents(self._col, inserts, on_duplicate='ignore'))
+
+    def _update_keys(self, keys, update):
+        # unlike an import, the update doesn't require _from and _to for edges
+        cur = self._database.aql.execute(
+            """
+            FOR k IN @keys
+                UPDATE k WITH @update IN @@col
+            """,
+            bind_vars={'keys': keys, 'update': dict(update), '@col': self._col.name})
+        cur.close(ignore_missing=True)
+
+class AutoFlushingBatchUpdater(BatchUpdater):
+    """
+    A batch updater that writes the pending updates on a background thread whenever they reach
+    a number of documents or an approximate size in bytes, so that updates can be added while the
+    prior updates are written and the memory used by the pending updates is bounded.
+
+    update() writes any remaining updates and waits for all the writes to complete. The counts
+    and sizes returned by the updater include the updates written since update() was last
+    called. The updater's thread is kept between calls to update() and is shut down by
+    close().
+    """
+
+    def __init__(
+            self,
+            database,
+            collection,
+            edge=False,
+            track_last_version=True,
+            flush_size=None,
+            flush_bytes=None,
+            max_pending_flushes=1,
+            before_flush=None,
+            retry=None,
+            executor=None,
+            ignore_duplicates=False):
+        """
+        Do not create this class directly - call ArangoBatchTimeTravellingDB.get_batch_updater().
+
+        This class is not thread safe, although the updates are written on a separate thread.
+
+        database - the python-arango database containing the collection.
+        collection - the python-arango collection where updates will be applied.
+        edge - True if the collection is an edge collection.
+        track_last_version - False to count the documents passed to the set_last_version methods
+          as having an updated last version without updating them.
+        flush_size - write the pending updates once there are this many.
+        flush_bytes - write the pending updates once their approximate size when serialized to
+          JSON reaches this many bytes.
+        max_pending_flushes - the maximum number of writes waiting or in progress. Once reached,
+          adding an update that triggers a write blocks until the oldest write completes.
+        before_flush - a function called on the writing thread before each write with the
+          number of updates and their approximate size in bytes.
+        retry - a batchload.retry.RetryPolicy with which to retry writes that fail transiently.
+        executor - the executor on which to write the updates, e.g. an executor shared by the
+          updaters of a load. If not provided, the updater starts a thread on the first write,
+          which is kept until the updater is closed.
+        ignore_duplicates - True to skip created documents that already exist rather than
+          failing the write.
+        """
+        super().__init__(
+            database, collection, edge, track_last_version, retry, ignore_duplicates)
+        self.auto_flush = True
+        if not flush_size and not flush_bytes:
+            raise ValueError('At least one of flush_size or flush_bytes is required')
+        for name, value in [('flush_size', flush_size),
+                            ('flush_bytes', flush_bytes),
+                            ('max_pending_flushes', max_pending_flushes)]:
+            if value is not None and value <= 0:
+                raise ValueError(f'{name} must be > 0')
+        self._flush_size = flush_size
+        self._flush_bytes = flush_bytes
+        self._max_pending_flushes = max_pending_flushes
+        self._before_flush = before_flush
+        self._pending_count = 0
+        self._pending_size = 0
+        self._pending_key_size = 0
+        self._written_count = 0
+        self._written_size = 0
+        self._written_key_size = 0
+        self._executor = executor
+        # only an executor created by the updater is shut down when it's closed
+        self._owns_executor = False
+        self._flushes = _deque()
+
+    def _insert(self, doc):
+        super()._insert(doc)
+        self._added(len(self._inserts[-1]) + 1)
+
+    def _add_key_update(self, key, update):
+        super()._add_key_update(key, update)
+        size = _get_key_size(key)
+        self._pending_key_size += size
+        self._added(size)
+
+    def _added(self, size):
+        self._pending_count += 1
+        self._pending_size += size
+        if ((self._flush_size and self._pending_count >= self._flush_size) or
+                (self._flush_bytes and self._pending_size >= self._flush_bytes)):
+            self._flush()
+
+    def _flush(self):
+        inserts, key_updates = self._inserts, self._key_updates
+        count, size = self._pending_count, self._pending_size
+        self._inserts, self._key_updates = [], {}
+        self._written_count += count
+        self._written_size += size
+        self._written_key_size += self._pending_key_size
+        self._pending_count = self._pending_size = self._pending_key_size = 0
+        while len(self._flushes) >= self._max_pending_flushes:
+            # raises the write's exception, if any
+            self._flushes.popleft().result()
+        if not self._executor:
+            self._executor = _futures.ThreadPoolExecutor(1)
+            self._owns_executor = True
+        self._flushes.append(self._executor.submit(
+            self._write_flush, inserts, key_updates, count, size))
+
+    def _write_flush(self, inserts, key_updates, count, size):
+        if self._before_flush:
+            self._before_flush(count, size)
+        self._write(inserts, key_updates)
+
+    def update(self):
+        """
+        Write the pending updates, wait for all the writes to complete, and reset the update
+        counts. Raises the exception from the first failed write, if any, in which case the
+        remaining writes are cancelled if they have not started.
+        """
+        try:
+            if self._pending_count:
+                self._flush()
+            while self._flushes:
+                self._flushes[0].result()
+                self._flushes.popleft()
+        finally:
+            self._cancel_flushes()
+            self._inserts.clear()
+            self._key_updates.clear()
+            self._pending_count = self._pending_size = self._pending_key_size = 0
+            self._written_count = self._written_size = self._written_key_size = 0
+            self._created = self._expired = self._last_versions = 0
+
+    def flush(self):
+        """
+        An alias for update().
+        """
+        self.update()
+
+    def close(self):
+        """
+        Discard any updates not written by update(), cancelling the writes that have not
+        started, and shut down the updater's thread, if it started one.
+        """
+        self._cancel_flushes()
+        if self._owns_executor:
+            self._executor.shutdown()
+            self._executor = None
+            self._owns_executor = False
+
+    def _cancel_flushes(self):
+        for f in self._flushes:
+            f.cancel()
+        self._flushes.clear()
+
+    def count(self):
+        """
+        Get the number of updates added since update() was last called.
+        """
+        return self._written_count + self._pending_count
+
+    def payload_size(self):
+        """
+        Get the approximate size, in bytes, of the updates added since update() was last called
+        when serialized to JSON.
+        """
+        return self._written_size + self._pending_size
+
+    def payload_sizes(self):
+        """
+        Get the approximate sizes, in bytes, of the updates added since update() was last called
+        when serialized to JSON by the channel they are written with.
+
+        Returns a tuple of the size of the documents imported or to be imported and the size of
+        the keys sent or to be sent to update queries.
+        """
+        key_size = self._written_key_size + self._pending_key_size
+        return self.payload_size() - key_size, key_size
+
+def _call(retry, operation, replay=None):
+    """
+    Call an operation, retrying it with a batchload.retry.RetryPolicy if one is provided.
+    """
+    if retry:
+        return retry.call(operation, replay)
+    return operation()
+
+def _encode_document(doc):
+    """
+    Serialize a document to UTF-8 encoded JSON.
+    """
+    return _JSON_ENCODER.encode(doc).encode('utf-8')
+
+def _get_key_size(key):
+    # keys are limited to ASCII characters that need no escaping, and are sent as a JSON list,
+    # so each key adds its quotes and a separator
+    return len(key) + 4
+
+def _insert_encoded_documents(col, documents, on_duplicate='error'):
+    """
+    Insert new documents serialized by _encode_document into a collection. This is equivalent
+    to python-arango's import_bulk(on_duplicate='error'), which only accepts documents that it
+    then serializes itself.
+
+    Nothing is inserted if any of the documents already exists in the collection, in which case
+    a DocumentInsertError naming the conflicting key is raised. If on_duplicate is 'ignore',
+    the documents that already exist are skipped instead.
+
+    The encoded documents are sent as is with python-arango 4.x. Other versions fall back to
+    decoding the documents and passing them to import_bulk.
+    """
+    if not _encoded_imports_supported(col):
+        return col.import_bulk([_json.loads(d) for d in documents], halt_on_error=True,
+            details=True, on_duplicate=on_duplicate)
+    request = _Request(
+        method='post',
+        endpoint='/_api/import',
+        params={
+            'type': 'documents',
+            'collection': col.name,
+            'complete': True,
+            'details': True,
+            'onDuplicate': on_duplicate,
+        })
+    # strings are the only payloads the request doesn't serialize, and they're sent as latin-1,
+    # so set the UTF-8 JSON lines directly
+    request.data = b'\n'.join(documents)
+
+    def response_handler(resp):
+        if not resp.is_success:
+            raise _DocumentInsertError(resp, request)
+        return resp.body
+
+    return col._execute(request, response_handler)
+
+def _encoded_imports_supported(col):
+    # sending encoded documents depends on python-arango 4.x internals: Request only serializing
+    # data passed to its constructor, so bytes assigned to Request.data are sent as is, and
+    # collections executing requests with _execute(request, response_handler).
+    global _ENCODED_IMPORTS
+    if _ENCODED_IMPORTS is None:
+        try:
+            from arango.version import __version__ as version
+        except ImportError:
+            version = ''
+        _ENCODED_IMPORTS = (version.split('.')[0] == '4'
+            and hasattr(_Request(method='post', endpoint='/'), 'data'))
+    return _ENCODED_IMPORTS and hasattr(col, '_execute')
+
+def _create_vertex(data, id_, version, created_time, release_time, fingerprint=None):
     data = dict(data) # make a copy and overwrite the old data variable
     data[_FLD_KEY] = id_ + '_' + version
     data[_FLD_ID] = id_
@@ -738,6 +1667,8 @@ def _create_vertex(data, id_, version, created_time, release_time):
     data[_FLD_EXPIRED] = _MAX_ADB_INTEGER
     data[_FLD_RELEASE_CREATED] = release_time
     data[_FLD_RELEASE_EXPIRED] = _MAX_ADB_INTEGER
+    if fingerprint:
+        data[_FLD_FINGERPRINT] = fingerprint
 
     return data
 
@@ -748,7 +1679,8 @@ def _create_edge(
         version,
         created_time,
         release_time,
-        data):
+        data,
+        fingerprint=None):
     data = {} if not data else data
 
     data = dict(data) # make a copy and overwrite the old data variable
@@ -764,8 +1696,70 @@ def _create_edge(
     data[_FLD_EXPIRED] = _MAX_ADB_INTEGER
     data[_FLD_RELEASE_CREATED] = release_time
     data[_FLD_RELEASE_EXPIRED] = _MAX_ADB_INTEGER
+    if fingerprint:
+        data[_FLD_FINGERPRINT] = fingerprint
     return data
 
+def _create_staged_document(data, fingerprint):
+    return {_FLD_STG_ID: data[_FLD_ID], _FLD_STG_DOC: data, _FLD_STG_FINGERPRINT: fingerprint}
+
+def _get_staged_edge_lookup(bind_vars, col, vertex_col, vertex_id_idx):
+    """
+    Get the AQL that filters staged edges, s, to those destined for an edge collection and
+    looks up the full IDs of the vertices at each end of the edge as f and t.
+    """
+    bind_vars['colname'] = col.name
+    bind_vars['@vcol'] = vertex_col.name
+    bind_vars['vid_idx'] = vertex_id_idx
+    lookup = f"""FIRST(
+                    FOR v IN @@vcol
+                        OPTIONS {{indexHint: @vid_idx, forceIndexHint: true}}
+                        FILTER v.{_FLD_ID} == s.{_FLD_STG_DOC}.%s
+                        FILTER v.{_FLD_EXPIRED} >= @timestamp AND v.{_FLD_CREATED} <= @timestamp
+                        RETURN v.{_FLD_FULL_ID}
+                )"""
+    return f"""FILTER s.{_FLD_STG_COLLECTION} == @colname
+                LET f = {lookup % _FLD_FROM_ID}
+                LET t = {lookup % _FLD_TO_ID}"""
+
+def _get_staged_unchanged_expression(edge):
+    """
+    Get an AQL expression that is true if a staged document, s, is unchanged from the extant
+    document, d. The fingerprints are compared if both documents have one, and the contents of
+    the documents otherwise.
+    """
+    unchanged = f"""(s.{_FLD_STG_FINGERPRINT} && d.{_FLD_FINGERPRINT} ?
+                    s.{_FLD_STG_FINGERPRINT} == d.{_FLD_FINGERPRINT} :
+                    UNSET(s.{_FLD_STG_DOC}, @ignored) == UNSET(d, @ignored))"""
+    if edge:
+        unchanged += f' AND d.{_FLD_FROM} == f AND d.{_FLD_TO} == t'
+    return unchanged
+
+def _get_staged_create_expression(edge):
+    """
+    Get an AQL expression for the database fields of a document created from a staged
+    document, s.
+    """
+    fields = {
+        _FLD_KEY: f'CONCAT(s.{_FLD_STG_ID}, "_", @version)',
+        _FLD_ID: f's.{_FLD_STG_ID}',
+        _FLD_VER_FST: '@version',
+        _FLD_VER_LST: '@version',
+        _FLD_CREATED: '@timestamp',
+        _FLD_EXPIRED: str(_MAX_ADB_INTEGER),
+        _FLD_RELEASE_CREATED: '@reltimestamp',
+        _FLD_RELEASE_EXPIRED: str(_MAX_ADB_INTEGER),
+    }
+    if edge:
+        fields[_FLD_FROM] = 'f'
+        fields[_FLD_FROM_ID] = f's.{_FLD_STG_DOC}.{_FLD_FROM_ID}'
+        fields[_FLD_TO] = 't'
+        fields[_FLD_TO_ID] = f's.{_FLD_STG_DOC}.{_FLD_TO_ID}'
+    fields = ', '.join(f'"{k}": {v}' for k, v in fields.items())
+    # only set the fingerprint if there is one, as for documents created in memory
+    return (f'{{{fields}}}, s.{_FLD_STG_FINGERPRINT} ? ' +
+            f'{{{_FLD_FINGERPRINT}: s.{_FLD_STG_FINGERPRINT}}} : {{}}')
+
 # if an edge is inserted into a non-edge collection _from and _to are silently dropped
 def _init_collection(database, collection, edge=False):
     c = database.collection(collection)
@@ -774,6 +1768,24 @@ def _init_collection(database, collection, edge=False):
         raise ValueError(f'{collection} is not {ctype} collection')
     return c
 
+def _get_projection(fields, bind_vars):
+    """
+    Get an AQL expression for returning a document, d, with only the given fields, or all the
+    fields other than the internal ArangoDB fields if no fields are given. The id field is always
+    returned.
+
+    Projecting on the server means unneeded fields aren't sent over the wire.
+
+    fields - the fields to return, or None for all fields.
+    bind_vars - the bind variables for the query. Any variables required by the expression are
+      added.
+    """
+    if fields:
+        bind_vars['fields'] = sorted(set(fields) | {_FLD_ID})
+        return 'KEEP(d, @fields)'
+    bind_vars['internal'] = _INTERNAL_ARANGO_FIELDS
+    return 'UNSET(d, @internal)'
+
 # mutates in place!
 def _clean(obj):
     for k in _INTERNAL_ARANGO_FIELDS:
@@ -782,14 +1794,16 @@ def _clean(obj):
 
 # TODO DOCS document fields
 # probably few enough of these that indexes aren't needed
-def _get_registered_loads(database, registry_collection, load_namespace):
-    cur = database.aql.execute(
-        f"""
-        FOR d in @@col
-            FILTER d.{_FLD_RGSTR_LOAD_NAMESPACE} == @load_namespace
-            SORT d.{_FLD_RGSTR_LOAD_TIMESTAMP} DESC
-            return d
-        """,
-        bind_vars = {'load_namespace': load_namespace, '@col': registry_collection.name}
-    )
-    return [_clean(d) for d in cur]
\ No newline at end of file
+def _get_registered_loads(database, registry_collection, load_namespace, retry=None):
+    def get():
+        cur = database.aql.execute(
+            f"""
+            FOR d in @@col
+                FILTER d.{_FLD_RGSTR_LOAD_NAMESPACE} == @load_namespace
+                SORT d.{_FLD_RGSTR_LOAD_TIMESTAMP} DESC
+                return d
+            """,
+            bind_vars = {'load_namespace': load_namespace, '@col': registry_collection.name}
+        )
+        return [_clean(d) for d in cur]
+    return _call(retry, get)
\ No newline at end of file
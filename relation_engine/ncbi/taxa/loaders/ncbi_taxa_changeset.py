@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# TODO TEST
+
+import argparse
+import os
+
+from relation_engine.ncbi.taxa.parsers import NCBINodeProvider
+from relation_engine.ncbi.taxa.parsers import NCBIEdgeProvider
+from relation_engine.ncbi.taxa.parsers import NCBIMergeProvider
+from relation_engine.batchload.changeset import compute_changeset
+from relation_engine.batchload.changeset import open_changeset
+
+NAMES_IN_FILE = 'names.dmp'
+NODES_IN_FILE = 'nodes.dmp'
+MERGED_IN_FILE = 'merged.dmp'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=
+"""
+Calculate the changes between two NCBI taxonomy dumps without a database and write them to a
+changeset file, which can be applied to an ArangoDB time travelling database containing the
+older dump.
+""".strip())
+    parser.add_argument('--old-dir', required=True,
+                        help='the directory containing the unzipped dump files of the dump ' +
+                            'most recently loaded into the database')
+    parser.add_argument('--new-dir', required=True,
+                        help='the directory containing the unzipped dump files to be loaded')
+    parser.add_argument(
+        '--output',
+        required=True,
+        help='the path of the changeset file. If the path ends with .gz the file is compressed.')
+    parser.add_argument(
+        '--partitions',
+        type=int,
+        default=64,
+        help='the number of hash partitions into which to split the dumps. More partitions ' +
+            'use less memory.')
+    parser.add_argument(
+        '--temp-dir',
+        help='the directory in which to store the partitions. Defaults to the system ' +
+            'temporary directory.')
+
+    return parser.parse_args()
+
+def _nodes(dir_):
+    # the names are loaded when the provider is created, so delay creating the provider until
+    # the nodes are needed to avoid holding the names from both dumps in memory
+    with open(os.path.join(dir_, NAMES_IN_FILE)) as names, \
+            open(os.path.join(dir_, NODES_IN_FILE)) as nodes:
+        yield from NCBINodeProvider(names, nodes)
+
+def _edges(dir_):
+    with open(os.path.join(dir_, NODES_IN_FILE)) as nodes:
+        yield from NCBIEdgeProvider(nodes)
+
+def main():
+    a = parse_args()
+    with open(os.path.join(a.new_dir, MERGED_IN_FILE)) as merged, \
+            open_changeset(a.output, 'w') as out:
+        counts = compute_changeset(
+            _nodes(a.old_dir),
+            _nodes(a.new_dir),
+            _edges(a.old_dir),
+            _edges(a.new_dir),
+            out,
+            merge_source=NCBIMergeProvider(merged),
+            partitions=a.partitions,
+            temp_dir=a.temp_dir)
+    print(counts)
+
+if __name__  == '__main__':
+    main()
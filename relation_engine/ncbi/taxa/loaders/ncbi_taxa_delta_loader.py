@@ -4,6 +4,7 @@
 
 import argparse
 import getpass
+import json
 import os
 import unicodedata
 from arango import ArangoClient
@@ -13,6 +14,13 @@ from relation_engine.ncbi.taxa.parsers import NCBINodeProvider
 from relation_engine.ncbi.taxa.parsers import NCBIEdgeProvider
 from relation_engine.ncbi.taxa.parsers import NCBIMergeProvider
 from relation_engine.batchload.delta_load import load_graph_delta
+from relation_engine.batchload.load_observers import JSONLinesObserver
+from relation_engine.batchload.load_observers import PrometheusTextfileObserver
+from relation_engine.batchload.load_observers import ThroughputSummaryObserver
+from relation_engine.batchload.load_throttle import LoadThrottle
+from relation_engine.batchload.retry import DEFAULT_MAX_RETRIES
+from relation_engine.batchload.retry import RetryPolicy
+from relation_engine.batchload.retry import print_retry
 from relation_engine.batchload.time_travelling_database import ArangoBatchTimeTravellingDB
 
 _LOAD_NAMESPACE = 'ncbi_taxa'
@@ -81,6 +89,129 @@ changes between the prior load and the current load, and retaining the prior loa
         required=True,
         help='the timestamp, in unix epoch milliseconds, when the data was released ' +
             'at the source.')
+    parser.add_argument(
+        '--pipeline-depth',
+        type=int,
+        default=0,
+        help='the number of batches to look up in the database while the prior batch is ' +
+            'written. 0, the default, disables pipelining.')
+    parser.add_argument(
+        '--partitions',
+        type=int,
+        default=1,
+        help='the number of hash partitions of the node and edge IDs to load concurrently.')
+    parser.add_argument(
+        '--fingerprint',
+        action='store_true',
+        help='store a hash of the contents of each node and edge created in the load, which ' +
+            'is used to detect changes in subsequent loads.')
+    parser.add_argument(
+        '--sorted-join',
+        action='store_true',
+        help='join the nodes and edges to the prior load in a single sorted pass over the ' +
+            'database rather than looking them up batch by batch. The nodes.dmp file must be ' +
+            'sorted by taxon ID, which can be checked with ncbi_taxa_stats.py. Since taxon ' +
+            'IDs are sorted numerically, the prior load is read with one pass over the ID ' +
+            'index to find the longest taxon ID and then one pass per taxon ID length.')
+    parser.add_argument(
+        '--server-side',
+        action='store_true',
+        help='stage the nodes and edges in temporary collections and calculate the delta ' +
+            'in the database rather than in memory. Cannot be combined with --pipeline-depth ' +
+            'or --partitions.')
+    parser.add_argument(
+        '--prefilter',
+        action='store_true',
+        help='build a Bloom filter of the node and edge IDs in the database before looking up ' +
+            'the nodes and edges, so that new nodes and edges are not looked up. Useful when ' +
+            'many of the nodes and edges are new. Ignored with --sorted-join or --server-side.')
+    parser.add_argument(
+        '--incremental-expiry',
+        action='store_true',
+        help='expire the nodes and edges that are not in the load in batches, fetching only ' +
+            'those nodes and edges from the database, rather than with one update query per ' +
+            'collection. Reduces the write load when few nodes and edges are removed.')
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='calculate the delta without altering the database or registering the load, and ' +
+            'print the estimated number of documents created, expired, and unchanged and the ' +
+            'size of the updates for each collection. Cannot be combined with --server-side.')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='resume a load that failed before completion from the last checkpoint recorded ' +
+            'in the load registry. The load version, timestamps, and input files must be the ' +
+            'same as the failed load.')
+    parser.add_argument(
+        '--record-positions',
+        action='store_true',
+        help='record the position in the input files with each checkpoint, so that a resumed ' +
+            'load seeks to the last checkpoint rather than reading the files up to it. The ' +
+            'files are read more slowly. Must be set for both the failed and resumed loads.')
+    parser.add_argument(
+        '--no-track-last-version',
+        dest='track_last_version',
+        action='store_false',
+        help='do not update the last version of the nodes and edges that are unchanged in the ' +
+            'load, which saves a write per unchanged node and edge. Whether a node or edge ' +
+            'appeared in a load is then determined by whether it existed at the load timestamp. ' +
+            'The load cannot be resumed.')
+    parser.add_argument(
+        '--target-batch-latency',
+        type=float,
+        help='the time, in seconds, that looking up and writing a batch should take. If ' +
+            'specified, the batch size is adapted to the latency of the prior batches, ' +
+            'starting at the default batch size.')
+    parser.add_argument(
+        '--max-rss-mb',
+        type=int,
+        help='the maximum resident memory, in MiB, of the loader. If specified, the batch ' +
+            'size is reduced while the loader exceeds the limit.')
+    parser.add_argument(
+        '--flush-size',
+        type=int,
+        help='the number of updates after which to write the pending updates on a ' +
+            'background thread while the rest of the batch is processed. By default the ' +
+            'updates for a batch are written once the batch is processed.')
+    parser.add_argument(
+        '--flush-mb',
+        type=float,
+        help='the approximate size, in MiB, of the pending updates at which to write them on ' +
+            'a background thread while the rest of the batch is processed.')
+    parser.add_argument(
+        '--max-documents-per-second',
+        type=float,
+        help='the maximum number of nodes and edges to write to the database per second.')
+    parser.add_argument(
+        '--max-mb-per-second',
+        type=float,
+        help='the maximum amount of data, in MiB, to send to the database per second.')
+    parser.add_argument(
+        '--max-lookup-latency',
+        type=float,
+        help='the time, in seconds, above which a lookup of the nodes or edges in a batch ' +
+            'indicates that the database is busy, in which case writes are paused with ' +
+            'increasing backoff until lookups are fast again.')
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help='the maximum number of times to retry a database request that fails transiently, ' +
+            'e.g. because the connection was dropped, with increasing backoff. Only requests ' +
+            f'that can safely be repeated are retried. Default {DEFAULT_MAX_RETRIES}.')
+    parser.add_argument(
+        '--events-file',
+        help='the path to a file to which load progress events will be appended as JSON lines.')
+    parser.add_argument(
+        '--summary',
+        action='store_true',
+        help='print a summary of the throughput of each phase of the load.')
+    parser.add_argument(
+        '--prometheus-file',
+        help='the path to a file to which load metrics will be written in the Prometheus text ' +
+            'format, e.g. in the node exporter textfile collector directory. The file name ' +
+            'must end with .prom for the collector to read it.')
 
     return parser.parse_args()
 
@@ -101,20 +232,55 @@ def main():
         db = client.db(a.database, a.user, pwd, verify=True)
     else:
         db = client.db(a.database, verify=True)
+    retry = RetryPolicy(max_retries=a.max_retries, on_retry=print_retry)
     attdb = ArangoBatchTimeTravellingDB(
         db,
         a.load_registry_collection,
         a.node_collection,
         default_edge_collection=a.edge_collection,
-        merge_collection=a.merge_edge_collection)
+        merge_collection=a.merge_edge_collection,
+        retry=retry)
+
+    throttle = None
+    if a.max_documents_per_second or a.max_mb_per_second or a.max_lookup_latency:
+        throttle = LoadThrottle(
+            documents_per_second=a.max_documents_per_second,
+            bytes_per_second=a.max_mb_per_second * 1024 * 1024 if a.max_mb_per_second else None,
+            max_lookup_latency=a.max_lookup_latency)
+
+    observers = [ThroughputSummaryObserver()] if a.summary else []
+    if a.prometheus_file:
+        observers.append(PrometheusTextfileObserver(a.prometheus_file))
+    events = open(a.events_file, 'a') if a.events_file else None
+    if events:
+        observers.append(JSONLinesObserver(events))
 
-    with open(nodes) as in1, open(names) as namesfile, open(nodes) as in2, open(merged) as merge:
-        nodeprov = NCBINodeProvider(namesfile, in1)
-        edgeprov = NCBIEdgeProvider(in2)
-        merge = NCBIMergeProvider(merge)
+    try:
+        with open(nodes) as in1, open(names) as namesfile, open(nodes) as in2, \
+                open(merged) as merge:
+            nodeprov = NCBINodeProvider(namesfile, in1, sorted_by_id=a.sorted_join,
+                positioned=a.record_positions)
+            edgeprov = NCBIEdgeProvider(in2, sorted_by_id=a.sorted_join,
+                positioned=a.record_positions)
+            merge = NCBIMergeProvider(merge, positioned=a.record_positions)
 
-        load_graph_delta(_LOAD_NAMESPACE, nodeprov, edgeprov, attdb,
-            a.load_timestamp, a.release_timestamp, a.load_version, merge_source=merge)
+            report = load_graph_delta(_LOAD_NAMESPACE, nodeprov, edgeprov, attdb,
+                a.load_timestamp, a.release_timestamp, a.load_version, merge_source=merge,
+                pipeline_depth=a.pipeline_depth, partitions=a.partitions,
+                fingerprint=a.fingerprint, server_side=a.server_side, dry_run=a.dry_run,
+                resume=a.resume, prefilter=a.prefilter,
+                incremental_expiry=a.incremental_expiry,
+                track_last_version=a.track_last_version,
+                target_batch_latency=a.target_batch_latency,
+                max_rss=a.max_rss_mb * 1024 * 1024 if a.max_rss_mb else None,
+                flush_size=a.flush_size,
+                flush_bytes=int(a.flush_mb * 1024 * 1024) if a.flush_mb else None,
+                throttle=throttle, observers=observers)
+    finally:
+        if events:
+            events.close()
+    if report:
+        print(json.dumps(report, indent=4))
 
 if __name__  == '__main__':
     main()
\ No newline at end of file
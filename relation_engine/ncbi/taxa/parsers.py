@@ -8,25 +8,62 @@ import re
 import unicodedata
 from collections import defaultdict
 from relation_engine.batchload.load_utils import canonicalize
+from relation_engine.batchload.id_order import ID_ORDER_NUMERIC
 
 _SEP = r'\s\|\s?'
 _SCI_NAME = 'scientific name'
 
-class NCBINodeProvider:
+class _FileProvider:
+    """
+    The base class for providers that read a file line by line. If requested, the providers
+    report their position in the file so that a delta load can resume from a position without
+    reading the file up to that point.
+    """
+
+    def __init__(self, filehandle, positioned=False):
+        self._fh = filehandle
+        self._positioned = positioned
+
+    def _lines(self):
+        if self._positioned:
+            # iterating over the file directly disables tell(), but is faster
+            return iter(self._fh.readline, '')
+        return self._fh
+
+    def get_position(self):
+        """
+        Get the position in the file following the last line read, or None if the provider
+        doesn't report its position.
+        """
+        return self._fh.tell() if self._positioned else None
+
+    def seek(self, position):
+        """
+        Seek to a position returned by get_position(). The next iteration over the provider
+        starts at the position.
+        """
+        self._fh.seek(position)
+
+class NCBINodeProvider(_FileProvider):
     """
     NCBINodeProvider is an iterable that returns a new NCBI taxonomy node as a dict with each
     iteration.
     It requires access to the names.dmp and nodes.dmp files from a taxonomy dump.
     """
 
-    def __init__(self, names_filehandle, nodes_filehandle):
+    def __init__(self, names_filehandle, nodes_filehandle, sorted_by_id=False, positioned=False):
         """
         Create the provider.
         names_filehandle - the opened names.dmp file.
         nodes_filehandle - the opened nodes.dmp file.
+        sorted_by_id - True to declare that the nodes file is sorted by taxon ID, which allows
+          the delta loader to join the nodes to the database in a single pass.
+        positioned - True to report the position in the nodes file after each node, which
+          allows a resumed delta load to seek to its last checkpoint. Reading is slower.
         """
+        super().__init__(nodes_filehandle, positioned)
         self._names = self._load_names(names_filehandle)
-        self._node_fh = nodes_filehandle
+        self.id_order = ID_ORDER_NUMERIC if sorted_by_id else None
 
     def _load_names(self, name_file):
         # Could make this use less memory by parsing one nodes worth of entries at a time, since
@@ -39,7 +76,7 @@ class NCBINodeProvider:
         return {k: dict(name_table[k]) for k in name_table.keys()}
 
     def __iter__(self):
-        for line in self._node_fh:
+        for line in self._lines():
             record = re.split(_SEP, line)
             # should really make the ints constants but meh
             id_, rank, gencode = [record[i].strip() for i in [0,2,6]]
@@ -66,22 +103,27 @@ class NCBINodeProvider:
             
             yield node
 
-class NCBIEdgeProvider:
+class NCBIEdgeProvider(_FileProvider):
     """
     NCBIEdgeProvider is an iterable that returns a new NCBI taxonomy edge as a dict where the
     from key is the child ID and the to key the parent ID with each iteration.
     It requires access to the nodes.dmp files from a taxonomy dump.
     """
 
-    def __init__(self, nodes_filehandle):
+    def __init__(self, nodes_filehandle, sorted_by_id=False, positioned=False):
         """
         Create the provider.
         nodes_filehandle - the opened nodes.dmp file.
+        sorted_by_id - True to declare that the nodes file is sorted by taxon ID, which allows
+          the delta loader to join the edges to the database in a single pass.
+        positioned - True to report the position in the nodes file after each edge, which
+          allows a resumed delta load to seek to its last checkpoint. Reading is slower.
         """
-        self._node_fh = nodes_filehandle
+        super().__init__(nodes_filehandle, positioned)
+        self.id_order = ID_ORDER_NUMERIC if sorted_by_id else None
 
     def __iter__(self):
-        for line in self._node_fh:
+        for line in self._lines():
             record = re.split(_SEP, line)
             # should really make the ints constants but meh
             id_, parent = [record[i].strip() for i in [0,1]]
@@ -96,21 +138,23 @@ class NCBIEdgeProvider:
             }
             yield edge
 
-class NCBIMergeProvider:
+class NCBIMergeProvider(_FileProvider):
     """
     NCBIMergeProvider is an iterable that returns merged node information as a dict where the from
     key is the merged node ID and the to key the merge target node ID.
     """
 
-    def __init__(self, merges_filehandle):
+    def __init__(self, merges_filehandle, positioned=False):
         """
         Create the provider.
         merges_filehandle - the open merged.dmp file.
+        positioned - True to report the position in the merged file after each merge, which
+          allows a resumed delta load to seek to its last checkpoint. Reading is slower.
         """
-        self._merge_fh = merges_filehandle
+        super().__init__(merges_filehandle, positioned)
 
     def __iter__(self):
-        for line in self._merge_fh:
+        for line in self._lines():
             record = re.split(_SEP, line)
             merged = record[0].strip()
             edge = {
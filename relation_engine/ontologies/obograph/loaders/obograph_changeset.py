@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+# TODO TEST
+
+import argparse
+import json
+
+from relation_engine.ontologies.obograph.parsers import OBOGraphLoader
+from relation_engine.batchload.changeset import compute_changeset
+from relation_engine.batchload.changeset import open_changeset
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=
+"""
+Calculate the changes between two versions of an OBOGraph ontology file without a database and
+write them to a changeset file, which can be applied to an ArangoDB time travelling database
+containing the older version.
+""".strip())
+    parser.add_argument('--old-file', required=True,
+                        help='the OBOGraph file most recently loaded into the database')
+    parser.add_argument('--new-file', required=True, help='the OBOGraph file to be loaded')
+    parser.add_argument(
+        '--onto-id-prefix',
+        required=True,
+        help='the prefix of the ontology IDs in this load, e.g. GO, ENVO')
+    parser.add_argument(
+        '--graph-id',
+        help='the ID of the graph to load from the OBOGraph files. May be omitted if the ' +
+            'files contain only one graph.')
+    parser.add_argument(
+        '--output',
+        required=True,
+        help='the path of the changeset file. If the path ends with .gz the file is compressed.')
+    parser.add_argument(
+        '--partitions',
+        type=int,
+        default=64,
+        help='the number of hash partitions into which to split the ontologies. More ' +
+            'partitions use less memory.')
+    parser.add_argument(
+        '--temp-dir',
+        help='the directory in which to store the partitions. Defaults to the system ' +
+            'temporary directory.')
+
+    return parser.parse_args()
+
+def _load(file_, a):
+    with open(file_) as f:
+        obograph = json.loads(f.read())
+    return OBOGraphLoader(obograph, a.onto_id_prefix, graph_id=a.graph_id)
+
+def main():
+    a = parse_args()
+    old = _load(a.old_file, a)
+    new = _load(a.new_file, a)
+    with open_changeset(a.output, 'w') as out:
+        counts = compute_changeset(
+            old.get_node_provider(),
+            new.get_node_provider(),
+            old.get_edge_provider(),
+            new.get_edge_provider(),
+            out,
+            merge_source=new.get_merge_provider(),
+            partitions=a.partitions,
+            temp_dir=a.temp_dir)
+    print(counts)
+
+if __name__  == '__main__':
+    main()